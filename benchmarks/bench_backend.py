@@ -0,0 +1,98 @@
+""" Compare the XML backends, lxml and the standard library, on a large catalog.
+
+    python -m benchmarks.bench_backend --count 5000
+"""
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from benchmarks.synthetic import write_catalog
+
+PHASES = ('parse', 'index', 'merge', 'serialize')
+
+
+def run_once(catalog: Path, update: Path, repeat: int) -> dict:
+    """ Time each phase of a merge, with the backend of the current process. """
+    from qgis_plugin_repo import xml_backend
+    from qgis_plugin_repo.catalog import PluginIndex
+    from qgis_plugin_repo.merger import Merger
+
+    timings = {phase: [] for phase in PHASES}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tree = xml_backend.parse(catalog)
+        timings['parse'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        PluginIndex(tree.getroot())
+        timings['index'].append(time.perf_counter() - start)
+
+        merger = Merger(str(update), str(catalog))
+        start = time.perf_counter()
+        merger.merge_input(merger.input_uri, merger.input_parser)
+        timings['merge'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        merger.serialize()
+        timings['serialize'].append(time.perf_counter() - start)
+
+    return {'backend': xml_backend.BACKEND, **{phase: min(values) for phase, values in timings.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=5000, help="Number of plugins in the catalog")
+    parser.add_argument("--changed", type=int, default=50, help="Number of plugins in the update")
+    parser.add_argument("--repeat", type=int, default=3, help="Best time out of this number of runs")
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_once(Path(args.worker[0]), Path(args.worker[1]), args.repeat)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = write_catalog(Path(directory, 'plugins.xml'), args.count)
+        update = write_catalog(Path(directory, 'update.xml'), args.changed, version='2.0.0')
+
+        results = []
+        for backend in ('stdlib', 'lxml'):
+            env = dict(os.environ, QGIS_PLUGIN_REPO_XML_BACKEND=backend)
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_backend', '--repeat', str(args.repeat),
+                 '--worker', str(catalog), str(update)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output.splitlines()[-1]))
+
+    print(f"Catalog with {args.count} plugins, update with {args.changed} plugins, best of {args.repeat}")
+    print(f"{'backend':<10}" + ''.join(f"{phase:>12}" for phase in PHASES) + f"{'total':>12}")
+    totals = {}
+    for result in results:
+        totals[result['backend']] = sum(result[phase] for phase in PHASES)
+        print(
+            f"{result['backend']:<10}"
+            + ''.join(f"{result[phase] * 1000:>10.1f}ms" for phase in PHASES)
+            + f"{totals[result['backend']] * 1000:>10.1f}ms")
+
+    if 'lxml' in totals:
+        print(f"Speedup with lxml : {totals['stdlib'] / totals['lxml']:.2f}x")
+    else:
+        print("lxml is not installed, only the standard library has been measured")
+
+
+if __name__ == "__main__":
+    main()
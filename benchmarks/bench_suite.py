@@ -0,0 +1,287 @@
+""" Time and memory of the main operations, on synthetic catalogs of different sizes.
+
+    python -m benchmarks.bench_suite
+    python -m benchmarks.bench_suite --sizes 100 1000 --compare
+    python -m benchmarks.bench_suite --save-baseline
+
+Remote inputs are served by a local HTTP server, it runs offline. The peak memory is the one measured by
+tracemalloc, allocations done by lxml itself are not counted. With --compare, times are compared relative to
+the merge scenario of the same size, the baseline does not need to be measured on the same host.
+"""
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.local_server import LocalServer
+from benchmarks.synthetic import catalog_xml, plugin_xml, write_catalog
+from qgis_plugin_repo import fetch, xml_backend
+from qgis_plugin_repo.dispatcher import Dispatcher, dispatch
+from qgis_plugin_repo.merger import Merger
+from qgis_plugin_repo.reader import iter_plugins
+from qgis_plugin_repo.sidecar import Sidecar
+
+SIZES = (100, 1000, 10000, 50000)
+# Times are compared relative to this scenario
+REFERENCE = 'merge'
+BASELINE = Path(__file__).parent / 'baseline.json'
+# Even minor versions, one XML file per version
+QGIS_VERSIONS = tuple(f'3.{minor}' for minor in range(0, 30, 4))
+
+
+class Workspace:
+
+    """ Synthetic files for a given catalog size. """
+
+    def __init__(self, directory: Path, size: int, changed: int, inputs: int):
+        """ Constructor, all files are written in the directory. """
+        self.directory = directory
+        self.catalog = write_catalog(directory / 'plugins.xml', size)
+        self.update = write_catalog(directory / 'update.xml', changed, version='2.0.0')
+
+        # Single plugin inputs, as produced by qgis-plugin-ci for each release
+        self.inputs = []
+        for index in range(inputs):
+            path = directory / f'input_{index}.xml'
+            path.write_text(
+                '<plugins>\n' + plugin_xml(index * (size // max(inputs, 1)), False, '2.0.0') + '</plugins>\n',
+                encoding='utf8')
+            self.inputs.append(path)
+
+        # Per version files share the same catalog, with a different seed
+        self.versions = []
+        for seed, version in enumerate(QGIS_VERSIONS):
+            path = directory / f'plugins-{version}.xml'
+            path.write_text(catalog_xml(size, seed=seed), encoding='utf8')
+            self.versions.append(path)
+
+        self.root = xml_backend.parse(self.catalog).getroot()
+
+    def destination(self) -> str:
+        """ A fresh copy of the catalog, to be edited. """
+        path = self.directory / 'destination.xml'
+        shutil.copy(self.catalog, path)
+        return str(path)
+
+    def version_files(self) -> List[str]:
+        """ Fresh copies of the per version files, to be edited. """
+        outputs = []
+        for path in self.versions:
+            output = self.directory / 'outputs' / path.name
+            output.parent.mkdir(exist_ok=True)
+            shutil.copy(path, output)
+            outputs.append(str(output))
+        return outputs
+
+
+def scenarios(workspace: Workspace, server: LocalServer) -> Dict[str, Callable[[], Callable[[], object]]]:
+    """ Benchmarked operations.
+
+    Each scenario is a setup function, returning the function to measure, so copies of files are not timed.
+    """
+    update_url = server.url(workspace.update.name)
+    catalog_url = server.url(workspace.catalog.name)
+
+    def read():
+        return lambda: sum(1 for _ in iter_plugins(str(workspace.catalog)))
+
+    def read_url():
+        fetch.configure(cache=None)
+        return lambda: sum(1 for _ in iter_plugins(catalog_url))
+
+    def plugins():
+        return lambda: Merger.plugins(workspace.root)
+
+    def merge():
+        destination = workspace.destination()
+        return lambda: Merger(str(workspace.update), destination).merge()
+
+    def splice_merge():
+        destination = workspace.destination()
+        return lambda: Merger(str(workspace.update), destination, splice=True).merge()
+
+    def splice():
+        # The destination is already parsed and scanned, like in the server, only the merge is measured
+        merger = Merger(str(workspace.update), workspace.destination(), splice=True)
+        return merger.merge
+
+    def sidecar_merge():
+        # The sidecar index is up to date, plugins are changed so the destination is parsed and written
+        destination = workspace.destination()
+        Sidecar.load(Path(destination))
+        return lambda: Merger(str(workspace.update), destination, splice=True, sidecar=True).merge()
+
+    def merge_url():
+        fetch.configure(cache=None)
+        destination = workspace.destination()
+        return lambda: Merger(update_url, destination).merge()
+
+    def batch_merge():
+        destination = workspace.destination()
+        return lambda: Merger([str(path) for path in workspace.inputs], destination).merge()
+
+    def route():
+        roots = [Merger.read_input(str(path)) for path in workspace.inputs]
+        return lambda: [
+            Dispatcher(uri, workspace.versions, root).xml_files_for_plugin() for uri, root in roots]
+
+    def dispatch_all():
+        outputs = workspace.version_files()
+        return lambda: dispatch([str(path) for path in workspace.inputs], outputs)
+
+    return {
+        'read': read,
+        'read_url': read_url,
+        'plugins': plugins,
+        'merge': merge,
+        'splice_merge': splice_merge,
+        'splice': splice,
+        'sidecar_merge': sidecar_merge,
+        'merge_url': merge_url,
+        'batch_merge': batch_merge,
+        'route': route,
+        'dispatch': dispatch_all,
+    }
+
+
+def measure(setup: Callable[[], Callable[[], object]], repeat: int) -> dict:
+    """ Best wall time out of many runs, then the peak memory of a single run. """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            function = setup()
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+        # Tracing slows down the run, memory is measured separately
+        function = setup()
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {'time': min(times), 'peak': peak}
+
+
+def run(sizes: List[int], repeat: int, changed: int, inputs: int, selected: List[str]) -> Dict[str, dict]:
+    """ Run all scenarios for all sizes, results are keyed by "size/scenario". """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            size_directory = Path(directory, str(size))
+            size_directory.mkdir()
+            workspace = Workspace(size_directory, size, min(changed, size), inputs)
+            with LocalServer(size_directory) as server:
+                for name, setup in scenarios(workspace, server).items():
+                    if selected and name not in selected:
+                        continue
+                    result = measure(setup, repeat)
+                    results[f'{size}/{name}'] = result
+                    print(
+                        f"{size:>8} {name:<14}"
+                        f"{result['time'] * 1000:>12.1f}ms{result['peak'] / 1024:>12.0f}KiB")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """ Results slower or bigger than the baseline, more than the tolerance factor.
+
+    Times are compared relative to the time of the merge scenario of the same size, so the baseline can be
+    measured on another host. The peak memory does not depend on the host, it is compared as is.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference:
+            continue
+        size = key.split('/')[0]
+        measured = {'time': relative_time(results, key), 'peak': result['peak']}
+        expected = {'time': relative_time(baseline, key), 'peak': reference['peak']}
+        for metric in ('time', 'peak'):
+            if not expected[metric] or measured[metric] is None:
+                continue
+            if measured[metric] > expected[metric] * tolerance:
+                unit = f"x {size}/{REFERENCE}" if metric == 'time' else "bytes"
+                regressions.append(
+                    f"{key} {metric} : {measured[metric]:.4g} instead of {expected[metric]:.4g} {unit}, "
+                    f"{measured[metric] / expected[metric]:.2f}x")
+    return regressions
+
+
+def relative_time(results: Dict[str, dict], key: str) -> Optional[float]:
+    """ Time of a result divided by the time of the reference scenario of the same size. """
+    reference = results.get(f"{key.split('/')[0]}/{REFERENCE}")
+    if not reference or not reference['time']:
+        return None
+    return results[key]['time'] / reference['time']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs='+', default=list(SIZES), help="Number of plugins")
+    parser.add_argument("--scenario", nargs='+', default=[], help="Only run these scenarios")
+    parser.add_argument("--repeat", type=int, default=3, help="Best time out of this number of runs")
+    parser.add_argument("--changed", type=int, default=50, help="Number of plugins in the update")
+    parser.add_argument("--inputs", type=int, default=20, help="Number of single plugin inputs")
+    parser.add_argument("--output", help="Write results in this JSON file")
+    parser.add_argument("--baseline", default=str(BASELINE), help="The baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare results with the baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.5, help="Factor above the baseline considered as a regression")
+    args = parser.parse_args()
+
+    scenarios_run = list(args.scenario)
+    if args.compare and scenarios_run and REFERENCE not in scenarios_run:
+        # Times are compared relative to the reference
+        scenarios_run.append(REFERENCE)
+
+    print(f"Backend {xml_backend.BACKEND}, best of {args.repeat}")
+    print(f"{'size':>8} {'scenario':<14}{'time':>14}{'peak':>15}")
+    results = run(args.sizes, args.repeat, args.changed, args.inputs, scenarios_run)
+
+    content = json.dumps({'backend': xml_backend.BACKEND, 'results': results}, indent=2) + '\n'
+    if args.output:
+        Path(args.output).write_text(content, encoding='utf8')
+
+    if args.save_baseline:
+        baseline = {'backend': xml_backend.BACKEND, 'results': {}}
+        if Path(args.baseline).exists():
+            baseline = json.loads(Path(args.baseline).read_text(encoding='utf8'))
+        baseline['results'].update(results)
+        Path(args.baseline).write_text(json.dumps(baseline, indent=2) + '\n', encoding='utf8')
+        print(f"Baseline saved in {args.baseline}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf8'))
+        if baseline.get('backend') != xml_backend.BACKEND:
+            print(f"The baseline has been measured with the backend {baseline.get('backend')}")
+        for key in results:
+            if key not in baseline['results']:
+                print(f"No baseline for {key}, run with --save-baseline")
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print(f"Regression {regression}")
+        if regressions:
+            exit(1)
+        print(f"No regression compared to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import threading
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    """ Serve files without logging each request, but keep the list of requested paths. """
+
+    def log_request(self, code='-', size='-'):
+        self.server.requested.append(self.path)
+        self.server.statuses.append(int(code))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+
+    """ Local HTTP server, to serve files instead of a remote repository, in tests and benchmarks. """
+
+    def __init__(self, directory: Path = Path("fixtures"), handler=QuietHandler):
+        """ Constructor. """
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), partial(handler, directory=str(directory.absolute())))
+        self.server.requested = []
+        self.server.statuses = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        """ URL of a file served by the server. """
+        return f"http://127.0.0.1:{self.server.server_port}/{path}"
+
+    @property
+    def requested(self) -> list:
+        """ Paths requested on the server. """
+        return self.server.requested
+
+    @property
+    def statuses(self) -> list:
+        """ HTTP status codes of the responses. """
+        return self.server.statuses
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,65 @@
+""" Synthetic QGIS plugin catalogs, for benchmarks. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import random
+
+from pathlib import Path
+from typing import Union
+
+PLUGIN_TEMPLATE = """\t<pyqgis_plugin name="{name}" version="{version}">
+\t\t<description>Synthetic plugin {name}, used for benchmarks</description>
+\t\t<version>{version}</version>
+\t\t<qgis_minimum_version>{qgis_minimum}</qgis_minimum_version>
+\t\t<qgis_maximum_version>{qgis_maximum}</qgis_maximum_version>
+\t\t<homepage>https://example.org/{name}</homepage>
+\t\t<file_name>{name}.{version}.zip</file_name>
+\t\t<icon>icon.png</icon>
+\t\t<author_name>Benchmark</author_name>
+\t\t<download_url>https://example.org/{name}/{name}.{version}.zip</download_url>
+\t\t<uploaded_by>Benchmark</uploaded_by>
+\t\t<create_date>2022-01-01</create_date>
+\t\t<update_date>2022-01-{day:02d}</update_date>
+\t\t<experimental>{experimental}</experimental>
+\t\t<deprecated>False</deprecated>
+\t\t<tracker>https://example.org/{name}/issues</tracker>
+\t\t<repository>https://example.org/{name}</repository>
+\t\t<tags>benchmark,synthetic</tags>
+\t</pyqgis_plugin>
+"""
+
+
+def plugin_xml(index: int, experimental: bool, version: str = '1.0.0', seed: int = 0) -> str:
+    """ A single synthetic plugin element. """
+    rng = random.Random(index * 2 + int(experimental) + seed)
+    minimum = rng.choice((0, 4, 10, 16, 22))
+    maximum = rng.choice((minimum, 22, 28, 34, 99))
+    return PLUGIN_TEMPLATE.format(
+        name=f'plugin_{index:06d}',
+        version=version,
+        qgis_minimum=f'3.{minimum}',
+        qgis_maximum=f'3.{max(minimum, maximum)}',
+        day=rng.randint(1, 28),
+        experimental=experimental,
+    )
+
+
+def catalog_xml(count: int, version: str = '1.0.0', start: int = 0, seed: int = 0) -> str:
+    """ A catalog with count plugins, roughly one plugin out of four is also published as experimental. """
+    plugins = []
+    index = start
+    while len(plugins) < count:
+        plugins.append(plugin_xml(index, False, version, seed))
+        if index % 4 == 0 and len(plugins) < count:
+            plugins.append(plugin_xml(index, True, version, seed))
+        index += 1
+    return "<?xml version = '1.0' encoding = 'UTF-8'?>\n<plugins>\n" + ''.join(plugins) + "</plugins>\n"
+
+
+def write_catalog(path: Union[str, Path], count: int, **kwargs) -> Path:
+    """ Write a synthetic catalog in a file. """
+    path = Path(path)
+    path.write_text(catalog_xml(count, **kwargs), encoding='utf8')
+    return path
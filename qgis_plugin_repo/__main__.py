@@ -1,16 +1,373 @@
 #!/usr/bin/env python3
 
 import argparse
+import cProfile
+import time
 
+from pathlib import Path
+from typing import List
+
+import requests
+
+from qgis_plugin_repo import fetch, xml_backend
 from qgis_plugin_repo.__about__ import __version__
-from qgis_plugin_repo.dispatcher import Dispatcher
-from qgis_plugin_repo.merger import Merger
+from qgis_plugin_repo.cache import (
+    DEFAULT_MAX_SIZE,
+    HttpCache,
+    default_cache_dir,
+)
+from qgis_plugin_repo.checker import (
+    DEFAULT_MAX_AGE,
+    LINKS_CACHE,
+    REPORT_FIELDS,
+    LinkCache,
+    check_catalog,
+)
+from qgis_plugin_repo.compress import ENCODINGS, available_encodings
+from qgis_plugin_repo.diff import (
+    DIFF_FORMATS,
+    diff_catalogs,
+    has_changes,
+    write_diff,
+)
+from qgis_plugin_repo.dispatcher import dispatch
+from qgis_plugin_repo.formats import FORMATS, write_records
+from qgis_plugin_repo.history import History
+from qgis_plugin_repo.merger import Merger, MergeReport
+from qgis_plugin_repo.mirror import DEFAULT_UPSTREAM, Mirror
+from qgis_plugin_repo.reader import DEFAULT_FIELDS, iter_records, name_matches
+from qgis_plugin_repo.server import (
+    DEFAULT_DEBOUNCE,
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    MergeServer,
+    MergeService,
+)
+from qgis_plugin_repo.shards import ShardStore
+from qgis_plugin_repo.sidecar import Sidecar
+from qgis_plugin_repo.spool import InvalidInputError, Spool
+from qgis_plugin_repo.timings import timings
+from qgis_plugin_repo.tools import expand_inputs, is_url
+from qgis_plugin_repo.validator import (
+    ERROR_FIELDS,
+    ValidationError,
+    validate_catalogs,
+)
+from qgis_plugin_repo.watch import Watcher
 
 __copyright__ = 'Copyright 2021, 3Liz'
 __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
 
+def read_command(args) -> int:
+    """ Read plugins available in a repository. """
+    fields = [field.strip() for value in args.field for field in value.split(',') if field.strip()]
+    fields = fields or list(DEFAULT_FIELDS)
+    if args.format == 'text':
+        print(f"List of plugins in {args.xml_file}")
+
+    sidecar = args.sidecar and not is_url(args.xml_file)
+    if sidecar and set(fields) <= set(DEFAULT_FIELDS) and not args.qgis_version:
+        # The catalog is parsed only if its sidecar index is missing or stale
+        records = (
+            {field: getattr(plugin, field) for field in fields}
+            for plugin in Sidecar.load(args.xml_file).plugins()
+            if name_matches(plugin.name, args.name)
+            and (args.experimental is None or plugin.experimental == args.experimental)
+        )
+    else:
+        # Plugins are written while the XML is downloaded and parsed
+        records = iter_records(args.xml_file, fields, args.name, args.experimental, args.qgis_version)
+    try:
+        with timings().phase('read'):
+            timings().count('plugins', write_records(records, fields, args.format))
+    except requests.exceptions.MissingSchema:
+        print(f"The input {args.xml_file} is neither a valid file nor a valid URL.")
+        exit(2)
+    return 0
+
+
+def merge_command(args) -> int:
+    """ Merge XML files in one or many repositories. """
+    if args.watch:
+        return watch_command(args)
+
+    inputs = expand_inputs([args.input_xml] + args.extra_inputs, args.manifest)
+    if not args.output_xml and not args.shards:
+        print("At least one XML file is required for the output.")
+        exit(1)
+
+    # Remote inputs are downloaded concurrently, only once for the whole run
+    urls = [uri for uri in inputs if is_url(uri)]
+    if len(urls) >= 2:
+        try:
+            with timings().phase('prefetch'):
+                fetch.fetcher().get_many(urls)
+        except requests.exceptions.MissingSchema as e:
+            print(f"One input is neither a valid file nor a valid URL : {e}")
+            exit(2)
+
+    if args.validate:
+        # Nothing is merged if one input is not valid
+        errors = validate_inputs(inputs, args.workers)
+        if errors:
+            print_errors(errors)
+            print(f"{len(errors)} error(s) in the input(s), nothing has been merged")
+            exit(1)
+
+    if args.spool:
+        return spool_command(inputs, args)
+
+    if args.shards:
+        # Only fragments of added or updated plugins are written, catalogs are built after
+        store = ShardStore(args.shards)
+        print(f"Updating fragments in {store.directory}")
+        print_summary(inputs, store.merge([Merger.read_input(input_uri) for input_uri in inputs]))
+        if args.output_xml:
+            store.build(args.output_xml, args.workers, compress=args.compress)
+        return 0
+
+    print_summary(inputs, merge_outputs(inputs, args))
+    return 0
+
+
+def watch_command(args) -> int:
+    """ Merge XML files dropped in a directory, until the process is interrupted. """
+    # With --watch, every positional argument is an XML file to edit
+    outputs = [args.input_xml] + args.output_xml
+    service = MergeService(
+        outputs, args.debounce, splice=args.splice, sidecar=args.sidecar, compress=args.compress,
+        history=args.history)
+    watcher = Watcher(args.watch, service)
+    service.start()
+    print(f"Watching {watcher.directory}, {', '.join(outputs)} will be edited")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        # Pending inputs are not lost
+        service.close()
+    return 0
+
+
+def spool_command(inputs: List[str], args) -> int:
+    """ Queue inputs in the spool directory, then merge every queued input if no other process does it. """
+    spool = Spool(args.spool)
+    for input_uri in inputs:
+        try:
+            entry = spool.put(input_uri)
+        except requests.exceptions.MissingSchema:
+            print(f"The input {input_uri} is neither a valid file nor a valid URL.")
+            exit(2)
+        except InvalidInputError as e:
+            print(e)
+            exit(1)
+        print(f"{input_uri} is queued as {entry.name}")
+
+    with timings().phase('lock'):
+        lock = spool.lock()
+        lock.acquire()
+    try:
+        entries = spool.reject_invalid(spool.entries())
+        if not entries:
+            print("The queue has already been merged by another process")
+            return 0
+
+        print(f"Merging {len(entries)} queued input(s) from {spool.directory}")
+        inputs = [str(entry) for entry in entries]
+        print_summary(inputs, merge_outputs(inputs, args))
+        spool.remove(entries)
+    finally:
+        lock.release()
+    return 0
+
+
+def merge_outputs(inputs: List[str], args) -> List[MergeReport]:
+    """ Merge inputs in the single output, or in outputs according to QGIS versions. """
+    reports = []
+    if len(args.output_xml) >= 2:
+        print(
+            "More than one XML file detected for the output. "
+            "All these files will be checked for QGIS versions :")
+        print(', '.join([f for f in args.output_xml]))
+
+        reports.extend(dispatch(
+            inputs, args.output_xml, args.workers, splice=args.splice, sidecar=args.sidecar,
+            compress=args.compress, history=args.history))
+    else:
+        print(
+            "A single XML file detected for the output. "
+            "This file is going to be edited whatever it's has a QGIS version."
+        )
+        merger = Merger(
+            inputs, args.output_xml[0], splice=args.splice, sidecar=args.sidecar, compress=args.compress,
+            history=args.history)
+        reports.extend(merger.merge())
+    return reports
+
+
+def print_summary(inputs: List[str], reports: List[MergeReport]) -> None:
+    """ Print what has been done for each input, if there are many inputs. """
+    if len(inputs) >= 2:
+        print("Summary :")
+        for report in reports:
+            added = ', '.join(f"{p.name} {p.version}" for p in report.added) or 'none'
+            updated = ', '.join(f"{p.name} {p.version}" for p in report.updated) or 'none'
+            print(
+                f"{report.input_uri} in {report.destination_uri.name} : added {added}, updated {updated}")
+
+
+def validate_inputs(inputs: List[str], workers: int) -> List[ValidationError]:
+    """ Errors of XML files, the process exits if one of them can not be read. """
+    try:
+        return validate_catalogs(inputs, workers)
+    except requests.exceptions.MissingSchema as e:
+        print(f"One input is neither a valid file nor a valid URL : {e}")
+        exit(2)
+    except requests.exceptions.RequestException as e:
+        print(f"One input could not be downloaded : {e}")
+        exit(2)
+
+
+def print_errors(errors: List[ValidationError]) -> None:
+    """ Print one line per error, with the file and the line. """
+    for error in errors:
+        plugin = f" {error.name} {error.version or ''}".rstrip() if error.name else ''
+        print(f"{error.uri}:{error.line}{plugin} : {error.problem}")
+
+
+def validate_command(args) -> int:
+    """ Validate XML files, return 1 if one of them is not valid. """
+    inputs = expand_inputs(args.xml_file)
+    errors = validate_inputs(inputs, args.workers)
+    timings().count('errors', len(errors))
+    if args.format != 'text':
+        write_records((error._asdict() for error in errors), ERROR_FIELDS, args.format)
+        return 1 if errors else 0
+
+    print_errors(errors)
+    print(f"{len(errors)} error(s) in {len(inputs)} XML file(s)")
+    return 1 if errors else 0
+
+
+def build_command(args) -> int:
+    """ Build catalogs from fragments, only if they have changed. """
+    store = ShardStore(args.shards)
+    if args.split:
+        print(f"{store.split(args.split)} fragment(s) written from {args.split}")
+    written = store.build(args.output_xml, args.workers, args.force, args.compress)
+    print(f"{len(written)} file(s) written")
+    return 0
+
+
+def check_command(args) -> int:
+    """ Check the download URL of each plugin in a repository, return 1 if one of them is not valid. """
+    cache = None if args.no_cache else LinkCache(Path(args.cache_dir) / LINKS_CACHE, args.max_age * 3600)
+    try:
+        reports = check_catalog(args.xml_file, args.workers, cache)
+    except requests.exceptions.MissingSchema:
+        print(f"The input {args.xml_file} is neither a valid file nor a valid URL.")
+        exit(2)
+
+    problems = [report for report in reports if report.problem]
+    timings().count('plugins', len(reports))
+    timings().count('problems', len(problems))
+    selected = reports if args.all else problems
+    if args.format != 'text':
+        write_records((report._asdict() for report in selected), REPORT_FIELDS, args.format)
+        return 1 if problems else 0
+
+    for report in selected:
+        flag = 'experimental' if report.experimental else 'stable'
+        line = f"{report.name} {report.version} {flag} : {report.problem or 'valid'}"
+        print(f"{line} {report.url}" if report.url else line)
+    print(f"{len(problems)} invalid link(s) on {len(reports)} plugin(s) in {args.xml_file}")
+    return 1 if problems else 0
+
+
+def diff_command(args) -> int:
+    """ Differences between two repositories, return 1 if they are different. """
+    try:
+        with timings().phase('diff'):
+            diff = diff_catalogs(args.old_xml, args.new_xml, args.sidecar)
+    except requests.exceptions.MissingSchema as e:
+        print(f"One input is neither a valid file nor a valid URL : {e}")
+        exit(2)
+
+    write_diff(diff, args.format)
+    if args.format == 'text':
+        print(
+            f"{len(diff.added)} added, {len(diff.removed)} removed, "
+            f"{len(diff.version_changed)} new version(s), {len(diff.content_changed)} content change(s)")
+    return 1 if has_changes(diff) else 0
+
+
+def mirror_command(args) -> int:
+    """ Mirror upstream repositories for QGIS versions, with plugin archives. """
+    mirror = Mirror(args.directory, args.base_url, args.upstream, args.workers, compress=args.compress)
+    try:
+        reports = mirror.sync(args.qgis_version)
+    except requests.exceptions.RequestException as e:
+        print(f"An upstream repository could not be downloaded : {e}")
+        exit(2)
+    except xml_backend.ParseError as e:
+        print(f"An upstream repository is not a valid XML file : {e}")
+        exit(2)
+
+    added = sum(len(report.added) for report in reports)
+    updated = sum(len(report.updated) for report in reports)
+    print(f"{added} plugin(s) added, {updated} updated, {len(mirror.failed)} archive(s) failed")
+    return 1 if mirror.failed else 0
+
+
+def rollback_command(args) -> int:
+    """ Restore a previous version of a plugin from the history of a repository. """
+    history = History(Path(args.output_xml).absolute())
+    if not args.plugin_version:
+        versions = history.versions(args.name, args.experimental)
+        print(f"Versions of {args.name} in the history of {args.output_xml} :")
+        for version, replaced in versions:
+            print(f"{version}, replaced on {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(replaced))}")
+        return 0
+
+    element = history.get(args.name, args.experimental, args.plugin_version)
+    if element is None:
+        flag = 'experimental' if args.experimental else 'stable'
+        print(f"The version {args.plugin_version} {flag} of {args.name} is not in the history.")
+        exit(1)
+
+    root = xml_backend.ET.Element('plugins')
+    root.append(element)
+    # The current element goes to the history too
+    merger = Merger(
+        [(history.path, root)], args.output_xml, splice=args.splice, sidecar=args.sidecar,
+        compress=args.compress, history=True)
+    merger.merge()
+    return 0
+
+
+def serve_command(args) -> int:
+    """ Merge XML files sent to an HTTP server, the repositories are kept in memory. """
+    service = MergeService(
+        args.output_xml, args.debounce, splice=args.splice, sidecar=args.sidecar, compress=args.compress,
+        history=args.history)
+    server = MergeServer(service, args.host, args.port, args.token)
+    service.start()
+    print(f"Waiting for payloads on {server.url()}, {', '.join(args.output_xml)} will be edited")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Pending inputs are not lost
+        service.close()
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -21,6 +378,21 @@ def main():
         action="version",
         version=__version__,
     )
+    parser.add_argument(
+        "--timeout", type=float, default=fetch.DEFAULT_TIMEOUT, help="Timeout in seconds for HTTP requests")
+    parser.add_argument(
+        "--retries", type=int, default=fetch.DEFAULT_RETRIES, help="Number of retries for HTTP requests")
+    parser.add_argument(
+        "--cache-dir", default=str(default_cache_dir()), help="Directory of the cache for remote XML files")
+    parser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_MAX_SIZE // 1024 // 1024,
+        help="Maximum size of the cache, in megabytes")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the cache for remote XML files")
+    parser.add_argument(
+        "--timings", nargs='?', const='-', metavar='FILE',
+        help="Write the time of each phase, fetched bytes, plugin counts and peak memory as JSON, on stderr "
+             "or in a file")
+    parser.add_argument("--profile", metavar='FILE', help="Write cProfile stats of the whole run in a file")
 
     subparsers = parser.add_subparsers(
         title="commands", description="qgis-plugin-repo-merge command", dest="command"
@@ -28,10 +400,150 @@ def main():
 
     read = subparsers.add_parser("read", help="Read plugins available in a repository")
     read.add_argument("xml_file", help="The XML file to parse")
+    read.add_argument(
+        "--sidecar", action="store_true",
+        help="Use the sidecar index next to a local XML file, it is built if it is missing or stale")
+    read.add_argument("--format", choices=FORMATS, default='text', help="Output format")
+    read.add_argument("--name", help="Only plugins with this name, it can be a glob pattern")
+    read.add_argument(
+        "--experimental", action="store_true", default=None, help="Only experimental plugins")
+    read.add_argument(
+        "--stable", action="store_false", dest="experimental", help="Only stable plugins")
+    read.add_argument("--qgis-version", help="Only plugins compatible with this QGIS version")
+    read.add_argument(
+        "--field", action="append", default=[],
+        help="Fields to write, separated by a comma, such as name,version,download_url")
 
     merge = subparsers.add_parser("merge", help="Merge two repository file")
-    merge.add_argument("input_xml", help="The XML to append")
+    merge.add_argument("input_xml", help="The XML to append, it can be a glob pattern")
     merge.add_argument("output_xml", help="The XML to edit", nargs='*')
+    merge.add_argument(
+        "-i", "--input", dest="extra_inputs", action="append", default=[],
+        help="Another XML to append in the same merge, it can be used many times")
+    merge.add_argument("--manifest", help="A file with one XML to append per line")
+    merge.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help="Number of processes to edit many XML files for QGIS versions concurrently")
+    merge.add_argument(
+        "--splice", action="store_true",
+        help="Rewrite only added or updated plugins, keep every other byte of the XML file unchanged")
+    merge.add_argument(
+        "--sidecar", action="store_true",
+        help="Use the sidecar index next to each XML file to edit, to not parse it if it is up to date")
+    merge.add_argument(
+        "--spool", metavar="DIRECTORY",
+        help="Queue inputs in this directory, the first process getting the lock merges all queued inputs")
+    merge.add_argument(
+        "--shards", metavar="DIRECTORY",
+        help="Write one fragment per plugin in this directory, then build the XML files from fragments")
+    merge.add_argument(
+        "--history", action="store_true",
+        help="Keep replaced plugins in the history next to each XML file, to restore them with rollback")
+    merge.add_argument(
+        "--validate", action="store_true",
+        help="Validate inputs first, nothing is merged if one of them is not valid")
+    merge.add_argument(
+        "--watch", metavar="DIRECTORY",
+        help="Merge XML files dropped in this directory, until interrupted, all positional XML are edited")
+    merge.add_argument(
+        "--debounce", type=float, default=DEFAULT_DEBOUNCE,
+        help="With --watch, seconds without a new XML file before an XML file is written")
+    merge.add_argument(
+        "--compress", action="append", choices=ENCODINGS, default=[],
+        help="Write a compressed copy next to each XML file written, such as plugins.xml.gz, gz and/or br")
+
+    build = subparsers.add_parser("build", help="Build XML files from fragments, only if they have changed")
+    build.add_argument("shards", help="The directory of fragments")
+    build.add_argument("output_xml", help="The XML to build, according to its QGIS version", nargs='+')
+    build.add_argument(
+        "-w", "--workers", type=int, default=1, help="Number of XML files to build concurrently")
+    build.add_argument("--force", action="store_true", help="Build XML files even if they are up to date")
+    build.add_argument("--split", metavar="XML", help="Write fragments from an existing XML file first")
+    build.add_argument(
+        "--compress", action="append", choices=ENCODINGS, default=[],
+        help="Write a compressed copy next to each XML file written, such as plugins.xml.gz, gz and/or br")
+
+    check = subparsers.add_parser("check", help="Check the download URL of each plugin in a repository")
+    check.add_argument("xml_file", help="The XML file to check, a local file or a URL")
+    check.add_argument(
+        "-w", "--workers", type=int, default=fetch.DEFAULT_WORKERS,
+        help="Number of URLs checked concurrently")
+    check.add_argument("--format", choices=FORMATS, default='text', help="Output format")
+    check.add_argument("--all", action="store_true", help="Report valid links too")
+    check.add_argument(
+        "--max-age", type=float, default=DEFAULT_MAX_AGE / 3600,
+        help="Hours during which a valid link is not checked again, it is kept in the cache directory")
+
+    diff = subparsers.add_parser("diff", help="Differences between two repositories")
+    diff.add_argument("old_xml", help="The previous XML file, a local file or a URL")
+    diff.add_argument("new_xml", help="The new XML file, a local file or a URL")
+    diff.add_argument("--format", choices=DIFF_FORMATS, default='text', help="Output format")
+    diff.add_argument(
+        "--sidecar", action="store_true",
+        help="Use the sidecar index next to local XML files, to not parse them")
+
+    mirror = subparsers.add_parser(
+        "mirror", help="Mirror upstream repositories for QGIS versions, with the plugin archives")
+    mirror.add_argument("directory", help="The directory of the mirror")
+    mirror.add_argument("base_url", help="The URL of the directory, to rewrite download URLs")
+    mirror.add_argument(
+        "-q", "--qgis-version", action="append", required=True,
+        help="A QGIS version to mirror, such as 3.28, it can be used many times")
+    mirror.add_argument(
+        "--upstream", default=DEFAULT_UPSTREAM, help="URL of the upstream repository, with {version}")
+    mirror.add_argument(
+        "-w", "--workers", type=int, default=fetch.DEFAULT_WORKERS,
+        help="Number of archives downloaded concurrently")
+    mirror.add_argument(
+        "--compress", action="append", choices=ENCODINGS, default=[],
+        help="Write a compressed copy next to each XML file written, such as plugins.xml.gz, gz and/or br")
+
+    validate = subparsers.add_parser(
+        "validate", help="Validate XML files, with required fields, versions and duplicated plugins")
+    validate.add_argument(
+        "xml_file", nargs='+',
+        help="The XML file to validate, a local file or a URL, it can be a glob pattern")
+    validate.add_argument(
+        "-w", "--workers", type=int, default=1, help="Number of processes to validate XML files concurrently")
+    validate.add_argument("--format", choices=FORMATS, default='text', help="Output format")
+
+    rollback = subparsers.add_parser(
+        "rollback", help="Restore a previous version of a plugin, from the history of a repository")
+    rollback.add_argument("output_xml", help="The XML to edit")
+    rollback.add_argument("name", help="The plugin name")
+    rollback.add_argument(
+        "plugin_version", nargs='?',
+        help="The version to restore, without it versions in the history are listed")
+    rollback.add_argument("--experimental", action="store_true", help="The experimental plugin")
+    rollback.add_argument(
+        "--splice", action="store_true",
+        help="Rewrite only the restored plugin, keep every other byte of the XML file unchanged")
+    rollback.add_argument(
+        "--sidecar", action="store_true", help="Use the sidecar index next to the XML file to edit")
+    rollback.add_argument(
+        "--compress", action="append", choices=ENCODINGS, default=[],
+        help="Write a compressed copy next to each XML file written, such as plugins.xml.gz, gz and/or br")
+
+    serve = subparsers.add_parser(
+        "serve", help="Start an HTTP server, to merge payloads {name, version, url} sent to it")
+    serve.add_argument("output_xml", help="The XML to edit", nargs='+')
+    serve.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    serve.add_argument(
+        "--debounce", type=float, default=DEFAULT_DEBOUNCE,
+        help="Seconds without a new payload before an XML file is written, payloads are merged together")
+    serve.add_argument("--token", help="Token expected in the header \"Authorization: Bearer TOKEN\"")
+    serve.add_argument(
+        "--splice", action="store_true",
+        help="Rewrite only added or updated plugins, keep every other byte of the XML file unchanged")
+    serve.add_argument(
+        "--sidecar", action="store_true", help="Use the sidecar index next to each XML file to edit")
+    serve.add_argument(
+        "--compress", action="append", choices=ENCODINGS, default=[],
+        help="Write a compressed copy next to each XML file written, such as plugins.xml.gz, gz and/or br")
+    serve.add_argument(
+        "--history", action="store_true",
+        help="Keep replaced plugins in the history next to each XML file, to restore them with rollback")
 
     args = parser.parse_args()
 
@@ -40,41 +552,56 @@ def main():
         parser.print_help()
         parser.exit()
 
+    for encoding in getattr(args, 'compress', []):
+        if encoding not in available_encodings():
+            print(f"The compression {encoding} requires the brotli package, it is not installed.")
+            exit(1)
+
     exit_val = 0
 
-    if args.command == "read":
-        merger = Merger(args.xml_file)
-        print(f"List of plugins in {args.xml_file}")
-        for plugin in merger.plugins(merger.input_parser):
-            if plugin.experimental:
-                print(f"{plugin.name} {plugin.version} experimental")
-            else:
-                print(f"{plugin.name} {plugin.version} stable")
-
-    elif args.command == "merge":
-        if len(args.output_xml) >= 2:
-            print(
-                "More than one XML file detected for the output. "
-                "All these files will be checked for QGIS versions :")
-            print(', '.join([f for f in args.output_xml]))
-            merger = Merger(args.input_xml)
-            if merger.count() >= 2:
-                print("Not possible to merge an XML file having many plugin for inputs when using [VERSION]")
-                exit(1)
-
-            dispatcher = Dispatcher(args.input_xml, args.output_xml)
-            output_files = dispatcher.xml_files_for_plugin()
-            for output_file in output_files:
-                print(f"Editing {output_file.name}")
-                merger = Merger(args.input_xml, output_file)
-                merger.merge()
-        else:
-            print(
-                "A single XML file detected for the output. "
-                "This file is going to be edited whatever it's has a QGIS version."
-            )
-            merger = Merger(args.input_xml, args.output_xml[0])
-            merger.merge()
+    cache = None
+    if not args.no_cache:
+        cache = HttpCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    fetch.configure(timeout=args.timeout, retries=args.retries, cache=cache)
+
+    profile = None
+    if args.profile:
+        profile = cProfile.Profile()
+        profile.enable()
+
+    try:
+        if args.command == "read":
+            exit_val = read_command(args)
+
+        elif args.command == "merge":
+            exit_val = merge_command(args)
+
+        elif args.command == "build":
+            exit_val = build_command(args)
+
+        elif args.command == "check":
+            exit_val = check_command(args)
+
+        elif args.command == "diff":
+            exit_val = diff_command(args)
+
+        elif args.command == "mirror":
+            exit_val = mirror_command(args)
+
+        elif args.command == "validate":
+            exit_val = validate_command(args)
+
+        elif args.command == "rollback":
+            exit_val = rollback_command(args)
+
+        elif args.command == "serve":
+            exit_val = serve_command(args)
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+        if args.timings:
+            timings().write(args.timings)
 
     return exit_val
 
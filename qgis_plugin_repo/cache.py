@@ -0,0 +1,147 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+import json
+import os
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    """ The default cache directory, in the user cache directory. """
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if cache_home:
+        return Path(cache_home).joinpath('qgis-plugin-repo')
+    return Path.home().joinpath('.cache', 'qgis-plugin-repo')
+
+
+class HttpCache:
+
+    """ Persistent cache of remote inputs, with their HTTP validators.
+
+    Each URL is stored as a body file and a JSON file with its ETag and Last-Modified headers. The cache has a
+    maximum size, the least recently used entries are removed first.
+    """
+
+    def __init__(self, directory: Optional[Path] = None, max_size: int = DEFAULT_MAX_SIZE):
+        """ Constructor, the directory is created only when a first entry is stored. """
+        self.directory = Path(directory) if directory else default_cache_dir()
+        self.max_size = max_size
+
+    def _paths(self, url: str) -> Tuple[Path, Path]:
+        """ Path of the body and of the metadata for a given URL. """
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return self.directory.joinpath(f'{key}.body'), self.directory.joinpath(f'{key}.json')
+
+    def metadata(self, url: str) -> Optional[dict]:
+        """ Metadata of the cached URL, None if the URL is not in the cache. """
+        body, meta = self._paths(url)
+        if not body.exists() or not meta.exists():
+            return None
+        try:
+            return json.loads(meta.read_text(encoding='utf8'))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def cacheable(headers: dict) -> bool:
+        """ If the response can be revalidated later, according to its headers. """
+        return bool(headers.get('ETag') or headers.get('Last-Modified'))
+
+    def validators(self, url: str) -> Dict[str, str]:
+        """ Headers to send for a conditional request. """
+        metadata = self.metadata(url)
+        if not metadata:
+            return {}
+
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        return headers
+
+    def read(self, url: str) -> bytes:
+        """ Read the cached body of the URL, it is marked as recently used. """
+        body, meta = self._paths(url)
+        os.utime(meta)
+        return body.read_bytes()
+
+    def iter_body(self, url: str, chunk_size: int) -> Iterator[bytes]:
+        """ Iterate over the cached body of the URL, it is marked as recently used. """
+        body, meta = self._paths(url)
+        os.utime(meta)
+        with open(body, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    @contextmanager
+    def writer(self, url: str, headers: dict):
+        """ Store the body of the URL, written chunk by chunk.
+
+        The entry is stored only if the block succeeds, until then the previous entry is kept.
+        """
+        body, meta = self._paths(url)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                def write(chunk: bytes):
+                    nonlocal size
+                    size += len(chunk)
+                    f.write(chunk)
+
+                yield write
+            os.replace(tmp, body)
+        except BaseException:
+            Path(tmp).unlink()
+            raise
+
+        metadata = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': size,
+        }
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            json.dump(metadata, f)
+        os.replace(tmp, meta)
+
+        self.evict()
+
+    def store(self, url: str, headers: dict, content: bytes) -> None:
+        """ Store the body of the URL. """
+        with self.writer(url, headers) as write:
+            write(content)
+
+    def evict(self) -> None:
+        """ Remove the least recently used entries, until the cache is smaller than its maximum size. """
+        entries = []
+        total = 0
+        for meta in self.directory.glob('*.json'):
+            body = meta.with_suffix('.body')
+            try:
+                size = body.stat().st_size
+                entries.append((meta.stat().st_mtime, meta, body, size))
+            except FileNotFoundError:
+                continue
+            total += size
+
+        for _, meta, body, size in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_size:
+                break
+            meta.unlink(missing_ok=True)
+            body.unlink(missing_ok=True)
+            total -= size
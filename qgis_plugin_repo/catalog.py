@@ -0,0 +1,268 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from xml.etree.ElementTree import canonicalize
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.xml_backend import ET
+
+Plugin = namedtuple('Plugin', ['name', 'experimental', 'version'])
+
+PluginKey = Tuple[str, bool]
+
+# Upper bound of a version without a patch number, 3.28 covers every 3.28.x
+ANY_PATCH = float('inf')
+
+Version = Tuple[int, int, float]
+
+
+# Child elements of <pyqgis_plugin> read in a PluginRecord, as text
+RECORD_TEXT_FIELDS = (
+    'qgis_minimum_version', 'qgis_maximum_version', 'download_url', 'file_name', 'update_date',
+)
+
+
+class PluginRecord:
+
+    """ Fields of a <pyqgis_plugin> element.
+
+    The name, the version and the experimental flag are read at once, other fields are read in a single pass
+    over the children of the element, only when one of them is used. QGIS versions have their default values
+    if they are not in the element. The element itself is kept, it is the one written in the catalog.
+    """
+
+    __slots__ = ('name', 'version', 'experimental', 'element', '_fields')
+
+    def __init__(
+            self, name: str, version: str, experimental: bool = False, qgis_minimum_version: str = '3.0',
+            qgis_maximum_version: Optional[str] = None, download_url: Optional[str] = None,
+            file_name: Optional[str] = None, update_date: Optional[str] = None,
+            element: Optional[ET.Element] = None):
+        """ Constructor, the default maximum version is the latest minor version of the major version. """
+        self.name = name
+        self.version = version
+        self.experimental = experimental
+        self.element = element
+        self._fields: Optional[Dict[str, Optional[str]]] = {
+            'qgis_minimum_version': qgis_minimum_version,
+            'qgis_maximum_version': qgis_maximum_version or f"{qgis_minimum_version.split('.')[0]}.99",
+            'download_url': download_url,
+            'file_name': file_name,
+            'update_date': update_date,
+        }
+
+    @classmethod
+    def from_element(cls, element: ET.Element) -> 'PluginRecord':
+        """ Read a <pyqgis_plugin> element, the first child is kept if a tag is repeated. """
+        record = cls.__new__(cls)
+        record.name = element.attrib['name']
+        record.version = element.attrib['version']
+        record.experimental = is_experimental(element)
+        record.element = element
+        # Read when a field is used
+        record._fields = None
+        return record
+
+    def _read_fields(self) -> Dict[str, Optional[str]]:
+        """ Other fields of the element, read once. """
+        if self._fields is None:
+            values = {}
+            for child in self.element:
+                if child.tag in RECORD_TEXT_FIELDS and child.tag not in values:
+                    values[child.tag] = (child.text or '').strip() or None
+            minimum = values.get('qgis_minimum_version') or '3.0'
+            self._fields = {
+                'qgis_minimum_version': minimum,
+                'qgis_maximum_version': values.get('qgis_maximum_version') or f"{minimum.split('.')[0]}.99",
+                'download_url': values.get('download_url'),
+                'file_name': values.get('file_name'),
+                'update_date': values.get('update_date'),
+            }
+        return self._fields
+
+    def detach(self) -> 'PluginRecord':
+        """ Read every field now, the element is not kept, for instance when it is cleared by a reader. """
+        self._read_fields()
+        self.element = None
+        return self
+
+    @property
+    def qgis_minimum_version(self) -> str:
+        return self._read_fields()['qgis_minimum_version']
+
+    @property
+    def qgis_maximum_version(self) -> str:
+        return self._read_fields()['qgis_maximum_version']
+
+    @property
+    def download_url(self) -> Optional[str]:
+        return self._read_fields()['download_url']
+
+    @property
+    def file_name(self) -> Optional[str]:
+        return self._read_fields()['file_name']
+
+    @property
+    def update_date(self) -> Optional[str]:
+        return self._read_fields()['update_date']
+
+    @property
+    def key(self) -> PluginKey:
+        """ Key of the plugin in a catalog, its name and its experimental flag. """
+        return self.name, self.experimental
+
+    @property
+    def plugin(self) -> Plugin:
+        """ The plugin tuple. """
+        return Plugin(self.name, self.experimental, self.version)
+
+    @property
+    def qgis_versions(self) -> Tuple[str, str]:
+        """ Minimum and maximum QGIS versions. """
+        return self.qgis_minimum_version, self.qgis_maximum_version
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PluginRecord):
+            return NotImplemented
+        return self.plugin == other.plugin and self._read_fields() == other._read_fields()
+
+    def __repr__(self) -> str:
+        return f'PluginRecord({self.name!r}, {self.version!r}, experimental={self.experimental})'
+
+
+def is_experimental(element: ET.Element) -> bool:
+    """ Return the experimental flag of a plugin element, False if not set. """
+    for child in element:
+        if child.tag == "experimental":
+            return child.text == 'True'
+    return False
+
+
+def plugin_from_element(element: ET.Element) -> Plugin:
+    """ Build the plugin tuple from a <pyqgis_plugin> element. """
+    return Plugin(element.attrib['name'], is_experimental(element), element.attrib['version'])
+
+
+def parse_version(version: str, upper: bool = False) -> Version:
+    """ Parse a QGIS version X, X.Y or X.Y.Z.
+
+    Without a patch number, the version is the first patch, or the last one as an upper bound.
+    """
+    numbers = [int(number) for number in version.strip().split('.')[:3]]
+    numbers += [0] * (2 - len(numbers))
+    if len(numbers) == 2:
+        numbers.append(ANY_PATCH if upper else 0)
+    return numbers[0], numbers[1], numbers[2]
+
+
+def versions_for_element(element: ET.Element) -> Tuple[str, str]:
+    """ Return the minimum and maximum QGIS version of a plugin element.
+
+    Default values are 3.0 and the latest minor version of the major version of the minimum.
+    """
+    return PluginRecord.from_element(element).qgis_versions
+
+
+def element_hash(element: ET.Element) -> str:
+    """ Fingerprint of the content of a plugin element.
+
+    The element is canonicalized first, the indentation, the attributes order or a CDATA section do not change
+    the fingerprint.
+    """
+    canonical = canonicalize(xml_backend.tostring(element, encoding='unicode'), strip_text=True)
+    return hashlib.sha1(canonical.encode('utf8')).hexdigest()
+
+
+class PluginIndex:
+
+    """ Hash index of a catalog, by plugin name and experimental flag.
+
+    The index is built in a single pass over the root element and it is kept up to date when elements
+    are appended or replaced through it, so lookups do not need to walk the XML tree again.
+    """
+
+    def __init__(self, parser: ET.Element):
+        """ Constructor. """
+        self.parser = parser
+        self._entries: Dict[PluginKey, Tuple[PluginRecord, int]] = {}
+        # Content fingerprints, computed only when needed
+        self._hashes: Dict[PluginKey, str] = {}
+        # Number of elements in the catalog, len() is not in constant time with lxml
+        self._size = 0
+        for i, element in enumerate(parser):
+            record = PluginRecord.from_element(element)
+            # Keep the first element, as a walk over the tree would have done
+            self._entries.setdefault(record.key, (record, i))
+            self._size = i + 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Plugin]:
+        return (record.plugin for record, _ in self._entries.values())
+
+    def __contains__(self, plugin: Plugin) -> bool:
+        """ If the exact plugin, including its version, is in the index. """
+        entry = self._entries.get((plugin.name, plugin.experimental))
+        return entry is not None and entry[0].version == plugin.version
+
+    def plugins(self) -> List[Plugin]:
+        """ List of plugins in the index. """
+        return list(self)
+
+    def records(self) -> List[PluginRecord]:
+        """ List of plugin records in the index. """
+        return [record for record, _ in self._entries.values()]
+
+    def record(self, name: str, experimental: bool) -> Optional[PluginRecord]:
+        """ Return the record for a given plugin name and its experimental flag. """
+        entry = self._entries.get((name, experimental))
+        return entry[0] if entry else None
+
+    def get(self, name: str, experimental: bool) -> Tuple[Optional[ET.Element], Optional[int]]:
+        """ Return the XML element and its position for a given plugin name and its experimental flag. """
+        entry = self._entries.get((name, experimental))
+        if entry is None:
+            return None, None
+        return entry[0].element, entry[1]
+
+    def content_hash(self, name: str, experimental: bool) -> Optional[str]:
+        """ Fingerprint of the content of the plugin, None if the plugin is not in the index. """
+        key = (name, experimental)
+        if key not in self._hashes:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._hashes[key] = element_hash(entry[0].element)
+        return self._hashes[key]
+
+    def is_unchanged(self, element: Union[ET.Element, PluginRecord]) -> bool:
+        """ If the index has a plugin with the same key and exactly the same content. """
+        record = element if isinstance(element, PluginRecord) else PluginRecord.from_element(element)
+        if record.plugin not in self:
+            # Not the same version, no need to compare the content
+            return False
+        return self.content_hash(*record.key) == element_hash(record.element)
+
+    def append(self, element: ET.Element) -> None:
+        """ Append a new plugin element at the end of the catalog. """
+        record = PluginRecord.from_element(element)
+        self.parser.append(element)
+        self._entries[record.key] = (record, self._size)
+        self._size += 1
+        self._hashes.pop(record.key, None)
+
+    def replace(self, element: ET.Element) -> None:
+        """ Replace the content of the existing element having the same key, at the same position. """
+        record = PluginRecord.from_element(element)
+        previous, index = self._entries[record.key]
+        xml_backend.replace_element(previous.element, element)
+        # The element in the catalog is still the previous one, with the new content
+        record.element = previous.element
+        self._entries[record.key] = (record, index)
+        self._hashes.pop(record.key, None)
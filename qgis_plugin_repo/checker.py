@@ -0,0 +1,189 @@
+""" Check the download URL of each plugin in a catalog. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import json
+import threading
+import time
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import requests
+
+from qgis_plugin_repo.catalog import PluginRecord
+from qgis_plugin_repo.fetch import DEFAULT_WORKERS, fetcher
+from qgis_plugin_repo.reader import iter_elements
+from qgis_plugin_repo.timings import timings
+from qgis_plugin_repo.tools import atomic_write
+
+# Seconds during which a valid link is not checked again
+DEFAULT_MAX_AGE = 24 * 3600
+LINKS_CACHE = 'links.json'
+
+# Content types of a ZIP archive, the generic binary type is used by GitHub releases
+ARCHIVE_CONTENT_TYPES = (
+    'application/zip',
+    'application/x-zip-compressed',
+    'application/x-zip',
+    'application/octet-stream',
+)
+
+# HEAD is not allowed by some servers, a GET of a single byte is sent instead
+HEAD_NOT_SUPPORTED = (403, 405, 501)
+
+LinkStatus = namedtuple('LinkStatus', ['url', 'status', 'size', 'content_type', 'error'])
+LinkReport = namedtuple(
+    'LinkReport', ['name', 'version', 'experimental', 'url', 'status', 'size', 'content_type', 'problem'])
+
+REPORT_FIELDS = list(LinkReport._fields)
+
+
+class LinkCache:
+
+    """ Responses of the last checks, by URL, in a JSON file.
+
+    Valid links are not checked again before their maximum age. Dead links are always checked again.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_age: float = DEFAULT_MAX_AGE):
+        """ Constructor, without a path nothing is kept between runs. """
+        self.path = Path(path) if path else None
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if self.path:
+            try:
+                self.entries = json.loads(self.path.read_text(encoding='utf8'))
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, url: str) -> Optional[dict]:
+        """ The last response of the URL, if it is recent enough. """
+        entry = self.entries.get(url)
+        if not entry or entry['error'] or time.time() - entry['checked_at'] > self.max_age:
+            return None
+        return entry
+
+    def previous_size(self, url: str) -> Optional[int]:
+        """ Size of the archive when the URL has been checked the last time, whatever its age. """
+        entry = self.entries.get(url)
+        return entry['size'] if entry else None
+
+    def store(self, link: LinkStatus) -> None:
+        """ Keep the response of the URL. """
+        with self._lock:
+            self.entries[link.url] = dict(link._asdict(), checked_at=time.time())
+
+    def save(self) -> None:
+        """ Write the cache file. """
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps(self.entries, indent=1, sort_keys=True).encode('utf8'))
+
+
+def _size(response: requests.Response) -> Optional[int]:
+    """ Size of the archive, from a response to HEAD or to a GET of a range. """
+    content_range = response.headers.get('Content-Range')
+    if response.status_code == 206 and content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def _content_type(response: requests.Response) -> Optional[str]:
+    """ Media type of the response, without its parameters. """
+    content_type = response.headers.get('Content-Type')
+    return content_type.split(';')[0].strip().lower() if content_type else None
+
+
+def check_url(url: str) -> LinkStatus:
+    """ Send HEAD to the URL, or a GET of the first byte if HEAD is not supported by the server. """
+    session = fetcher().session
+    timeout = fetcher().timeout
+    try:
+        with timings().phase('check'):
+            response = session.head(url, allow_redirects=True, timeout=timeout)
+            if response.status_code in HEAD_NOT_SUPPORTED:
+                with session.get(
+                        url, headers={'Range': 'bytes=0-0'}, stream=True, allow_redirects=True,
+                        timeout=timeout) as response:
+                    pass
+    except requests.exceptions.RequestException as e:
+        # The name of the exception only, messages of connection errors are very long
+        return LinkStatus(url, None, None, None, e.__class__.__name__)
+
+    error = None if response.ok else f'HTTP {response.status_code}'
+    return LinkStatus(url, response.status_code, _size(response), _content_type(response), error)
+
+
+def problem_for_link(link: LinkStatus, previous_size: Optional[int]) -> Optional[str]:
+    """ Why the link is dead or does not look like the plugin archive, None if it is valid. """
+    if link.error:
+        return f'dead link, {link.error}'
+    if link.size == 0:
+        return 'empty archive'
+    if link.content_type and link.content_type not in ARCHIVE_CONTENT_TYPES:
+        return f'unexpected content type {link.content_type}'
+    if previous_size is not None and link.size is not None and previous_size != link.size:
+        return f'size changed from {previous_size} to {link.size} bytes'
+    return None
+
+
+def check_links(
+        records: Iterable[PluginRecord], workers: int = DEFAULT_WORKERS,
+        cache: Optional[LinkCache] = None) -> List[LinkReport]:
+    """ Check the download URL of each plugin concurrently, a URL is checked only once.
+
+    Every plugin is reported, the problem is None if its link is valid.
+    """
+    cache = cache or LinkCache()
+    records = list(records)
+    urls = list(dict.fromkeys(record.download_url for record in records if record.download_url))
+
+    links: Dict[str, LinkStatus] = {}
+    to_check = []
+    for url in urls:
+        entry = cache.get(url)
+        if entry:
+            links[url] = LinkStatus(*(entry[field] for field in LinkStatus._fields))
+        else:
+            to_check.append(url)
+    timings().count('links_cached', len(links))
+    timings().count('links_checked', len(to_check))
+
+    previous_sizes = {url: cache.previous_size(url) for url in to_check}
+    if to_check:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_check)))) as executor:
+            for link in executor.map(check_url, to_check):
+                links[link.url] = link
+                cache.store(link)
+    cache.save()
+
+    reports = []
+    for record in records:
+        if not record.download_url:
+            reports.append(LinkReport(
+                record.name, record.version, record.experimental, None, None, None, None, 'no download URL'))
+            continue
+        link = links[record.download_url]
+        problem = problem_for_link(link, previous_sizes.get(link.url))
+        reports.append(LinkReport(
+            record.name, record.version, record.experimental, link.url, link.status, link.size,
+            link.content_type, problem))
+    return reports
+
+
+def check_catalog(
+        uri: Union[str, Path], workers: int = DEFAULT_WORKERS,
+        cache: Optional[LinkCache] = None) -> List[LinkReport]:
+    """ Check the download URL of each plugin of an XML file or of a remote URL. """
+    # The element is cleared by the reader, it is not kept
+    records = [PluginRecord.from_element(element).detach() for element in iter_elements(uri)]
+    return check_links(records, workers, cache)
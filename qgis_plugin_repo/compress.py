@@ -0,0 +1,123 @@
+""" Precompressed copies of catalogs, written next to them, for static hosting.
+
+Brotli is used only if the brotli package is installed.
+"""
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import zlib
+
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Sequence
+
+from qgis_plugin_repo.tools import atomic_writer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gz'
+BROTLI = 'br'
+ENCODINGS = (GZIP, BROTLI)
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def compressed_path(path: Path, encoding: str) -> Path:
+    """ Path of the compressed copy of a file, for instance plugins.xml.gz. """
+    path = Path(path)
+    return path.with_name(f'{path.name}.{encoding}')
+
+
+def available_encodings() -> List[str]:
+    """ Encodings which can be written with installed packages. """
+    return [encoding for encoding in ENCODINGS if encoding != BROTLI or brotli is not None]
+
+
+def check_encodings(encodings: Sequence[str]) -> None:
+    """ Check that encodings are known and available. """
+    for encoding in encodings:
+        if encoding not in ENCODINGS:
+            raise ValueError(f'Unknown compression {encoding}, it must be one of {", ".join(ENCODINGS)}')
+        if encoding not in available_encodings():
+            raise ValueError(f'The compression {encoding} requires the brotli package')
+
+
+def _compressor(encoding: str):
+    """ Functions to compress a chunk and to end the stream, for an encoding. """
+    if encoding == GZIP:
+        # The gzip header has no file name and no modification time, the same content gives the same bytes
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+    return compressor.process, compressor.finish
+
+
+class CompressingWriter:
+
+    """ Write chunks in a file, and compressed in copies of it, without reading the file again. """
+
+    def __init__(self, file: BinaryIO, copies: List[tuple]):
+        """ Constructor, with the file and the compressor and file of each copy. """
+        self.file = file
+        self.copies = copies
+
+    def write(self, chunk: bytes) -> int:
+        """ Write a chunk in the file and in each compressed copy. """
+        for (compress, _), copy in self.copies:
+            copy.write(compress(chunk))
+        return self.file.write(chunk)
+
+    def finish(self) -> None:
+        """ Write the end of each compressed copy. """
+        for (_, finish), copy in self.copies:
+            copy.write(finish())
+
+
+@contextmanager
+def compressing_writer(path: Path, encodings: Sequence[str] = ()) -> Iterator[CompressingWriter]:
+    """ Write a file atomically, chunk by chunk, with its compressed copies.
+
+    All files are replaced together at the end, or none of them if an error is raised while writing.
+    """
+    check_encodings(encodings)
+    with ExitStack() as stack:
+        copies = [
+            (_compressor(encoding), stack.enter_context(atomic_writer(compressed_path(path, encoding))))
+            for encoding in encodings
+        ]
+        writer = CompressingWriter(stack.enter_context(atomic_writer(path)), copies)
+        yield writer
+        writer.finish()
+
+
+def write_compressed(path: Path, content: bytes, encodings: Sequence[str] = ()) -> None:
+    """ Write a file atomically, with its compressed copies, from the content already in memory. """
+    with compressing_writer(path, encodings) as f:
+        f.write(content)
+
+
+def stale_encodings(path: Path, encodings: Sequence[str] = ()) -> List[str]:
+    """ Encodings whose compressed copy is missing, or older than the file. """
+    mtime_ns = Path(path).stat().st_mtime_ns
+    stale = []
+    for encoding in encodings:
+        copy = compressed_path(path, encoding)
+        if not copy.exists() or copy.stat().st_mtime_ns < mtime_ns:
+            stale.append(encoding)
+    return stale
+
+
+def write_copies(path: Path, encodings: Sequence[str] = ()) -> None:
+    """ Write compressed copies of a file already written, the file itself is unchanged. """
+    check_encodings(encodings)
+    content = Path(path).read_bytes()
+    for encoding in encodings:
+        compress, finish = _compressor(encoding)
+        with atomic_writer(compressed_path(path, encoding)) as f:
+            f.write(compress(content))
+            f.write(finish())
@@ -0,0 +1,91 @@
+""" Differences between two catalogs, from a fingerprint of each plugin element. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import json
+import sys
+
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Optional, TextIO, Tuple, Union
+
+from qgis_plugin_repo.catalog import PluginKey, PluginRecord, element_hash
+from qgis_plugin_repo.reader import iter_elements
+from qgis_plugin_repo.sidecar import Sidecar
+from qgis_plugin_repo.tools import is_url
+
+PluginChange = namedtuple('PluginChange', ['name', 'experimental', 'old_version', 'new_version'])
+CatalogDiff = namedtuple('CatalogDiff', ['added', 'removed', 'version_changed', 'content_changed'])
+
+DIFF_FORMATS = ('text', 'json')
+
+
+def catalog_hashes(uri: Union[str, Path], sidecar: bool = False) -> Dict[PluginKey, Tuple[str, str]]:
+    """ Version and content fingerprint of each plugin of a catalog, read in a single pass.
+
+    With sidecar, the index next to a local file is used, the file is parsed only if the index is stale.
+    Only the first plugin of a key is kept, like in the PluginIndex.
+    """
+    hashes = {}
+    if sidecar and not is_url(uri):
+        for record in Sidecar.load(Path(uri)).records:
+            hashes.setdefault((record.name, record.experimental), (record.version, record.content_hash))
+        return hashes
+
+    for element in iter_elements(uri):
+        record = PluginRecord.from_element(element)
+        if record.key not in hashes:
+            hashes[record.key] = (record.version, element_hash(element))
+    return hashes
+
+
+def diff_hashes(
+        old: Dict[PluginKey, Tuple[str, str]], new: Dict[PluginKey, Tuple[str, str]]) -> CatalogDiff:
+    """ Compare plugins of two catalogs by their key, with a single lookup per plugin. """
+    diff = CatalogDiff([], [], [], [])
+    for key, (version, content_hash) in new.items():
+        previous = old.get(key)
+        if previous is None:
+            diff.added.append(PluginChange(*key, None, version))
+        elif previous[0] != version:
+            diff.version_changed.append(PluginChange(*key, previous[0], version))
+        elif previous[1] != content_hash:
+            diff.content_changed.append(PluginChange(*key, version, version))
+    for key, (version, _) in old.items():
+        if key not in new:
+            diff.removed.append(PluginChange(*key, version, None))
+    return diff
+
+
+def diff_catalogs(old_uri: Union[str, Path], new_uri: Union[str, Path], sidecar: bool = False) -> CatalogDiff:
+    """ Plugins added, removed, with a new version or with a new content in the new catalog. """
+    return diff_hashes(catalog_hashes(old_uri, sidecar), catalog_hashes(new_uri, sidecar))
+
+
+def has_changes(diff: CatalogDiff) -> bool:
+    """ If the catalogs are different. """
+    return any(diff)
+
+
+def write_diff(diff: CatalogDiff, output_format: str = 'text', stream: Optional[TextIO] = None) -> None:
+    """ Write the differences, one line per plugin as text, or as a JSON object. """
+    stream = stream or sys.stdout
+    if output_format == 'json':
+        data = {
+            kind: [change._asdict() for change in changes] for kind, changes in diff._asdict().items()}
+        stream.write(json.dumps(data, indent=2, ensure_ascii=False) + '\n')
+        return
+
+    def flag(change: PluginChange) -> str:
+        return 'experimental' if change.experimental else 'stable'
+
+    for change in diff.added:
+        stream.write(f"+ {change.name} {change.new_version} {flag(change)}\n")
+    for change in diff.removed:
+        stream.write(f"- {change.name} {change.old_version} {flag(change)}\n")
+    for change in diff.version_changed:
+        stream.write(f"~ {change.name} {change.old_version} -> {change.new_version} {flag(change)}\n")
+    for change in diff.content_changed:
+        stream.write(f"~ {change.name} {change.new_version} {flag(change)}, content changed\n")
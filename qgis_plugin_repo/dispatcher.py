@@ -2,62 +2,179 @@ __copyright__ = 'Copyright 2022, 3Liz'
 __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
+import bisect
 import re
-import xml.etree.ElementTree as ET
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
-
-import requests
+from typing import Dict, List, Optional, Tuple, Union
 
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import ANY_PATCH, PluginRecord, parse_version
+from qgis_plugin_repo.fetch import fetcher
+from qgis_plugin_repo.merger import Merger, MergeReport
+from qgis_plugin_repo.timings import reset, timings
 from qgis_plugin_repo.tools import is_url
+from qgis_plugin_repo.xml_backend import ET
 
+ParsedInput = Tuple[Union[str, Path], ET.Element]
 
-class Dispatcher:
 
-    def __init__(self, input_uri: str, outputs_uri: List[str]):
+class VersionIndex:
+
+    """ XML files for QGIS versions, sorted by the version found in their file name.
+
+    The version of each file name is parsed only once, files covering a range of QGIS versions are found with
+    a binary search. A file without a version in its name is never used.
+    """
+
+    VERSION = re.compile(r'(?<![\d.])(\d+)\.(\d+)(?:\.(\d+))?(?![\d])')
+
+    def __init__(self, outputs_uri: List[Union[str, Path]]):
         """ Constructor. """
+        entries = []
+        for output_uri in outputs_uri:
+            output_uri = Path(output_uri)
+            matches = self.VERSION.findall(output_uri.stem)
+            if not matches:
+                continue
+            major, minor, patch = matches[-1]
+            start = (int(major), int(minor), int(patch) if patch else 0)
+            end = (start[0], start[1], int(patch) if patch else ANY_PATCH)
+            entries.append((start, end, output_uri))
+
+        entries.sort(key=lambda entry: entry[0])
+        self.starts = [entry[0] for entry in entries]
+        self.entries = entries
 
-        if is_url(input_uri):
+    def lookup(self, qgis_minimum: str, qgis_maximum: str) -> List[Path]:
+        """ XML files for QGIS versions between the minimum and the maximum, included. """
+        minimum = parse_version(qgis_minimum)
+        maximum = parse_version(qgis_maximum, upper=True)
+        # A file for a minor version starts before the minimum if the minimum has a patch number
+        low = bisect.bisect_left(self.starts, (minimum[0], minimum[1], 0))
+        high = bisect.bisect_right(self.starts, maximum)
+        return [output_uri for _, end, output_uri in self.entries[low:high] if end >= minimum]
+
+
+class Dispatcher:
+
+    def __init__(
+            self, input_uri: str, outputs_uri: List[str], input_parser: Optional[ET.Element] = None,
+            index: Optional[VersionIndex] = None):
+        """ Constructor.
+
+        The input parser can be given if the input has already been parsed, and the index of outputs if it is
+        shared by many inputs.
+        """
+        if input_parser is not None:
+            self.input_uri = input_uri
+            self.input_parser = input_parser
+        elif is_url(input_uri):
             self.input_uri = input_uri
-            self.input_parser = ET.fromstring(requests.get(self.input_uri).content)
+            self.input_parser = xml_backend.fromstring(fetcher().get(self.input_uri))
         else:
             self.input_uri = Path(input_uri)
-            self.input_parser = ET.parse(self.input_uri.absolute()).getroot()
+            self.input_parser = xml_backend.parse(self.input_uri.absolute()).getroot()
 
+        # Fields of each plugin, read once
+        self.records = [PluginRecord.from_element(element) for element in self.input_parser]
         self.outputs_uri = [Path(f) for f in outputs_uri]
+        self.index = index or VersionIndex(self.outputs_uri)
 
     def xml_files_for_plugin(self) -> List[Path]:
         """ Return the list of XML to edit for the given plugin. """
-        qgis_min, qgis_max = self.versions_for_plugin()
-        qgis_min = qgis_min.split('.')
-        qgis_max = qgis_max.split('.')
-        if len(qgis_min) >= 3 or len(qgis_max) >= 3:
-            print("Only major and minor versions are supported for now.")
-
-        qgis_range = range(int(qgis_min[1]), int(qgis_max[1]) + 1)
-        qgis_range = [v for v in qgis_range if v % 2 == 0]
-        qgis_range = [fr'{qgis_min[0]}\.{v}' for v in qgis_range]
-        qgis_range = '|'.join(qgis_range)
-        tmp = []
-        for output_uri in self.outputs_uri:
-            if re.search(r"{}".format(qgis_range), output_uri.name):
-                tmp.append(output_uri)
-        return tmp
+        return self.index.lookup(*self.versions_for_plugin())
 
     def versions_for_plugin(self) -> Tuple[str, str]:
-        """ Return the minimum and maximum QGIS version if found in the XML.
+        """ Return the minimum and maximum QGIS version of the last plugin in the XML.
 
-        Default values are 3.0 and 3.99.
+        Default values are 3.0 and the latest minor version of the major version of the minimum.
         """
-        qgis_minimum = '3.0'
-        qgis_maximum = '3.99'
-        for plugin in self.input_parser:
-            for element in plugin:
-                element: ET.Element
-                if element.tag == "qgis_minimum_version":
-                    qgis_minimum = element.text
-                elif element.tag == "qgis_maximum_version":
-                    qgis_maximum = element.text
-
-        return qgis_minimum, qgis_maximum
+        if not self.records:
+            return '3.0', '3.99'
+        return self.records[-1].qgis_versions
+
+    def route(self) -> Dict[Path, ET.Element]:
+        """ For each XML file to edit, the root element with the plugins of the input to merge in it.
+
+        Each plugin is routed according to its own QGIS versions. A file having every plugin of the input gets
+        the input itself, otherwise the plugins are copied in a new root element.
+        """
+        elements = [record.element for record in self.records]
+        positions: Dict[Path, List[int]] = {}
+        for position, record in enumerate(self.records):
+            for output_uri in self.index.lookup(*record.qgis_versions):
+                positions.setdefault(output_uri, []).append(position)
+
+        # Files with the same plugins share the same root element
+        roots: Dict[Tuple[int, ...], ET.Element] = {}
+        routes = {}
+        for output_uri, output_positions in positions.items():
+            key = tuple(output_positions)
+            if key not in roots:
+                if len(key) == len(elements):
+                    roots[key] = self.input_parser
+                else:
+                    roots[key] = ET.Element(self.input_parser.tag)
+                    roots[key].extend([xml_backend.copy_element(elements[i]) for i in key])
+            routes[output_uri] = roots[key]
+        return routes
+
+
+def _merge_output(output_uri: Path, inputs: List[ParsedInput], options: dict) -> List[MergeReport]:
+    """ Merge already parsed inputs in a single output. """
+    print(f"Editing {output_uri.name}")
+    return Merger(inputs, output_uri, **options).merge()
+
+
+def _merge_output_serialized(
+        output_uri: Path, inputs: List[Tuple[Union[str, Path], bytes]], options: dict
+) -> Tuple[List[MergeReport], dict]:
+    """ Merge serialized inputs in a single output, in another process.
+
+    Timings of the process are returned with the reports, to be added to the timings of the run.
+    """
+    reset()
+    with timings().phase('parse'):
+        inputs = [(input_uri, xml_backend.fromstring(content)) for input_uri, content in inputs]
+    reports = _merge_output(output_uri, inputs, options)
+    return reports, timings().as_dict()
+
+
+def dispatch(inputs: List[str], outputs_uri: List[str], workers: int = 1, **options) -> List[MergeReport]:
+    """ Merge inputs in all matching XML files.
+
+    Each input is read and parsed only once, then shared by all the merges. With many workers, the XML files
+    are edited concurrently in a pool of processes. Options are given to each Merger.
+    """
+    index = VersionIndex(outputs_uri)
+    # For each output file, the list of inputs to merge in it
+    outputs: Dict[Path, List[ParsedInput]] = {}
+    for input_uri in inputs:
+        input_uri, input_parser = Merger.read_input(input_uri)
+        dispatcher = Dispatcher(input_uri, outputs_uri, input_parser, index)
+        with timings().phase('route'):
+            routes = dispatcher.route()
+        for output_uri, root in routes.items():
+            outputs.setdefault(output_uri, []).append((input_uri, root))
+
+    if workers <= 1 or len(outputs) <= 1:
+        results = [
+            _merge_output(output_uri, output_inputs, options)
+            for output_uri, output_inputs in outputs.items()
+        ]
+    else:
+        # Elements can not be sent to another process with every backend, the input is sent as bytes
+        serialized = [
+            [(input_uri, xml_backend.tostring(input_parser)) for input_uri, input_parser in output_inputs]
+            for output_inputs in outputs.values()
+        ]
+        with ProcessPoolExecutor(max_workers=min(workers, len(outputs))) as executor:
+            results = []
+            for reports, worker_timings in executor.map(
+                    _merge_output_serialized, outputs.keys(), serialized, [options] * len(outputs)):
+                timings().update(worker_timings)
+                results.append(reports)
+
+    return [report for reports in results for report in reports]
@@ -0,0 +1,153 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from qgis_plugin_repo.cache import HttpCache
+from qgis_plugin_repo.timings import timings
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_WORKERS = 8
+
+
+class Fetcher:
+
+    """ Shared HTTP layer for remote inputs.
+
+    A single pooled session is used, with a timeout and retries with a backoff. A URL is downloaded only once
+    during the run, even if it is requested many times or from many threads.
+
+    With a cache, conditional requests are sent and the body is read from the disk if it has not changed.
+    """
+
+    def __init__(
+            self,
+            timeout: float = DEFAULT_TIMEOUT,
+            retries: int = DEFAULT_RETRIES,
+            backoff: float = DEFAULT_BACKOFF,
+            workers: int = DEFAULT_WORKERS,
+            cache: Optional[HttpCache] = None,
+    ):
+        """ Constructor. """
+        self.cache = cache
+        self.timeout = timeout
+        self.workers = workers
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._downloads: Dict[str, Future] = {}
+
+    def download(self, url: str) -> bytes:
+        """ Download the content of the URL, without using the contents already downloaded. """
+        headers = self.cache.validators(url) if self.cache else {}
+        with timings().phase('fetch'):
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and headers:
+            timings().count('not_modified')
+            return self.cache.read(url)
+
+        response.raise_for_status()
+        timings().count('fetched_bytes', len(response.content))
+        if self.cache and self.cache.cacheable(response.headers):
+            self.cache.store(url, response.headers, response.content)
+        return response.content
+
+    def get(self, url: str) -> bytes:
+        """ Return the content of the URL, downloaded only once. """
+        with self._lock:
+            future = self._downloads.get(url)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._downloads[url] = future
+
+        if owner:
+            try:
+                future.set_result(self.download(url))
+            except Exception as e:
+                # Not kept, the next call will try again
+                with self._lock:
+                    del self._downloads[url]
+                future.set_exception(e)
+
+        return future.result()
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, bytes]:
+        """ Download many URLs concurrently. """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) <= 1:
+            return {url: self.get(url) for url in urls}
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            return dict(zip(urls, executor.map(self.get, urls)))
+
+    def stream(self, url: str, chunk_size: int) -> Iterator[bytes]:
+        """ Iterate over the content of the URL while it is downloaded.
+
+        If the URL has already been downloaded during the run, the content is not downloaded again.
+        """
+        with self._lock:
+            future = self._downloads.get(url)
+        if future is not None:
+            content = future.result()
+            for i in range(0, len(content), chunk_size):
+                yield content[i:i + chunk_size]
+            return
+
+        headers = self.cache.validators(url) if self.cache else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and headers:
+                timings().count('not_modified')
+                yield from self.cache.iter_body(url, chunk_size)
+                return
+
+            response.raise_for_status()
+            if not self.cache or not self.cache.cacheable(response.headers):
+                for chunk in response.iter_content(chunk_size):
+                    timings().count('fetched_bytes', len(chunk))
+                    yield chunk
+                return
+
+            with self.cache.writer(url, response.headers) as write:
+                for chunk in response.iter_content(chunk_size):
+                    timings().count('fetched_bytes', len(chunk))
+                    write(chunk)
+                    yield chunk
+
+
+_fetcher: Optional[Fetcher] = None
+
+
+def fetcher() -> Fetcher:
+    """ The fetcher shared by the whole run. """
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
+
+
+def configure(**kwargs) -> Fetcher:
+    """ Replace the shared fetcher, with different timeout, retries, backoff, workers or cache. """
+    global _fetcher
+    _fetcher = Fetcher(**kwargs)
+    return _fetcher
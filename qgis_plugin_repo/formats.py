@@ -0,0 +1,50 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import csv
+import json
+import sys
+
+from typing import Iterable, List, Optional, TextIO
+
+from qgis_plugin_repo.reader import DEFAULT_FIELDS
+
+FORMATS = ('text', 'json', 'ndjson', 'csv')
+
+
+def write_records(
+        records: Iterable[dict], fields: List[str], output_format: str = 'text',
+        stream: Optional[TextIO] = None) -> int:
+    """ Write records one by one, as soon as they are read, and return the number of records.
+
+    The JSON format is an array written incrementally, NDJSON has one object per line.
+    """
+    stream = stream or sys.stdout
+    count = 0
+    if output_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=fields, lineterminator='\n')
+        writer.writeheader()
+        for count, record in enumerate(records, 1):
+            writer.writerow(record)
+
+    elif output_format == 'json':
+        stream.write('[')
+        for count, record in enumerate(records, 1):
+            stream.write(('\n' if count == 1 else ',\n') + json.dumps(record, ensure_ascii=False))
+        stream.write('\n]\n' if count else ']\n')
+
+    elif output_format == 'ndjson':
+        for count, record in enumerate(records, 1):
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    else:
+        for count, record in enumerate(records, 1):
+            if tuple(fields) == DEFAULT_FIELDS:
+                flag = 'experimental' if record['experimental'] else 'stable'
+                stream.write(f"{record['name']} {record['version']} {flag}\n")
+            else:
+                values = ('' if value is None else str(value) for value in record.values())
+                stream.write(' '.join(values) + '\n')
+
+    return count
@@ -0,0 +1,114 @@
+""" History of the plugin elements replaced in a catalog, to restore a previous version. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import json
+import os
+import time
+import zlib
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import PluginRecord
+from qgis_plugin_repo.xml_backend import ET
+
+HISTORY_SUFFIX = '.history'
+INDEX_SUFFIX = '.idx'
+
+HistoryEntry = Tuple[int, int, float]
+
+
+class History:
+
+    """ Append-only store of replaced plugin elements, next to a catalog, for instance plugins.xml.history.
+
+    Each element is compressed on its own and appended to the data file. Its offset is appended to the index
+    of the plugin, one file per plugin name and experimental flag in the index directory, one JSON line per
+    element. An element is read back with a single seek, neither the data file nor the index of other
+    plugins are read. The latest element of a version wins.
+    """
+
+    def __init__(self, catalog: Path):
+        """ Constructor, with the path of the catalog. """
+        catalog = Path(catalog)
+        self.path = catalog.with_name(catalog.name + HISTORY_SUFFIX)
+        self.index_path = self.path.with_name(self.path.name + INDEX_SUFFIX)
+
+    def index_file(self, name: str, experimental: bool) -> Path:
+        """ Path of the index of a plugin, the name is quoted to be a single file name. """
+        flag = 'experimental' if experimental else 'stable'
+        return self.index_path / f'{quote(name, safe="")}.{flag}'
+
+    def index(self, name: str, experimental: bool) -> Dict[str, HistoryEntry]:
+        """ Offset, length and time of the latest element of each version of a plugin. """
+        entries = {}
+        try:
+            f = open(self.index_file(name, experimental), encoding='utf8')
+        except FileNotFoundError:
+            return entries
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line is not complete if a write has been interrupted
+                    continue
+                # Names differing only by their case can share a file on some file systems
+                if entry['name'] == name:
+                    entries[entry['version']] = (entry['offset'], entry['length'], entry['time'])
+        return entries
+
+    def append(self, elements: List[ET.Element]) -> None:
+        """ Add elements to the history, the data is on the disk before the index refers to it. """
+        if not elements:
+            return
+
+        now = time.time()
+        lines: Dict[Path, List[str]] = {}
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            for element in elements:
+                record = PluginRecord.from_element(element)
+                data = zlib.compress(xml_backend.tostring(element))
+                f.write(data)
+                entry = {
+                    'name': record.name, 'experimental': record.experimental, 'version': record.version,
+                    'offset': offset, 'length': len(data), 'time': now,
+                }
+                index_file = self.index_file(record.name, record.experimental)
+                lines.setdefault(index_file, []).append(json.dumps(entry, ensure_ascii=False) + '\n')
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.index_path.mkdir(exist_ok=True)
+        for index_file, plugin_lines in lines.items():
+            if index_file.exists() and index_file.stat().st_size:
+                with open(index_file, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        # After an interrupted write, the incomplete line is ended, it is skipped when reading
+                        plugin_lines.insert(0, '\n')
+            with open(index_file, 'a', encoding='utf8') as f:
+                f.write(''.join(plugin_lines))
+
+    def get(self, name: str, experimental: bool, version: str) -> Optional[ET.Element]:
+        """ The latest element of a plugin version, None if it is not in the history. """
+        entry = self.index(name, experimental).get(version)
+        if entry is None:
+            return None
+
+        offset, length, _ = entry
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return xml_backend.fromstring(zlib.decompress(f.read(length)))
+
+    def versions(self, name: str, experimental: bool) -> List[Tuple[str, float]]:
+        """ Versions of a plugin in the history, with the time they have been replaced, the latest first. """
+        versions = [(version, entry[2]) for version, entry in self.index(name, experimental).items()]
+        return sorted(versions, key=lambda item: item[1], reverse=True)
@@ -0,0 +1,76 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import os
+
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, locks are not taken
+    fcntl = None
+
+LOCK_SUFFIX = '.lock'
+
+
+def lock_path(path: Path) -> Path:
+    """ Path of the lock file for a file, for instance .plugins.xml.lock. """
+    path = Path(path)
+    return path.with_name(f'.{path.name}{LOCK_SUFFIX}')
+
+
+class FileLock:
+
+    """ Advisory lock between processes, with a lock file next to the protected file.
+
+    The protected file itself is not locked, because it is replaced when it is written. The lock file is
+    removed when the lock is released, so it is not left in the repository.
+    """
+
+    def __init__(self, path: Path):
+        """ Constructor, with the path of the file to protect. """
+        self.path = lock_path(path)
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """ Take the lock, False if it is already taken and if it must not wait. """
+        if fcntl is None:
+            return True
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+
+            # The previous owner may have removed the file meanwhile, the lock must be on the current one
+            try:
+                current = os.path.samestat(os.fstat(fd), os.stat(self.path))
+            except FileNotFoundError:
+                current = False
+            if current:
+                self._fd = fd
+                return True
+            os.close(fd)
+
+    def release(self) -> None:
+        """ Release the lock. """
+        if self._fd is None:
+            return
+
+        self.path.unlink(missing_ok=True)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
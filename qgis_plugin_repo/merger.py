@@ -1,19 +1,37 @@
-import sys
-import xml.etree.ElementTree as ET
-
 from collections import namedtuple
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple, Union
 
 import requests
 
-from qgis_plugin_repo.tools import is_url
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import (
+    Plugin,
+    PluginIndex,
+    PluginRecord,
+    plugin_from_element,
+)
+from qgis_plugin_repo.compress import (
+    check_encodings,
+    stale_encodings,
+    write_compressed,
+    write_copies,
+)
+from qgis_plugin_repo.fetch import fetcher
+from qgis_plugin_repo.history import History
+from qgis_plugin_repo.lock import FileLock
+from qgis_plugin_repo.sidecar import Sidecar
+from qgis_plugin_repo.splice import SplicedCatalog
+from qgis_plugin_repo.timings import timings
+from qgis_plugin_repo.tools import file_signature, is_url
+from qgis_plugin_repo.validator import missing_attributes
+from qgis_plugin_repo.xml_backend import ET
 
 __copyright__ = 'Copyright 2021, 3Liz'
 __license__ = 'GPL version 3'
 __email__ = 'info@3liz.org'
 
-Plugin = namedtuple('Plugin', ['name', 'experimental', 'version'])
+MergeReport = namedtuple('MergeReport', ['input_uri', 'destination_uri', 'added', 'updated'])
 
 
 class Merger:
@@ -29,37 +47,127 @@ class Merger:
             "</plugins>\n"
         )
 
-    def __init__(self, input_uri: str, destination_uri: Optional[str] = None):
-        """ Constructor. """
-        # Usually a path as a string (filepath or remote URL)
-        if is_url(input_uri):
-            self.input_uri = input_uri
-            try:
-                remote = requests.get(self.input_uri)
-            except requests.exceptions.MissingSchema:
-                print(f"The input {self.input_uri} is neither a valid file nor a valid URL.")
-                exit(2)
-            self.input_parser = ET.fromstring(remote.content)
-        else:
-            self.input_uri = Path(input_uri)
-            self.input_parser = ET.parse(self.input_uri.absolute()).getroot()
+    def __init__(
+            self,
+            input_uri: Union[str, List[Union[str, Tuple]]],
+            destination_uri: Optional[str] = None,
+            splice: bool = False,
+            sidecar: bool = False,
+            lock: bool = True,
+            compress: Sequence[str] = (),
+            history: bool = False,
+    ):
+        """ Constructor.
+
+        The input can be a single XML or a list of XML, which are all applied in a single merge. An item of
+        the list can also be an input already parsed, as a tuple with its URI and its root element.
+
+        With splice, only added or updated plugins are serialized when writing the destination, every other
+        byte of the file is kept unchanged.
+
+        With sidecar, the pre-parsed index next to the destination is used, the destination is parsed only if
+        a plugin must be added or updated.
+
+        With lock, an advisory lock is taken on the destination while it is read and written, if it has been
+        changed by another process since it has been parsed, it is read again.
+
+        With compress, compressed copies of the destination are written next to it, for instance
+        plugins.xml.gz, each time the destination is written.
+
+        With history, replaced plugin elements are appended to the history next to the destination, for
+        instance plugins.xml.history, once the destination is written.
+        """
+        if isinstance(input_uri, (str, Path)):
+            input_uri = [input_uri]
+
+        # Usually paths as a string (filepath or remote URL)
+        self.inputs = [uri if isinstance(uri, tuple) else self.read_input(uri) for uri in input_uri]
+        # The first input, for backward compatibility
+        self.input_uri, self.input_parser = self.inputs[0]
 
         # Usually a path, it can be None if we want to read only
         self.destination_uri = None
         self.output_parser = None
         self.output_tree = None
+        self.output_index = None
+        self.splice = splice
+        self.spliced = None
+        self.sidecar = None
+        self.lock = lock
+        check_encodings(compress)
+        self.compress = tuple(compress)
+        self.history = None
+        # Previous elements of updated plugins, to add to the history
+        self.replaced = []
+        # Size and modification time of the destination when it has been read
+        self.destination_signature = None
+        # Updated elements in the destination by position, and appended elements, since the last write
+        self.updated_positions = {}
+        self.appended = []
         if destination_uri:
             self.destination_uri = Path(destination_uri)
+            if history:
+                self.history = History(self.destination_uri.absolute())
 
             if not self.destination_uri.exists():
                 self.init()
 
+            if sidecar:
+                try:
+                    with timings().phase('sidecar'):
+                        self.sidecar = Sidecar.load(self.destination_uri.absolute())
+                except xml_backend.ParseError:
+                    print(f"Invalid XML file content {self.destination_uri.absolute()}")
+                    exit(1)
+            else:
+                self.load_destination()
+
+    def load_destination(self) -> None:
+        """ Parse the destination file. """
+        self.updated_positions = {}
+        self.appended = []
+        self.destination_signature = file_signature(self.destination_uri.absolute())
+        try:
+            with timings().phase('parse'):
+                self.output_tree = xml_backend.parse(self.destination_uri.absolute())
+        except xml_backend.ParseError:
+            print(f"Invalid XML file content {self.destination_uri.absolute()}")
+            exit(1)
+        self.output_parser = self.output_tree.getroot()
+        with timings().phase('index'):
+            self.output_index = PluginIndex(self.output_parser)
+        timings().count('destination_plugins', len(self.output_parser))
+
+        if not self.splice:
+            return
+
+        if self.sidecar:
+            ranges = [(record.start, record.end) for record in self.sidecar.records]
+            self.spliced = SplicedCatalog(self.destination_uri.absolute(), ranges, self.sidecar.root_start)
+        else:
+            with timings().phase('scan'):
+                self.spliced = SplicedCatalog.from_file(self.destination_uri.absolute())
+        if self.spliced and len(self.spliced.ranges) != len(self.output_parser):
+            self.spliced = None
+
+    @staticmethod
+    def read_input(input_uri: str) -> Tuple[Union[str, Path], ET.Element]:
+        """ Read an input XML, from a filepath or a remote URL. """
+        if is_url(input_uri):
             try:
-                self.output_tree = ET.parse(self.destination_uri.absolute())
-            except ET.ParseError:
-                print(f"Invalid XML file content {self.destination_uri.absolute()}")
-                exit(1)
-            self.output_parser = self.output_tree.getroot()
+                content = fetcher().get(input_uri)
+            except requests.exceptions.MissingSchema:
+                print(f"The input {input_uri} is neither a valid file nor a valid URL.")
+                exit(2)
+            with timings().phase('parse'):
+                root = xml_backend.fromstring(content)
+        else:
+            input_uri = Path(input_uri)
+            with timings().phase('parse'):
+                root = xml_backend.parse(input_uri.absolute()).getroot()
+
+        timings().count('input_plugins', len(root))
+        return input_uri, root
 
     def init(self) -> None:
         """ Init the XML files with an empty catalog. """
@@ -68,84 +176,201 @@ class Merger:
             f.write(self.xml_template())
 
     @staticmethod
-    def plugins(parser) -> list:
-        """ Return the plugins in the XML file. """
-        plugins_list = []
-        for plugin in parser:
-            experimental = False
-            for element in plugin:
-                element: ET.Element
-                if element.tag == "experimental":
-                    experimental = True if element.text == 'True' else False
-                    break
-
-            plugins_list.append(Plugin(
-                plugin.attrib['name'],
-                experimental,
-                plugin.attrib['version']))
-
-        return plugins_list
+    def plugins(parser) -> List[Plugin]:
+        """ Return the plugins in the XML file, only their name, experimental flag and version are read. """
+        return [plugin_from_element(element) for element in parser]
 
     @staticmethod
-    def plugin_element(parser: ET.Element, name: str, experimental: bool) -> [ET.Element, int]:
-        """ Return the XML element for a given plugin name and its experimental flag. """
-        for i, plugin in enumerate(parser):
-            if plugin.attrib['name'] != name:
-                continue
+    def records(parser) -> List[PluginRecord]:
+        """ Return the records of plugins in the XML file, with all their fields. """
+        return [PluginRecord.from_element(element) for element in parser]
 
-            for element in plugin:
-                element: ET.Element
-                if element.tag == "experimental":
-                    flag = True if element.text == 'True' else False
-                    if flag != experimental:
-                        continue
-
-                    return plugin, i
+    @staticmethod
+    def plugin_element(parser: ET.Element, name: str, experimental: bool) -> [ET.Element, int]:
+        """ Return the XML element for a given plugin name and its experimental flag.
 
-        return None, None
+        Prefer a PluginIndex when many lookups are done on the same parser.
+        """
+        return PluginIndex(parser).get(name, experimental)
 
     @staticmethod
     def diff_plugins(plugins_input, plugins_output) -> list:
         """ List of plugins which are in the input and not in the output. """
-        new = []
-        for plugin in plugins_input:
-            if plugin not in plugins_output:
-                new.append(plugin)
-
-        return new
+        if not isinstance(plugins_output, PluginIndex):
+            plugins_output = set(plugins_output)
+        return [plugin for plugin in plugins_input if plugin not in plugins_output]
 
     def count(self) -> int:
-        """ Count the number of plugins in the XML. """
-        return len(self.plugins(self.input_parser))
+        """ Count the number of plugins in the XML inputs. """
+        return sum(len(self.plugins(input_parser)) for _, input_parser in self.inputs)
 
-    def merge(self):
-        """ Make the merge. """
-        output_plugins = self.plugins(self.output_parser)
-        input_plugins = self.plugins(self.input_parser)
+    def merge_input(self, input_uri: Union[str, Path], input_parser: ET.Element) -> MergeReport:
+        """ Apply a single input on the destination tree, in memory only.
 
-        diff = self.diff_plugins(input_plugins, output_plugins)
+        A plugin is updated if its version or its content is different.
+        """
+        # The cheap checks of the validation, a plugin can not be merged without its name and its version
+        for element in input_parser:
+            missing = missing_attributes(element)
+            if missing:
+                plugin = element.attrib.get('name') or element.tag
+                print(f"The plugin {plugin} in {input_uri} has no attribute {', '.join(missing)}.")
+                exit(1)
 
-        print(f"Updating source {self.destination_uri.absolute()}")
-        print(f"with {self.input_uri}")
+        input_index = PluginIndex(input_parser)
 
-        if len(diff) == 0:
-            print("No update is necessary")
+        print(f"with {input_uri}")
 
-        for plugin in diff:
-            element, index = self.plugin_element(self.output_parser, plugin.name, plugin.experimental)
-            if element:
-                print(f"Updating previous {plugin.name} {plugin.experimental} {element.attrib['version']}")
-                element.__setstate__(
-                    self.plugin_element(
-                        self.input_parser, plugin.name, plugin.experimental)[0].__getstate__())
+        report = MergeReport(input_uri, self.destination_uri, [], [])
+        for record in input_index.records():
+            if self.output_index.is_unchanged(record):
+                continue
+
+            plugin = record.plugin
+            # The input can be shared by many merges, the destination has its own copy
+            new_element = xml_backend.copy_element(record.element)
+            element, position = self.output_index.get(plugin.name, plugin.experimental)
+            if element is not None:
+                self.updated_positions[position] = element
+                previous = element.attrib['version']
+                if previous == plugin.version:
+                    previous += ", content changed"
+                print(f"Updating previous {plugin.name} {plugin.experimental} {previous}")
+                if self.history:
+                    # The element is replaced in place
+                    self.replaced.append(xml_backend.copy_element(element))
+                self.output_index.replace(new_element)
+                report.updated.append(plugin)
             else:
                 print(f"Adding new version {plugin.name} {plugin.experimental} {plugin.version}")
-                self.output_parser.append(
-                    self.plugin_element(self.input_parser, plugin.name, plugin.experimental)[0])
+                self.output_index.append(new_element)
+                self.appended.append(new_element)
+                report.added.append(plugin)
+
+        if not report.added and not report.updated:
+            print("No update is necessary")
+
+        return report
+
+    def serialize(self) -> bytes:
+        """ The destination tree, as it is written in the file. """
+        with timings().phase('indent'):
+            xml_backend.indent(self.output_tree, space="\t", level=0)
+        with timings().phase('serialize'):
+            return xml_backend.tostring(self.output_parser) + b"\n"
+
+    def merge(self, inputs: Optional[List[Tuple[Union[str, Path], ET.Element]]] = None) -> List[MergeReport]:
+        """ Make the merge of all inputs.
+
+        The destination is written only once, atomically, and only if a plugin has been added or updated.
+
+        Other inputs, already parsed, can be given to use the same merger again on the destination kept in
+        memory.
+        """
+        if inputs:
+            self.inputs = inputs
+            self.input_uri, self.input_parser = self.inputs[0]
+
+        if not self.lock:
+            return self.merge_unlocked()
+
+        with timings().phase('lock'):
+            lock = FileLock(self.destination_uri.absolute())
+            lock.acquire()
+        try:
+            self.refresh()
+            return self.merge_unlocked()
+        finally:
+            lock.release()
+
+    def refresh(self) -> None:
+        """ Read the destination again if it has been changed by another process since it has been read. """
+        if self.output_tree is not None:
+            if self.destination_signature == file_signature(self.destination_uri.absolute()):
+                return
+            print(f"The file {self.destination_uri.absolute()} has been changed meanwhile, it is read again")
+            if self.sidecar:
+                self.sidecar = Sidecar.load(self.destination_uri.absolute())
+            self.load_destination()
+        elif self.sidecar and not self.sidecar.is_fresh():
+            self.sidecar = Sidecar.load(self.destination_uri.absolute())
+
+    def update_copies(self) -> None:
+        """ Write compressed copies missing or older than the destination, when it is not written. """
+        stale = stale_encodings(self.destination_uri.absolute(), self.compress)
+        if not stale:
+            return
+        with timings().phase('compress'):
+            write_copies(self.destination_uri.absolute(), stale)
+        print(f"Compressed copies {', '.join(stale)} of {self.destination_uri.absolute()} are written")
+
+    def merge_unlocked(self) -> List[MergeReport]:
+        """ Make the merge of all inputs, the lock must be taken by the caller if needed. """
+        print(f"Updating source {self.destination_uri.absolute()}")
+        if self.output_tree is None:
+            elements = [element for _, input_parser in self.inputs for element in input_parser]
+            if all(self.sidecar.is_unchanged(element) for element in elements):
+                print("No update is necessary, according to the sidecar index")
+                self.update_copies()
+                return [MergeReport(input_uri, self.destination_uri, [], []) for input_uri, _ in self.inputs]
+            self.load_destination()
+
+        self.replaced = []
+        with timings().phase('diff'):
+            reports = [self.merge_input(input_uri, input_parser) for input_uri, input_parser in self.inputs]
+        timings().count('added', sum(len(report.added) for report in reports))
+        timings().count('updated', sum(len(report.updated) for report in reports))
+
+        if not any(report.added or report.updated for report in reports):
+            print(f"The file {self.destination_uri.absolute()} is not written, it is already up to date")
+            self.update_copies()
+            return reports
+
+        content = None
+        # Changed elements by position in the new content
+        changed = {}
+        if self.spliced:
+            count = len(self.spliced.ranges)
+            changed = {i: element for i, element in self.updated_positions.items() if i < count}
+            with timings().phase('splice'):
+                # Elements are not looked up by position, it is not in constant time with every backend
+                content = self.spliced.splice(changed, self.appended)
+            changed.update((count + i, element) for i, element in enumerate(self.appended))
+        # Offsets of the new content are known only if it has been spliced
+        spliced = content is not None
+        if content is None:
+            content = self.serialize()
+
+        with timings().phase('write'):
+            write_compressed(self.destination_uri.absolute(), content, self.compress)
+        self.destination_signature = file_signature(self.destination_uri.absolute())
+        timings().count('written_bytes', len(content))
+
+        if self.history:
+            with timings().phase('history'):
+                self.history.append(self.replaced)
+            self.replaced = []
 
-        if sys.version_info >= (3, 9):
-            ET.indent(self.output_tree, space="\t", level=0)
-        self.output_tree.write(self.destination_uri.absolute(), encoding="utf-8")
+        if self.sidecar:
+            with timings().phase('sidecar'):
+                if spliced and len(self.sidecar.records) == len(self.spliced.ranges):
+                    # Offsets are known from the splice, the content is not scanned again
+                    self.sidecar = self.sidecar.written(content, self.spliced.new_ranges, changed)
+                else:
+                    # Fingerprints of untouched plugins are kept
+                    keys = {(p.name, p.experimental) for r in reports for p in r.added + r.updated}
+                    known_hashes = {k: v for k, v in self.sidecar.content_hashes().items() if k not in keys}
+                    self.sidecar = Sidecar.build(
+                        self.destination_uri.absolute(), content, self.output_parser, known_hashes)
+                self.sidecar.save()
 
-        with open(self.destination_uri, "a", encoding='utf8') as f:
-            f.write("\n")
+        # Offsets have changed in the file, for the next merge
+        self.updated_positions.clear()
+        self.appended = []
+        if self.spliced and spliced:
+            self.spliced = self.spliced.written()
+        elif self.spliced:
+            self.spliced = SplicedCatalog.from_file(self.destination_uri.absolute())
+            if self.spliced and len(self.spliced.ranges) != len(self.output_parser):
+                self.spliced = None
+        return reports
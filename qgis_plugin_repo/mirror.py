@@ -0,0 +1,228 @@
+""" Mirror of upstream QGIS repositories, with the plugin archives. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import json
+import os
+import threading
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+from urllib.parse import quote, urlparse
+
+import requests
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import PluginRecord
+from qgis_plugin_repo.fetch import DEFAULT_WORKERS, fetcher
+from qgis_plugin_repo.merger import Merger, MergeReport
+from qgis_plugin_repo.timings import timings
+from qgis_plugin_repo.tools import atomic_write
+from qgis_plugin_repo.xml_backend import ET
+
+DEFAULT_UPSTREAM = 'https://plugins.qgis.org/plugins/plugins.xml?qgis={version}'
+ARCHIVES = 'archives'
+MANIFEST = 'mirror.json'
+PART_SUFFIX = '.part'
+CHUNK_SIZE = 64 * 1024
+# Characters which are not allowed in a part of the path of an archive
+UNSAFE_CHARACTERS = ('/', '\\', '\0')
+
+ArchiveResult = namedtuple('ArchiveResult', ['url', 'path', 'size', 'downloaded', 'error'])
+
+
+class SizeMismatchError(Exception):
+    pass
+
+
+class Mirror:
+
+    """ Local copy of upstream catalogs for many QGIS versions, and of the archives of their plugins.
+
+    Catalogs are written as plugins-{version}.xml in the directory, with their download URLs pointing to the
+    archives in the mirror. An archive is downloaded only if it is new, a partial download is resumed.
+    """
+
+    def __init__(
+            self, directory: Union[str, Path], base_url: str, upstream: str = DEFAULT_UPSTREAM,
+            workers: int = DEFAULT_WORKERS, **options):
+        """ Constructor, options are given to each Merger writing a catalog. """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip('/')
+        self.upstream = upstream
+        self.workers = workers
+        self.options = options
+        self._lock = threading.Lock()
+        self.manifest = self.read_manifest()
+        # Archives which could not be downloaded during the last sync
+        self.failed: List[ArchiveResult] = []
+
+    def read_manifest(self) -> Dict[str, dict]:
+        """ Archives already downloaded, by upstream URL. """
+        try:
+            return json.loads((self.directory / MANIFEST).read_text(encoding='utf8'))
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self) -> None:
+        """ Write the list of archives downloaded. """
+        content = json.dumps(self.manifest, indent=1, sort_keys=True).encode('utf8')
+        atomic_write(self.directory / MANIFEST, content)
+
+    def catalog_path(self, qgis_version: str) -> Path:
+        """ Path of the catalog of a QGIS version in the mirror. """
+        return self.directory / f'plugins-{qgis_version}.xml'
+
+    @staticmethod
+    def archive_name(record: PluginRecord) -> str:
+        """ Relative path of the archive of a plugin in the mirror, unique for a plugin and its version.
+
+        Parts are not quoted, they are the names on the disk. ValueError is raised if a part is not a single
+        file name.
+        """
+        file_name = record.file_name or Path(urlparse(record.download_url).path).name or 'plugin.zip'
+        parts = (record.name, record.version, file_name)
+        for part in parts:
+            if part in ('', '.', '..') or any(character in part for character in UNSAFE_CHARACTERS):
+                raise ValueError(f'"{part}" can not be used in the path of the archive of {record.name}')
+        return '/'.join((ARCHIVES,) + parts)
+
+    def archive_url(self, result: ArchiveResult) -> str:
+        """ URL of an archive in the mirror, parts of its path are quoted. """
+        return f'{self.base_url}/{quote(result.path.relative_to(self.directory).as_posix())}'
+
+    def fetch_catalogs(self, qgis_versions: Sequence[str]) -> Dict[str, ET.Element]:
+        """ Download upstream catalogs of all QGIS versions concurrently. """
+        urls = {version: self.upstream.format(version=version) for version in qgis_versions}
+        with timings().phase('fetch'):
+            contents = fetcher().get_many(urls.values())
+        return {version: xml_backend.fromstring(contents[url]) for version, url in urls.items()}
+
+    def is_downloaded(self, url: str, name: str) -> bool:
+        """ If the archive has already been downloaded completely, from the same URL. """
+        entry = self.manifest.get(url)
+        path = self.directory / name
+        if not entry or entry['path'] != name or not path.exists():
+            return False
+        return path.stat().st_size == entry['size']
+
+    def download(self, url: str, name: str) -> ArchiveResult:
+        """ Download an archive, resuming a previous partial download, and check its size. """
+        path = self.directory / name
+        part = path.with_name(path.name + PART_SUFFIX)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        session = fetcher().session
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=fetcher().timeout) as response:
+                if response.status_code == 416 and offset:
+                    # The partial file is not valid anymore
+                    part.unlink()
+                    return self.download(url, name)
+                response.raise_for_status()
+
+                expected = self.expected_size(response)
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(part, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        timings().count('archive_bytes', len(chunk))
+                        f.write(chunk)
+
+            size = part.stat().st_size
+            if expected is not None and size != expected:
+                if size > expected:
+                    part.unlink()
+                raise SizeMismatchError(f'{size} bytes received instead of {expected}')
+        except (requests.exceptions.RequestException, SizeMismatchError, OSError) as e:
+            return ArchiveResult(url, path, None, False, f'{e.__class__.__name__}: {e}')
+
+        os.replace(part, path)
+        with self._lock:
+            self.manifest[url] = {'path': name, 'size': size}
+        return ArchiveResult(url, path, size, True, None)
+
+    @staticmethod
+    def expected_size(response: requests.Response) -> Optional[int]:
+        """ Full size of the archive, from the headers of a complete or a partial response. """
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+    def sync_archives(self, records: List[PluginRecord]) -> Dict[str, ArchiveResult]:
+        """ Download archives which are not in the mirror yet, concurrently, each URL only once. """
+        archives = {}
+        results = {}
+        for record in records:
+            if not record.download_url:
+                continue
+            try:
+                archives[record.download_url] = self.archive_name(record)
+            except ValueError as e:
+                results[record.download_url] = ArchiveResult(
+                    record.download_url, None, None, False, f'{e.__class__.__name__}: {e}')
+
+        to_download = []
+        for url, name in archives.items():
+            if self.is_downloaded(url, name):
+                size = self.manifest[url]['size']
+                results[url] = ArchiveResult(url, self.directory / name, size, False, None)
+            else:
+                to_download.append((url, name))
+        timings().count('archives_kept', len(archives) - len(to_download))
+        timings().count('archives_downloaded', len(to_download))
+
+        if to_download:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(to_download)))) as executor:
+                for result in executor.map(lambda item: self.download(*item), to_download):
+                    results[result.url] = result
+        self.save_manifest()
+        return results
+
+    def rewrite(self, root: ET.Element, results: Dict[str, ArchiveResult]) -> ET.Element:
+        """ A copy of the catalog with plugins available in the mirror, with their URLs in the mirror. """
+        mirrored = ET.Element(root.tag)
+        for element in root:
+            record = PluginRecord.from_element(element)
+            result = results.get(record.download_url)
+            if not result or result.error:
+                continue
+            element = xml_backend.copy_element(element)
+            url = element.find('download_url')
+            url.text = self.archive_url(result)
+            mirrored.append(element)
+        return mirrored
+
+    def sync(self, qgis_versions: Sequence[str]) -> List[MergeReport]:
+        """ Update the mirror for all QGIS versions.
+
+        Catalogs are merged in the mirror, a plugin is updated only if it has changed upstream. A plugin whose
+        archive could not be downloaded is not added.
+        """
+        catalogs = self.fetch_catalogs(qgis_versions)
+        records = [PluginRecord.from_element(element) for root in catalogs.values() for element in root]
+        print(f"{len(records)} plugin(s) in {len(catalogs)} upstream catalog(s)")
+
+        results = self.sync_archives(records)
+        self.failed = [result for result in results.values() if result.error]
+        for result in results.values():
+            if result.error:
+                print(f"The archive {result.url} has not been downloaded : {result.error}")
+            elif result.downloaded:
+                print(f"Downloaded {result.url}, {result.size} bytes")
+
+        reports = []
+        for version, root in catalogs.items():
+            upstream = self.upstream.format(version=version)
+            merger = Merger(
+                [(upstream, self.rewrite(root, results))], str(self.catalog_path(version)), **self.options)
+            reports.extend(merger.merge())
+        return reports
@@ -0,0 +1,118 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import fnmatch
+
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import (
+    Plugin,
+    PluginRecord,
+    is_experimental,
+    parse_version,
+    plugin_from_element,
+)
+from qgis_plugin_repo.fetch import fetcher
+from qgis_plugin_repo.tools import is_url
+from qgis_plugin_repo.xml_backend import ET
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_FIELDS = ('name', 'version', 'experimental')
+
+
+def iter_chunks(uri: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """ Read the raw content of a file or a remote URL, chunk by chunk. """
+    if is_url(uri):
+        yield from fetcher().stream(uri, chunk_size)
+        return
+
+    with open(Path(uri).absolute(), 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_elements(uri: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> Iterator[ET.Element]:
+    """ Yield each plugin element as soon as it is closed in the XML.
+
+    The content is parsed incrementally, while it is downloaded. The element is freed after it has been
+    yielded, it must not be kept by the caller.
+    """
+    parser = xml_backend.pull_parser(events=('start', 'end'))
+    root = None
+    depth = 0
+    for chunk in iter_chunks(uri, chunk_size):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                yield element
+                # Drop the plugin and its children, nothing is kept in memory
+                element.clear()
+                root.clear()
+
+    parser.close()
+
+
+def iter_plugins(uri: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> Iterator[Plugin]:
+    """ Yield the plugins of an XML file or a remote URL, without loading the whole catalog. """
+    for element in iter_elements(uri, chunk_size):
+        yield plugin_from_element(element)
+
+
+def element_field(element: ET.Element, field: str) -> Union[str, bool, None]:
+    """ Value of a field of a plugin element, from its attributes or from a child element. """
+    if field == 'experimental':
+        return is_experimental(element)
+    if field in ('name', 'version'):
+        return element.attrib[field]
+    value = element.findtext(field)
+    if value is None:
+        return element.attrib.get(field)
+    return value.strip()
+
+
+def name_matches(name: str, pattern: Optional[str]) -> bool:
+    """ If the plugin name matches the glob pattern, case insensitive. """
+    return not pattern or fnmatch.fnmatchcase(name.lower(), pattern.lower())
+
+
+def iter_records(
+        uri: Union[str, Path],
+        fields: List[str] = DEFAULT_FIELDS,
+        name: Optional[str] = None,
+        experimental: Optional[bool] = None,
+        qgis_version: Optional[str] = None,
+        chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict]:
+    """ Yield the fields of each plugin matching filters, as soon as it is parsed.
+
+    The name is a glob pattern. With a QGIS version, only plugins compatible with this version are kept.
+    """
+    version = parse_version(qgis_version) if qgis_version else None
+    for element in iter_elements(uri, chunk_size):
+        if not name_matches(element.attrib['name'], name):
+            continue
+        record = PluginRecord.from_element(element)
+        if experimental is not None and record.experimental != experimental:
+            continue
+        if version:
+            minimum, maximum = record.qgis_versions
+            try:
+                if not parse_version(minimum) <= version <= parse_version(maximum, upper=True):
+                    continue
+            except ValueError:
+                # Not a valid QGIS version in the plugin
+                continue
+        yield {field: element_field(element, field) for field in fields}
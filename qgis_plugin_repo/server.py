@@ -0,0 +1,264 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hmac
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.dispatcher import Dispatcher, ParsedInput, VersionIndex
+from qgis_plugin_repo.fetch import fetcher
+from qgis_plugin_repo.merger import Merger, MergeReport
+from qgis_plugin_repo.tools import file_signature
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_DEBOUNCE = 2.0
+MAX_PAYLOAD_SIZE = 64 * 1024
+
+
+class PayloadError(Exception):
+    """ The payload of a request can not be merged. """
+
+
+class MergeService:
+
+    """ Queue of inputs to merge, with the destination catalogs kept parsed in memory.
+
+    Inputs for the same catalog are coalesced, the catalog is written once, after a quiet period of debounce
+    seconds without any new input for it. All merges are done in a single thread.
+    """
+
+    def __init__(
+            self, outputs_uri: List[str], debounce: float = DEFAULT_DEBOUNCE,
+            on_merged: Optional[Callable[[Path, List[ParsedInput]], None]] = None,
+            on_failed: Optional[Callable[[Path, List[ParsedInput], BaseException], None]] = None, **options):
+        """ Constructor, options are given to each Merger.
+
+        The callback on_merged is called with a catalog and its inputs, once they have been merged in it. The
+        callback on_failed is called with a catalog, its inputs and the error if they can not be merged, they
+        are not queued again.
+        """
+        self.outputs_uri = [Path(f) for f in outputs_uri]
+        self.index = VersionIndex(self.outputs_uri)
+        self.debounce = debounce
+        self.on_merged = on_merged
+        self.on_failed = on_failed
+        self.options = options
+        self.reports: List[MergeReport] = []
+
+        self._mergers: Dict[Path, Merger] = {}
+        # Size and modification time of each catalog after the last write, to detect external changes
+        self._stats: Dict[Path, Tuple[int, int]] = {}
+        self._pending: Dict[Path, List[ParsedInput]] = {}
+        self._deadlines: Dict[Path, float] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        """ Start the thread doing merges. """
+        self._thread.start()
+
+    def close(self) -> None:
+        """ Write every pending input and stop the thread. """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join()
+        else:
+            self.flush(list(self._pending))
+
+    def submit(self, input_uri: str, input_parser: xml_backend.Element) -> List[Path]:
+        """ Queue an input already parsed, return the catalogs which will be edited.
+
+        With many catalogs, each plugin of the input is merged in catalogs according to its QGIS versions.
+        """
+        if len(self.outputs_uri) == 1:
+            routes = {self.outputs_uri[0]: input_parser}
+        else:
+            routes = Dispatcher(input_uri, self.outputs_uri, input_parser, self.index).route()
+
+        with self._condition:
+            deadline = time.monotonic() + self.debounce
+            for output_uri, root in routes.items():
+                self._pending.setdefault(output_uri, []).append((input_uri, root))
+                self._deadlines[output_uri] = deadline
+            self._condition.notify()
+        return list(routes)
+
+    def pending(self) -> int:
+        """ Number of inputs waiting to be merged. """
+        with self._condition:
+            return sum(len(inputs) for inputs in self._pending.values())
+
+    def run(self) -> None:
+        """ Merge inputs when their catalog is quiet, until the service is closed. """
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = [
+                        uri for uri, deadline in self._deadlines.items() if deadline <= now or self._stopping]
+                    if due or self._stopping:
+                        break
+                    timeout = min(self._deadlines.values()) - now if self._deadlines else None
+                    self._condition.wait(timeout)
+                stopping = self._stopping
+
+            self.flush(due)
+            if stopping:
+                return
+
+    def flush(self, outputs: List[Path]) -> None:
+        """ Merge pending inputs in the given catalogs now. """
+        for output_uri in outputs:
+            with self._condition:
+                inputs = self._pending.pop(output_uri, [])
+                self._deadlines.pop(output_uri, None)
+            if not inputs:
+                continue
+
+            try:
+                self.reports.extend(self.merge(output_uri, inputs))
+            except (Exception, SystemExit) as e:
+                # The service keeps running for the next inputs
+                print(f"Error while editing {output_uri.name} : {e}")
+                self._mergers.pop(output_uri, None)
+                if self.on_failed:
+                    self.on_failed(output_uri, inputs, e)
+                continue
+
+            if self.on_merged:
+                self.on_merged(output_uri, inputs)
+
+    def merge(self, output_uri: Path, inputs: List[ParsedInput]) -> List[MergeReport]:
+        """ Merge inputs in a catalog, it is parsed again only if it has been changed on the disk. """
+        print(f"Editing {output_uri.name} with {len(inputs)} input(s)")
+        merger = self._mergers.get(output_uri)
+        if merger is not None and self._stats.get(output_uri) != file_signature(output_uri):
+            merger = None
+
+        if merger is None:
+            merger = Merger(inputs, output_uri, **self.options)
+            self._mergers[output_uri] = merger
+            reports = merger.merge()
+        else:
+            reports = merger.merge(inputs)
+
+        self._stats[output_uri] = file_signature(output_uri)
+        return reports
+
+
+def read_payload(content: bytes) -> Tuple[str, str, str]:
+    """ Name, version and URL of the payload, as sent by repository-dispatch.
+
+    The "client_payload" of a GitHub event is accepted as well.
+    """
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        raise PayloadError("The payload is not valid JSON")
+    if isinstance(payload, dict) and isinstance(payload.get('client_payload'), dict):
+        payload = payload['client_payload']
+    if not isinstance(payload, dict):
+        raise PayloadError("The payload must be a JSON object")
+
+    values = []
+    for key in ('name', 'version', 'url'):
+        value = payload.get(key)
+        if not isinstance(value, str) or not value:
+            raise PayloadError(f"The key \"{key}\" is missing in the payload")
+        values.append(value)
+    if not values[2].startswith(('http://', 'https://')):
+        raise PayloadError(f"The URL {values[2]} is not a valid URL")
+    return values[0], values[1], values[2]
+
+
+class MergeHandler(BaseHTTPRequestHandler):
+
+    """ POST a payload to queue a merge, GET to know the number of pending inputs. """
+
+    def send_json(self, status: int, data: dict) -> None:
+        """ Send a JSON response. """
+        content = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def authorized(self) -> bool:
+        """ If the token of the request is the expected one, if any. """
+        token = self.server.token
+        if not token:
+            return True
+        header = self.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode('utf8'), f'Bearer {token}'.encode('utf8'))
+
+    def do_GET(self):
+        self.send_json(200, {'pending': self.server.service.pending()})
+
+    def do_POST(self):
+        if not self.authorized():
+            self.send_json(401, {'error': "Invalid token"})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_PAYLOAD_SIZE:
+            self.send_json(413, {'error': "The payload is too large"})
+            return
+
+        try:
+            name, version, url = read_payload(self.rfile.read(length))
+            # Not the content downloaded once per run, the same URL can be sent many times
+            input_parser = xml_backend.fromstring(fetcher().download(url))
+            outputs = self.server.service.submit(url, input_parser)
+        except PayloadError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except requests.exceptions.RequestException as e:
+            self.send_json(502, {'error': f"The URL can not be downloaded : {e}"})
+            return
+        except xml_backend.ParseError:
+            self.send_json(422, {'error': f"Invalid XML file content {url}"})
+            return
+        except Exception as e:
+            # The client is answered anyway, the server keeps running
+            print(f"Error while queuing a payload : {e}")
+            self.send_json(500, {'error': f"Internal error : {e}"})
+            return
+
+        print(f"Queued {name} {version} from {url}")
+        self.send_json(202, {'name': name, 'version': version, 'outputs': [f.name for f in outputs]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MergeServer(ThreadingHTTPServer):
+
+    """ HTTP server receiving payloads, with its merge service. """
+
+    daemon_threads = True
+
+    def __init__(self, service: MergeService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 token: Optional[str] = None):
+        """ Constructor. """
+        super().__init__((host, port), MergeHandler)
+        self.service = service
+        self.token = token
+
+    def url(self) -> str:
+        """ URL of the server. """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
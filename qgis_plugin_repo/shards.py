@@ -0,0 +1,195 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence, Union
+from urllib.parse import quote
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import PluginIndex, PluginRecord, is_experimental
+from qgis_plugin_repo.compress import compressed_path, compressing_writer
+from qgis_plugin_repo.dispatcher import ParsedInput, VersionIndex
+from qgis_plugin_repo.lock import FileLock
+from qgis_plugin_repo.merger import MergeReport
+from qgis_plugin_repo.splice import serialize_element
+from qgis_plugin_repo.tools import atomic_write
+
+FRAGMENT_SUFFIX = '.xml'
+MANIFEST = 'manifest.json'
+CHUNK_SIZE = 64 * 1024
+
+# Same start and end of the catalog as the ones written by the Merger
+CATALOG_HEAD = b'<plugins>\n'
+CATALOG_TAIL = b'</plugins>\n'
+
+
+class ShardStore:
+
+    """ Catalog stored as one fragment file per plugin name and experimental flag.
+
+    A merge writes only the fragments of the plugins it adds or updates. Catalogs are built from the fragments
+    afterwards, only if one of their fragments has changed since the last build.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """ Constructor, the directory is created if needed. """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def fragment_path(self, name: str, experimental: bool) -> Path:
+        """ Path of the fragment of a plugin, the name is escaped to be a valid file name. """
+        flag = 'experimental' if experimental else 'stable'
+        return self.directory / f"{quote(name, safe='')}@{flag}{FRAGMENT_SUFFIX}"
+
+    def fragments(self) -> List[Path]:
+        """ All fragments, sorted by plugin name. """
+        return sorted(
+            path for path in self.directory.glob(f'*@*{FRAGMENT_SUFFIX}') if not path.name.startswith('.'))
+
+    def write(self, element: xml_backend.Element) -> bool:
+        """ Write the fragment of a plugin, False if it has not changed. """
+        path = self.fragment_path(element.attrib['name'], is_experimental(element))
+        content = serialize_element(element, '\t')
+        if path.exists() and path.read_bytes() == content:
+            return False
+        atomic_write(path, content)
+        return True
+
+    def merge(self, inputs: List[ParsedInput]) -> List[MergeReport]:
+        """ Write fragments of plugins of all inputs. """
+        reports = []
+        for input_uri, input_parser in inputs:
+            print(f"with {input_uri}")
+            report = MergeReport(input_uri, self.directory, [], [])
+            input_index = PluginIndex(input_parser)
+            for record in input_index.records():
+                plugin = record.plugin
+                existed = self.fragment_path(plugin.name, plugin.experimental).exists()
+                if not self.write(record.element):
+                    continue
+                if existed:
+                    print(f"Updating previous {plugin.name} {plugin.experimental}")
+                    report.updated.append(plugin)
+                else:
+                    print(f"Adding new version {plugin.name} {plugin.experimental} {plugin.version}")
+                    report.added.append(plugin)
+            if not report.added and not report.updated:
+                print("No update is necessary")
+            reports.append(report)
+        return reports
+
+    def split(self, catalog: Union[str, Path]) -> int:
+        """ Write fragments from an existing catalog, return the number of fragments written. """
+        root = xml_backend.parse(Path(catalog).absolute()).getroot()
+        index = PluginIndex(root)
+        return sum(self.write(record.element) for record in index.records())
+
+    def read_manifest(self) -> dict:
+        """ State of the last build. """
+        try:
+            manifest = json.loads((self.directory / MANIFEST).read_text(encoding='utf8'))
+        except (OSError, ValueError):
+            return {'fragments': {}, 'outputs': {}}
+        return manifest
+
+    def scan(self, manifest: dict) -> Dict[str, dict]:
+        """ Hash and QGIS versions of each fragment, a fragment is read only if it has changed. """
+        fragments = {}
+        for path in self.fragments():
+            stat = path.stat()
+            known = manifest['fragments'].get(path.name)
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                fragments[path.name] = known
+                continue
+
+            content = path.read_bytes()
+            minimum, maximum = PluginRecord.from_element(xml_backend.fromstring(content)).qgis_versions
+            fragments[path.name] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'hash': hashlib.sha1(content).hexdigest(),
+                'qgis_minimum_version': minimum,
+                'qgis_maximum_version': maximum,
+            }
+        return fragments
+
+    def route(self, fragments: Dict[str, dict], outputs: List[Path]) -> Dict[Path, List[str]]:
+        """ Fragments of each catalog, all of them for a catalog without a QGIS version in its name. """
+        index = VersionIndex(outputs)
+        routes = {output: [] for output in outputs}
+        versioned = {path for _, _, path in index.entries}
+        for output in outputs:
+            if output not in versioned:
+                routes[output] = sorted(fragments)
+        for name in sorted(fragments):
+            fragment = fragments[name]
+            try:
+                matches = index.lookup(fragment['qgis_minimum_version'], fragment['qgis_maximum_version'])
+            except ValueError:
+                print(f"Invalid QGIS version in {name}, it is only in catalogs without a version")
+                continue
+            for output in matches:
+                routes[output].append(name)
+        return routes
+
+    def assemble(self, output: Path, names: List[str], compress: Sequence[str] = ()) -> None:
+        """ Write a catalog from its fragments, chunk by chunk, without parsing them. """
+        print(f"Building {output} with {len(names)} plugin(s)")
+        with compressing_writer(output, compress) as f:
+            f.write(CATALOG_HEAD)
+            for name in names:
+                f.write(b'\t')
+                with open(self.directory / name, 'rb') as fragment:
+                    while True:
+                        chunk = fragment.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                f.write(b'\n')
+            f.write(CATALOG_TAIL)
+
+    def build(
+            self, outputs: List[Union[str, Path]], workers: int = 1, force: bool = False,
+            compress: Sequence[str] = ()) -> List[Path]:
+        """ Build catalogs whose fragments have changed since the last build, return the catalogs written.
+
+        With compress, compressed copies of each catalog are written next to it, a catalog is built again if
+        one of them is missing.
+        """
+        outputs = [Path(output) for output in outputs]
+        with FileLock(self.directory / MANIFEST):
+            manifest = self.read_manifest()
+            fragments = self.scan(manifest)
+
+            # A catalog is built again only if the list of its fragments or one of them has changed
+            digests = {}
+            changed = []
+            for output, names in self.route(fragments, outputs).items():
+                content = ''.join(f'{name}:{fragments[name]["hash"]}\n' for name in names)
+                digest = hashlib.sha1(content.encode('utf8')).hexdigest()
+                key = str(output.absolute())
+                digests[key] = digest
+                missing = [path for path in [output] + [compressed_path(output, e) for e in compress]
+                           if not path.exists()]
+                if force or missing or manifest['outputs'].get(key) != digest:
+                    changed.append((output, names))
+                else:
+                    print(f"The file {output} is not written, it is already up to date")
+
+            if workers <= 1 or len(changed) <= 1:
+                for output, names in changed:
+                    self.assemble(output, names, compress)
+            else:
+                with ThreadPoolExecutor(max_workers=min(workers, len(changed))) as executor:
+                    list(executor.map(lambda item: self.assemble(*item, compress), changed))
+
+            manifest['fragments'] = fragments
+            manifest['outputs'].update(digests)
+            atomic_write(
+                self.directory / MANIFEST, json.dumps(manifest, indent=1, sort_keys=True).encode('utf8'))
+        return [output for output, _ in changed]
@@ -0,0 +1,181 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import hashlib
+import json
+
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.catalog import (
+    Plugin,
+    PluginKey,
+    element_hash,
+    plugin_from_element,
+)
+from qgis_plugin_repo.splice import scan_offsets
+from qgis_plugin_repo.tools import atomic_write
+from qgis_plugin_repo.xml_backend import ET
+
+SIDECAR_SUFFIX = '.idx'
+SIDECAR_FORMAT = 1
+
+SidecarRecord = namedtuple(
+    'SidecarRecord', ['name', 'experimental', 'version', 'content_hash', 'start', 'end'])
+
+
+class Sidecar:
+
+    """ Pre-parsed index of a catalog file, stored next to it, for instance plugins.xml.idx.
+
+    It has the plugins of the catalog, their content fingerprints and their byte offsets. It is keyed by the
+    size, the modification time and the content hash of the catalog, and it is rebuilt when it is stale.
+    """
+
+    def __init__(
+            self, path: Path, records: List[SidecarRecord], root_start: int, size: int, mtime_ns: int,
+            content_hash: str):
+        """ Constructor. """
+        self.path = Path(path)
+        self.records = records
+        self.root_start = root_start
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_hash = content_hash
+        self._keys = {}
+        for record in records:
+            self._keys.setdefault((record.name, record.experimental), record)
+
+    @staticmethod
+    def sidecar_path(path: Path) -> Path:
+        """ Path of the sidecar for a catalog. """
+        path = Path(path)
+        return path.with_name(path.name + SIDECAR_SUFFIX)
+
+    @classmethod
+    def build(
+            cls, path: Path, content: Optional[bytes] = None, root: Optional[ET.Element] = None,
+            known_hashes: Optional[Dict[PluginKey, str]] = None) -> 'Sidecar':
+        """ Build the sidecar of a catalog.
+
+        The content and the parsed root element can be given if they are already known, as well as content
+        fingerprints of unchanged plugins. The content is scanned for the offsets of plugins, use written when
+        they are already known.
+        """
+        path = Path(path)
+        if content is None:
+            content = path.read_bytes()
+        if root is None:
+            root = xml_backend.fromstring(content)
+        # Only the first plugin of a key is looked up, like in the PluginIndex
+        known_hashes = dict(known_hashes or {})
+
+        ranges, root_start = scan_offsets(content)
+        records = []
+        for element, (start, end) in zip(root, ranges):
+            plugin = plugin_from_element(element)
+            key = (plugin.name, plugin.experimental)
+            content_hash = known_hashes.pop(key, None) or element_hash(element)
+            records.append(SidecarRecord(*plugin, content_hash, start, end))
+
+        stat = path.stat()
+        return cls(
+            path, records, root_start, stat.st_size, stat.st_mtime_ns, hashlib.sha1(content).hexdigest())
+
+    def written(
+            self, content: bytes, ranges: List[Tuple[int, int]],
+            changed: Dict[int, ET.Element]) -> 'Sidecar':
+        """ The sidecar once spliced content has been written in the catalog, without scanning it.
+
+        Ranges are the offsets of plugins in the new content, changed elements are given by position. Records
+        of other plugins are kept, with their new offsets.
+        """
+        records = []
+        for index, (start, end) in enumerate(ranges):
+            element = changed.get(index)
+            if element is None:
+                records.append(self.records[index]._replace(start=start, end=end))
+            else:
+                plugin = plugin_from_element(element)
+                records.append(SidecarRecord(*plugin, element_hash(element), start, end))
+
+        stat = self.path.stat()
+        return Sidecar(
+            self.path, records, self.root_start, stat.st_size, stat.st_mtime_ns,
+            hashlib.sha1(content).hexdigest())
+
+    @classmethod
+    def read(cls, path: Path) -> Optional['Sidecar']:
+        """ Read the sidecar of a catalog, None if it does not exist or if it is invalid. """
+        sidecar_path = cls.sidecar_path(path)
+        try:
+            data = json.loads(sidecar_path.read_text(encoding='utf8'))
+        except (OSError, ValueError):
+            return None
+        if data.get('format') != SIDECAR_FORMAT:
+            return None
+
+        return cls(
+            path,
+            [SidecarRecord(*record) for record in data['plugins']],
+            data['root_start'],
+            data['size'],
+            data['mtime_ns'],
+            data['content_hash'],
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'Sidecar':
+        """ The sidecar of a catalog, rebuilt and saved if it is missing or stale. """
+        sidecar = cls.read(path)
+        if sidecar is None or not sidecar.is_fresh():
+            sidecar = cls.build(path)
+            sidecar.save()
+        return sidecar
+
+    def is_fresh(self) -> bool:
+        """ If the sidecar matches the catalog file. """
+        stat = self.path.stat()
+        if stat.st_size != self.size:
+            return False
+        if stat.st_mtime_ns == self.mtime_ns:
+            return True
+
+        # Same size but touched, check the content itself
+        if hashlib.sha1(self.path.read_bytes()).hexdigest() != self.content_hash:
+            return False
+        self.mtime_ns = stat.st_mtime_ns
+        self.save()
+        return True
+
+    def save(self) -> None:
+        """ Write the sidecar next to the catalog. """
+        data = {
+            'format': SIDECAR_FORMAT,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'content_hash': self.content_hash,
+            'root_start': self.root_start,
+            'fields': list(SidecarRecord._fields),
+            'plugins': [list(record) for record in self.records],
+        }
+        atomic_write(self.sidecar_path(self.path), json.dumps(data, separators=(',', ':')).encode('utf8'))
+
+    def plugins(self) -> List[Plugin]:
+        """ List of plugins in the catalog. """
+        return [Plugin(record.name, record.experimental, record.version) for record in self.records]
+
+    def content_hashes(self) -> Dict[PluginKey, str]:
+        """ Content fingerprints of plugins, by name and experimental flag. """
+        return {key: record.content_hash for key, record in self._keys.items()}
+
+    def is_unchanged(self, element: ET.Element) -> bool:
+        """ If the catalog has a plugin with the same key and exactly the same content. """
+        plugin = plugin_from_element(element)
+        record = self._keys.get((plugin.name, plugin.experimental))
+        if record is None or record.version != plugin.version:
+            return False
+        return record.content_hash == element_hash(element)
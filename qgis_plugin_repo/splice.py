@@ -0,0 +1,294 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import mmap
+import re
+import xml.parsers.expat
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.xml_backend import ET
+
+# Bytes after the name in an end tag
+END_TAG_NEXT = (b'>', b' ', b'\t', b'\r', b'\n')
+
+# A start tag, with its name and a slash if the element is empty, ">" is allowed in attribute values
+START_TAG = re.compile(rb'''<([^\s/>!?]+)(?:[^>"'/]|/(?!>)|"[^"]*"|'[^']*')*(/?)>''')
+
+# Sections whose content is not markup, with their end
+SECTIONS = ((b'<!--', b'-->'), (b'<![CDATA[', b']]>'), (b'<?', b'?>'))
+SECTION_MARKERS = (b'!', b'?')
+
+
+def scan_offsets(data) -> Tuple[List[Tuple[int, int]], int]:
+    """ Byte offsets of each plugin element in the XML content.
+
+    Return the list of (start, end) offsets of the children of the root element, and the offset just after the
+    start tag of the root element, or of "/>" if the root element is empty. The end offset of an element is
+    the byte index just after its end tag.
+
+    Only the tags of the root and of its children are looked for. The content is parsed with expat only if it
+    is not a plain catalog, with a document type or nested elements having the name of a plugin element.
+    """
+    offsets = _find_offsets(data)
+    if offsets is not None:
+        return offsets
+    return _parse_offsets(data)
+
+
+def _skip_section(data, position: int) -> Optional[int]:
+    """ The position after a comment, a CDATA section or a processing instruction, None if it is not one. """
+    if data[position + 1:position + 2] not in SECTION_MARKERS:
+        return None
+    for start, end in SECTIONS:
+        if data[position:position + len(start)] == start:
+            index = data.find(end, position + len(start))
+            if index < 0:
+                raise xml.parsers.expat.ExpatError(f'Unclosed section at {position}')
+            return index + len(end)
+    return None
+
+
+def _first_section(data, start: int, end: int) -> int:
+    """ Position of the first comment, CDATA section or processing instruction between start and end. """
+    first = data.find(b'<!', start, end)
+    instruction = data.find(b'<?', start, first if first >= 0 else end)
+    return instruction if instruction >= 0 else first
+
+
+def _element_end(data, position: int, name: bytes, sections: bool = True) -> Optional[int]:
+    """ The position after the end tag of an element, from the end of its start tag.
+
+    Without sections, the content has no comment, no CDATA section and no processing instruction. None if an
+    element having the same name is nested, the end tag can not be found without parsing.
+    """
+    start_tag = b'<' + name
+    end_tag = b'</' + name
+    while True:
+        candidate = data.find(end_tag, position)
+        if candidate < 0:
+            return None
+        section = _first_section(data, position, candidate) if sections else -1
+        if data.find(start_tag, position, candidate if section < 0 else section) >= 0:
+            return None
+        if section >= 0:
+            # The end tag may be in the section, which is skipped
+            position = _skip_section(data, section)
+            continue
+
+        after = candidate + len(end_tag)
+        if data[after:after + 1] in END_TAG_NEXT:
+            return data.find(b'>', after) + 1
+        position = after
+
+
+def _find_offsets(data) -> Optional[Tuple[List[Tuple[int, int]], int]]:
+    """ Offsets found by looking only for the tags of the root and of its children, None to parse it. """
+    # Declaration, comments and processing instructions before the root
+    position = 0
+    while True:
+        position = data.find(b'<', position)
+        if position < 0:
+            return None
+        after = _skip_section(data, position)
+        if after is None:
+            break
+        position = after
+
+    match = START_TAG.match(data, position)
+    if not match:
+        # A document type
+        return None
+    if match.group(2):
+        # An empty root element, <plugins/>, without any plugin
+        return [], match.end() - 2
+    root_start = position = match.end()
+    # Most catalogs have no section at all, they are not looked for in each element then
+    sections = data.find(b'<!', root_start) >= 0 or data.find(b'<?', root_start) >= 0
+
+    ranges = []
+    while True:
+        position = data.find(b'<', position)
+        if position < 0:
+            return None
+        after = _skip_section(data, position)
+        if after is not None:
+            position = after
+            continue
+        if data[position:position + 2] == b'</':
+            # The end of the root element
+            return ranges, root_start
+
+        match = START_TAG.match(data, position)
+        if not match:
+            return None
+        end = match.end() if match.group(2) else _element_end(data, match.end(), match.group(1), sections)
+        if end is None:
+            return None
+        ranges.append((position, end))
+        position = end
+
+
+def _parse_offsets(data) -> Tuple[List[Tuple[int, int]], int]:
+    """ Offsets from expat, only start and end tags call back into Python.
+
+    The handler of the text is set only until the start tag of the root element is closed.
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    ranges = []
+    depth = 0
+    root_start = None
+
+    def close_root(*args):
+        nonlocal root_start
+        if depth >= 1 and root_start is None:
+            root_start = parser.CurrentByteIndex
+            parser.CharacterDataHandler = None
+
+    def start(name, attributes):
+        nonlocal depth
+        close_root()
+        depth += 1
+        if depth == 1:
+            # The start tag of the root ends with the next token
+            parser.CharacterDataHandler = close_root
+        elif depth == 2:
+            ranges.append((parser.CurrentByteIndex, None))
+
+    def end_tag(name) -> bool:
+        """ If the current token is the end tag of the element, not the end of an empty element. """
+        index = parser.CurrentByteIndex
+        tag = b'</' + name.encode('utf8')
+        after = index + len(tag)
+        return data[index:after] == tag and data[after:after + 1] in END_TAG_NEXT
+
+    def end(name):
+        nonlocal depth, root_start
+        if depth == 2:
+            index = parser.CurrentByteIndex
+            if end_tag(name):
+                index = data.find(b'>', index) + 1
+            # Otherwise an empty element, <pyqgis_plugin/>, the index is already after it
+            ranges[-1] = (ranges[-1][0], index)
+        elif depth == 1 and end_tag(name):
+            # <plugins></plugins>, without any token inside
+            close_root()
+        elif depth == 1 and root_start is None:
+            # <plugins/>, the index is after it
+            root_start = parser.CurrentByteIndex - 2
+        depth -= 1
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CommentHandler = close_root
+    parser.ProcessingInstructionHandler = close_root
+    parser.Parse(data, True)
+    return ranges, root_start
+
+
+def serialize_element(element: ET.Element, prefix: str) -> bytes:
+    """ Serialize a single plugin element, indented according to the whitespace before it in the file. """
+    element = xml_backend.copy_element(element)
+    if prefix:
+        xml_backend.indent(element, space=prefix, level=1)
+    else:
+        xml_backend.indent(element, space="\t", level=0)
+    return xml_backend.tostring(element)
+
+
+class SplicedCatalog:
+
+    """ Byte offsets of the plugin elements in a catalog file, to rewrite only changed elements.
+
+    Every other byte of the file, including the formatting of untouched plugins, is copied unchanged.
+    """
+
+    def __init__(
+            self, path: Path, ranges: Optional[List[Tuple[int, int]]] = None,
+            root_start: Optional[int] = None):
+        """ Constructor, the file is scanned through a memory map if offsets are not given. """
+        self.path = Path(path)
+        self.size = self.path.stat().st_size
+        self.new_ranges: List[Tuple[int, int]] = []
+        if ranges is not None:
+            self.ranges, self.root_start = ranges, root_start
+            return
+
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            self.ranges, self.root_start = scan_offsets(data)
+
+    @classmethod
+    def from_file(cls, path: Path) -> Optional['SplicedCatalog']:
+        """ Scan the file, None if the file can not be spliced. """
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(100).lower()
+            if head.startswith(b'<?xml') and b'encoding' in head and b'utf-8' not in head:
+                # Only UTF-8 catalogs are spliced
+                return None
+            return cls(path)
+        except (ValueError, xml.parsers.expat.ExpatError):
+            return None
+
+    def prefix(self, data, index: int) -> str:
+        """ Whitespace on the line before the element, used as the indentation unit. """
+        start = self.ranges[index][0]
+        line_start = data.rfind(b'\n', 0, start) + 1
+        prefix = bytes(data[line_start:start])
+        return prefix.decode('utf8') if not prefix.strip() else ''
+
+    def splice(self, replaced: Dict[int, ET.Element], appended: List[ET.Element]) -> Optional[bytes]:
+        """ The new content of the file, with replaced elements by position and appended elements.
+
+        None if the file has changed since it has been scanned, or if its root element is empty. Offsets in
+        the new content are kept in new_ranges, the file does not need to be scanned again once it is written.
+        """
+        if self.path.stat().st_size != self.size:
+            return None
+        if not self.ranges and appended:
+            with open(self.path, 'rb') as f:
+                f.seek(self.root_start)
+                if f.read(2) == b'/>':
+                    # Elements can not be inserted in <plugins/>, the whole file is written
+                    return None
+
+        chunks = []
+        # Offsets of elements in the new content, shifted by the size change of the elements before
+        self.new_ranges = []
+        shift = 0
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position = 0
+            for index in sorted(replaced):
+                start, end = self.ranges[index]
+                before = self.ranges[len(self.new_ranges):index]
+                self.new_ranges.extend((s + shift, e + shift) for s, e in before)
+                element = serialize_element(replaced[index], self.prefix(data, index))
+                chunks.append(data[position:start])
+                chunks.append(element)
+                self.new_ranges.append((start + shift, start + shift + len(element)))
+                shift += len(element) - (end - start)
+                position = end
+            self.new_ranges.extend((s + shift, e + shift) for s, e in self.ranges[len(self.new_ranges):])
+
+            # New elements are inserted after the last one, with the same indentation
+            insert = self.ranges[-1][1] if self.ranges else self.root_start
+            prefix = self.prefix(data, len(self.ranges) - 1) if self.ranges else '\t'
+            chunks.append(data[position:insert])
+            offset = insert + shift
+            for element in appended:
+                element = serialize_element(element, prefix)
+                separator = b'\n' + prefix.encode('utf8')
+                chunks.append(separator + element)
+                offset += len(separator)
+                self.new_ranges.append((offset, offset + len(element)))
+                offset += len(element)
+            chunks.append(data[insert:])
+
+        return b''.join(chunks)
+
+    def written(self) -> 'SplicedCatalog':
+        """ The catalog once the spliced content has been written in the file, without scanning it. """
+        return SplicedCatalog(self.path, self.new_ranges, self.root_start)
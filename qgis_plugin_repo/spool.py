@@ -0,0 +1,100 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import os
+import time
+import uuid
+
+from pathlib import Path
+from typing import List, Union
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.fetch import fetcher
+from qgis_plugin_repo.lock import FileLock
+from qgis_plugin_repo.tools import atomic_write, is_url
+from qgis_plugin_repo.validator import missing_attributes
+
+SPOOL_SUFFIX = '.xml'
+REJECTED = 'rejected'
+
+
+class InvalidInputError(Exception):
+    """ The input can not be merged, it is not queued. """
+
+
+class Spool:
+
+    """ Queue directory of inputs waiting to be merged.
+
+    Each process drops its inputs in the directory, then the process holding the lock of the directory merges
+    every pending input in one pass. Others wait for the lock and find the queue already drained.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        """ Constructor, the directory is created if needed. """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def put(self, input_uri: str) -> Path:
+        """ Copy an input in the queue, downloaded if it is a URL, and return the queued file.
+
+        The input is checked before, an invalid XML or a plugin which can not be merged is never queued.
+        """
+        if is_url(input_uri):
+            content = fetcher().get(input_uri)
+        else:
+            content = Path(input_uri).read_bytes()
+        self.check(input_uri, content)
+
+        # Sorted by arrival time, then unique between processes
+        path = self.directory / f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}{SPOOL_SUFFIX}'
+        atomic_write(path, content)
+        return path
+
+    @staticmethod
+    def check(input_uri: Union[str, Path], content: bytes) -> None:
+        """ Raise InvalidInputError if the input can not be merged, the checks done by the merge itself. """
+        try:
+            root = xml_backend.fromstring(content)
+        except xml_backend.ParseError:
+            raise InvalidInputError(f"Invalid XML file content {input_uri}")
+        for element in root:
+            missing = missing_attributes(element)
+            if missing:
+                plugin = element.attrib.get('name') or element.tag
+                raise InvalidInputError(
+                    f"The plugin {plugin} in {input_uri} has no attribute {', '.join(missing)}.")
+
+    def reject_invalid(self, entries: List[Path]) -> List[Path]:
+        """ Move entries which can not be merged to the rejected directory, return the other ones.
+
+        An entry queued by a previous version, or dropped by hand, must not block the queue.
+        """
+        valid = []
+        for path in entries:
+            try:
+                self.check(path, path.read_bytes())
+            except InvalidInputError as e:
+                rejected = self.directory / REJECTED / path.name
+                rejected.parent.mkdir(exist_ok=True)
+                os.replace(path, rejected)
+                print(f"{e} It is moved to {rejected}")
+                continue
+            valid.append(path)
+        return valid
+
+    def entries(self) -> List[Path]:
+        """ Queued inputs, in arrival order. """
+        return sorted(
+            path for path in self.directory.glob(f'*{SPOOL_SUFFIX}') if not path.name.startswith('.'))
+
+    def lock(self) -> FileLock:
+        """ The lock to take to drain the queue. """
+        return FileLock(self.directory / 'queue')
+
+    @staticmethod
+    def remove(entries: List[Path]) -> None:
+        """ Remove merged inputs from the queue. """
+        for path in entries:
+            path.unlink(missing_ok=True)
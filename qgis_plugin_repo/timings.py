@@ -0,0 +1,107 @@
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import json
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_memory() -> Optional[int]:
+    """ Peak resident memory of the process and of its finished children, in bytes. """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Timings:
+
+    """ Wall time of each phase of the run, with counters such as fetched bytes or the number of plugins.
+
+    A phase can be entered many times, from many threads, its times are added.
+    """
+
+    def __init__(self):
+        """ Constructor. """
+        self.start = time.perf_counter()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """ Measure the wall time of a phase. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name: str, seconds: float, count: int = 1) -> None:
+        """ Add the time spent in a phase. """
+        with self._lock:
+            phase = self.phases.setdefault(name, {'seconds': 0.0, 'count': 0})
+            phase['seconds'] += seconds
+            phase['count'] += count
+
+    def count(self, name: str, value: int = 1) -> None:
+        """ Increment a counter. """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def update(self, other: dict) -> None:
+        """ Add the phases and the counters of another run, for instance from another process. """
+        for name, phase in other.get('phases', {}).items():
+            self.add_phase(name, phase['seconds'], phase['count'])
+        for name, value in other.get('counters', {}).items():
+            self.count(name, value)
+
+    def as_dict(self) -> dict:
+        """ Timings of the run, as they are written in JSON. """
+        with self._lock:
+            return {
+                'total': time.perf_counter() - self.start,
+                'phases': {name: dict(phase) for name, phase in self.phases.items()},
+                'counters': dict(self.counters),
+                'peak_memory': peak_memory(),
+            }
+
+    def write(self, path: str) -> None:
+        """ Write timings as JSON, in a file or on stderr with "-". """
+        content = json.dumps(self.as_dict(), indent=2)
+        if path == '-':
+            print(content, file=sys.stderr)
+            return
+
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(content + '\n')
+
+
+_timings = Timings()
+
+
+def timings() -> Timings:
+    """ The timings of the whole run. """
+    return _timings
+
+
+def reset() -> Timings:
+    """ Start new timings, for instance in a worker process. """
+    global _timings
+    _timings = Timings()
+    return _timings
@@ -1,5 +1,10 @@
+import glob
+import os
+import uuid
+
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 __copyright__ = 'Copyright 2022, 3Liz'
@@ -22,3 +27,70 @@ def is_url(uri: Union[Path, str]) -> bool:
         return True
     except Exception:
         return False
+
+
+@contextmanager
+def atomic_writer(path: Path) -> Iterator[BinaryIO]:
+    """ Write a file atomically, through a temporary file renamed at the end, chunk by chunk.
+
+    Readers of the file see either the previous content or the new one, never a partial file. The file is not
+    changed if an error is raised while writing.
+    """
+    path = Path(path)
+    tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(tmp, 'xb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            # Keep the same permissions
+            os.chmod(tmp, path.stat().st_mode)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_write(path: Path, content: bytes) -> None:
+    """ Write a file atomically, through a temporary file renamed at the end. """
+    with atomic_writer(path) as f:
+        f.write(content)
+
+
+def file_signature(path: Path) -> Optional[Tuple[int, int]]:
+    """ Size and modification time of a file, None if it does not exist. """
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def expand_inputs(uris: List[str], manifest: Optional[str] = None) -> List[str]:
+    """ Expand the list of inputs, with glob patterns and an optional manifest file.
+
+    The manifest has one file path or URL per line. Empty lines and lines starting with # are skipped.
+    Relative paths in the manifest are relative to the manifest itself.
+    """
+    uris = list(uris)
+    if manifest:
+        manifest = Path(manifest)
+        for line in manifest.read_text(encoding='utf8').splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            candidate = manifest.parent.joinpath(line)
+            uris.append(str(candidate) if candidate.exists() else line)
+
+    inputs = []
+    for uri in uris:
+        if is_url(uri) and glob.has_magic(uri):
+            matches = sorted(glob.glob(uri))
+            if matches:
+                inputs.extend(matches)
+                continue
+        inputs.append(uri)
+
+    # Keep the order, but without duplicates
+    return list(dict.fromkeys(inputs))
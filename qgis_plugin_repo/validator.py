@@ -0,0 +1,210 @@
+""" Validate catalogs before they are merged, with the line of each error. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import re
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from xml.parsers import expat
+
+from qgis_plugin_repo.catalog import PluginKey
+from qgis_plugin_repo.reader import iter_chunks
+from qgis_plugin_repo.timings import reset, timings
+
+ValidationError = namedtuple('ValidationError', ['uri', 'line', 'name', 'version', 'problem'])
+
+ERROR_FIELDS = list(ValidationError._fields)
+
+ROOT_TAG = 'plugins'
+PLUGIN_TAG = 'pyqgis_plugin'
+REQUIRED_ATTRIBUTES = ('name', 'version')
+REQUIRED_CHILDREN = ('qgis_minimum_version', 'download_url', 'file_name')
+
+# Such as 1.2.0, v3.2.2 or 1.7.1-alpha
+PLUGIN_VERSION = r'v?\d+(\.\d+)*([-+.~_]?[0-9A-Za-z]+)*'
+# Such as 3, 3.28 or 3.28.1
+QGIS_VERSION = r'\d+(\.\d+){0,2}'
+QGIS_VERSION_CHILDREN = ('qgis_minimum_version', 'qgis_maximum_version')
+BOOLEANS = ('True', 'False')
+
+
+def missing_attributes(element, required_attributes: Sequence[str] = REQUIRED_ATTRIBUTES) -> List[str]:
+    """ Required attributes missing or empty in a plugin element, a plugin can not be merged without them. """
+    return [name for name in required_attributes if not element.attrib.get(name, '').strip()]
+
+
+class Validator:
+
+    """ Rules of a catalog, compiled once, then checked on each catalog in a single streaming pass.
+
+    Required attributes and children of each plugin, the syntax of versions and duplicated plugins, by their
+    name and their experimental flag, are checked. The file is read chunk by chunk with expat, whatever the
+    XML backend, to know the line of each plugin. Nothing is kept in memory but the key of each plugin.
+    """
+
+    def __init__(
+            self,
+            required_attributes: Sequence[str] = REQUIRED_ATTRIBUTES,
+            required_children: Sequence[str] = REQUIRED_CHILDREN,
+            plugin_version: str = PLUGIN_VERSION,
+            qgis_version: str = QGIS_VERSION,
+    ):
+        """ Constructor, versions are regular expressions which must match the whole value. """
+        self.required_attributes = tuple(required_attributes)
+        self.required_children = tuple(required_children)
+        self.plugin_version = re.compile(plugin_version)
+        self.qgis_version = re.compile(qgis_version)
+        # Children whose text is checked, the text of other children is not kept
+        self.text_children = frozenset(self.required_children + QGIS_VERSION_CHILDREN + ('experimental',))
+
+    def validate(self, uri: Union[str, Path]) -> List[ValidationError]:
+        """ Errors of a local file or of a remote URL, the XML is validated while it is read. """
+        return _CatalogPass(self, uri).run()
+
+    def check_plugin(
+            self, uri: Union[str, Path], line: int, attributes: Dict[str, str],
+            children: Dict[str, str]) -> List[ValidationError]:
+        """ Errors of a single plugin, from its attributes and the text of its children. """
+        name = attributes.get('name')
+        version = attributes.get('version')
+        errors = []
+
+        def error(problem: str) -> None:
+            errors.append(ValidationError(str(uri), line, name, version, problem))
+
+        for attribute in self.required_attributes:
+            if not attributes.get(attribute, '').strip():
+                error(f'missing attribute {attribute}')
+        if version and not self.plugin_version.fullmatch(version):
+            error(f'invalid version {version}')
+
+        for tag in self.required_children:
+            if not children.get(tag):
+                error(f'missing element {tag}')
+        for tag in QGIS_VERSION_CHILDREN:
+            value = children.get(tag)
+            if value and not self.qgis_version.fullmatch(value):
+                error(f'invalid QGIS version {value} in {tag}')
+        experimental = children.get('experimental')
+        if experimental is not None and experimental not in BOOLEANS:
+            error(f'invalid experimental flag {experimental}')
+        return errors
+
+
+class _CatalogPass:
+
+    """ State of the validation of a single catalog, expat handlers are its methods. """
+
+    def __init__(self, validator: Validator, uri: Union[str, Path]):
+        """ Constructor. """
+        self.validator = validator
+        self.uri = uri
+        self.errors: List[ValidationError] = []
+        # Line of the first plugin of each key
+        self.keys: Dict[PluginKey, int] = {}
+        self.depth = 0
+        self.plugin: Optional[Tuple[int, Dict[str, str]]] = None
+        self.children: Dict[str, str] = {}
+        self.text: Optional[List[str]] = None
+
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def run(self) -> List[ValidationError]:
+        """ Feed the parser chunk by chunk, an invalid XML stops the validation. """
+        try:
+            with timings().phase('validate'):
+                for chunk in iter_chunks(self.uri):
+                    self.parser.Parse(chunk, False)
+                self.parser.Parse(b'', True)
+        except expat.ExpatError as e:
+            self.errors.append(ValidationError(
+                str(self.uri), e.lineno, None, None, f'invalid XML, {expat.ErrorString(e.code)}'))
+        timings().count('validated_plugins', len(self.keys))
+        return self.errors
+
+    def start(self, tag: str, attributes: Dict[str, str]) -> None:
+        """ An element is opened. """
+        self.depth += 1
+        line = self.parser.CurrentLineNumber
+        if self.depth == 1:
+            if tag != ROOT_TAG:
+                self.errors.append(ValidationError(
+                    str(self.uri), line, None, None, f'unexpected root element {tag}'))
+        elif self.depth == 2:
+            if tag == PLUGIN_TAG:
+                self.plugin = (line, attributes)
+                self.children = {}
+            else:
+                self.errors.append(ValidationError(
+                    str(self.uri), line, None, None, f'unexpected element {tag}'))
+        elif self.depth == 3 and self.plugin and tag in self.validator.text_children:
+            self.text = []
+
+    def data(self, text: str) -> None:
+        """ Text of an element, maybe in many parts. """
+        if self.text is not None:
+            self.text.append(text)
+
+    def end(self, tag: str) -> None:
+        """ An element is closed. """
+        if self.depth == 3 and self.text is not None:
+            # The first child is kept if a tag is repeated, like in a PluginRecord
+            self.children.setdefault(tag, ''.join(self.text).strip())
+            self.text = None
+        elif self.depth == 2 and self.plugin:
+            self.end_plugin()
+        self.depth -= 1
+
+    def end_plugin(self) -> None:
+        """ A plugin is closed, all its children are known. """
+        line, attributes = self.plugin
+        self.plugin = None
+        self.errors.extend(self.validator.check_plugin(self.uri, line, attributes, self.children))
+
+        name = attributes.get('name')
+        if not name:
+            return
+        key = (name, self.children.get('experimental') == 'True')
+        first = self.keys.setdefault(key, line)
+        if first != line:
+            flag = 'experimental' if key[1] else 'stable'
+            self.errors.append(ValidationError(
+                str(self.uri), line, name, attributes.get('version'),
+                f'duplicated {flag} plugin, first defined on line {first}'))
+
+
+def _validate(validator: Validator, uri: Union[str, Path]) -> Tuple[List[ValidationError], dict]:
+    """ Validate a catalog in a worker process, with the timings of the worker. """
+    # The worker can be reused, timings are only for this catalog
+    reset()
+    errors = validator.validate(uri)
+    return errors, timings().as_dict()
+
+
+def validate_catalogs(
+        uris: Iterable[Union[str, Path]], workers: int = 1,
+        validator: Optional[Validator] = None) -> List[ValidationError]:
+    """ Errors of many catalogs, validated concurrently in a pool of processes with many workers.
+
+    Errors are sorted like the catalogs, then by line.
+    """
+    validator = validator or Validator()
+    uris = list(uris)
+    if workers <= 1 or len(uris) <= 1:
+        results = [validator.validate(uri) for uri in uris]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=min(workers, len(uris))) as executor:
+            for errors, worker_timings in executor.map(_validate, [validator] * len(uris), uris):
+                timings().update(worker_timings)
+                results.append(errors)
+    return [error for errors in results for error in sorted(errors, key=lambda e: e.line)]
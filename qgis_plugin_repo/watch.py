@@ -0,0 +1,200 @@
+""" Watch a directory, and merge XML files dropped in it. """
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import sys
+import threading
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.dispatcher import ParsedInput
+from qgis_plugin_repo.server import MergeService
+from qgis_plugin_repo.tools import atomic_write, file_signature
+
+APPLIED = '.applied.json'
+WATCH_SUFFIX = '.xml'
+DEFAULT_POLL_INTERVAL = 1.0
+
+# From sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class Inotify:
+
+    """ Events of a directory from inotify, through the C library, only on Linux. """
+
+    def __init__(self, directory: Path):
+        """ Constructor, OSError is raised if inotify is not available. """
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # A file is complete when it is closed after writing, or renamed in the directory
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed on {directory}')
+
+    def wait(self, timeout: float) -> bool:
+        """ Wait for events, return False if there is none before the timeout. """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # Events are not read one by one, the directory is scanned again
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        """ Stop watching. """
+        os.close(self.fd)
+
+
+class Watcher:
+
+    """ Merge XML files dropped in a directory, as soon as they are complete.
+
+    Destination catalogs are kept parsed in memory by a MergeService, writes are debounced. The content hash
+    of each file is recorded in the directory once it has been merged, so a file is never merged again, even
+    after a restart. Inotify is used on Linux, otherwise the directory is polled.
+    """
+
+    def __init__(
+            self, directory: Union[str, Path], service: MergeService,
+            poll_interval: float = DEFAULT_POLL_INTERVAL, inotify: bool = True):
+        """ Constructor, the service is given the callbacks called after each merge. """
+        self.directory = Path(directory)
+        self.service = service
+        self.service.on_merged = self.merged
+        self.service.on_failed = self.failed
+        self.poll_interval = poll_interval
+        self.applied: Set[str] = self.read_applied()
+
+        # Size and modification time of files already seen, they are read again only if they change
+        self._seen: Dict[Path, Tuple[int, int]] = {}
+        # Catalogs still to write for each submitted input, with its content hash
+        self._pending: Dict[str, Tuple[str, Set[Path]]] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self.inotify: Optional[Inotify] = None
+        if inotify:
+            try:
+                self.inotify = Inotify(self.directory)
+            except (OSError, AttributeError) as e:
+                print(f"Inotify is not available, the directory is polled every {poll_interval}s : {e}")
+
+    def read_applied(self) -> Set[str]:
+        """ Content hashes of files already merged. """
+        try:
+            return set(json.loads((self.directory / APPLIED).read_text(encoding='utf8')))
+        except (OSError, ValueError):
+            return set()
+
+    def save_applied(self) -> None:
+        """ Write content hashes of files already merged. """
+        atomic_write(self.directory / APPLIED, json.dumps(sorted(self.applied), indent=1).encode('utf8'))
+
+    def scan(self) -> List[Path]:
+        """ Submit new or changed files of the directory to the service, return the files submitted. """
+        submitted = []
+        for path in sorted(self.directory.glob(f'*{WATCH_SUFFIX}')):
+            if path.name.startswith('.'):
+                continue
+            signature = file_signature(path)
+            if signature is None or self._seen.get(path) == signature:
+                continue
+            self._seen[path] = signature
+
+            content = path.read_bytes()
+            content_hash = hashlib.sha256(content).hexdigest()
+            with self._lock:
+                known = content_hash in self.applied or any(
+                    pending_hash == content_hash for pending_hash, _ in self._pending.values())
+            if known:
+                continue
+
+            try:
+                root = xml_backend.fromstring(content)
+            except xml_backend.ParseError:
+                # Maybe still being written, it is read again when it changes
+                print(f"Invalid XML file content {path}, it is skipped until it changes")
+                continue
+
+            # Unique for this content, if the file is dropped again with another content
+            input_uri = f'{path} ({content_hash[:8]})'
+            # The lock is kept until catalogs are known, the service calls merged() in its own thread
+            with self._lock:
+                outputs = self.service.submit(input_uri, root)
+                self._pending[input_uri] = (content_hash, set(outputs))
+                if not outputs:
+                    print(f"No XML file to edit for {path.name}")
+                    self.done(input_uri)
+            submitted.append(path)
+        return submitted
+
+    def merged(self, output_uri: Path, inputs: List[ParsedInput]) -> None:
+        """ Called by the service when inputs have been merged in a catalog. """
+        with self._lock:
+            for input_uri, _ in inputs:
+                entry = self._pending.get(input_uri)
+                if entry is None:
+                    continue
+                entry[1].discard(output_uri)
+                if not entry[1]:
+                    self.done(input_uri)
+
+    def failed(self, output_uri: Path, inputs: List[ParsedInput], error: BaseException) -> None:
+        """ Called by the service when inputs can not be merged in a catalog.
+
+        Inputs are not recorded as merged, the same file can be dropped again.
+        """
+        with self._lock:
+            for input_uri, _ in inputs:
+                if self._pending.pop(input_uri, None) is not None:
+                    print(f"{input_uri} is not merged in {output_uri.name}, it can be dropped again")
+
+    def done(self, input_uri: str) -> None:
+        """ The input has been merged in all its catalogs, the lock must be taken. """
+        content_hash, _ = self._pending.pop(input_uri)
+        self.applied.add(content_hash)
+        self.save_applied()
+
+    def run(self) -> None:
+        """ Scan the directory each time it changes, until stop is called. """
+        try:
+            self.scan()
+            while not self._stopping.is_set():
+                if self.inotify:
+                    if not self.inotify.wait(self.poll_interval):
+                        continue
+                elif self._stopping.wait(self.poll_interval):
+                    break
+                self.scan()
+        finally:
+            if self.inotify:
+                self.inotify.close()
+                self.inotify = None
+
+    def stop(self) -> None:
+        """ Stop watching, within the poll interval. Pending inputs are merged by closing the service. """
+        self._stopping.set()
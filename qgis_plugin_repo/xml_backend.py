@@ -0,0 +1,98 @@
+""" XML backend, lxml if it is installed, otherwise the standard library.
+
+The backend can be forced with the environment variable QGIS_PLUGIN_REPO_XML_BACKEND, "lxml" or "stdlib".
+"""
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+import copy
+import os
+import sys
+
+from pathlib import Path
+from typing import Union
+
+BACKEND = os.environ.get('QGIS_PLUGIN_REPO_XML_BACKEND', 'lxml').lower()
+
+try:
+    if BACKEND != 'lxml':
+        raise ImportError('The standard library is requested')
+    from lxml import etree as ET
+except ImportError:
+    BACKEND = 'stdlib'
+    import xml.etree.ElementTree as ET
+
+Element = ET.Element
+ParseError = ET.ParseError
+
+
+def _parser():
+    """ A new parser, comments and processing instructions are not kept as plugins. """
+    if BACKEND == 'lxml':
+        return ET.XMLParser(remove_comments=True, remove_pis=True, resolve_entities=False, huge_tree=True)
+    return ET.XMLParser()
+
+
+def parse(path: Union[str, Path]):
+    """ Parse an XML file, return the tree. """
+    return ET.parse(str(path), _parser())
+
+
+def fromstring(content: bytes):
+    """ Parse an XML content, return the root element. """
+    return ET.fromstring(content, _parser())
+
+
+def pull_parser(events=('start', 'end')):
+    """ A parser for incremental parsing. """
+    if BACKEND == 'lxml':
+        return ET.XMLPullParser(events=events, remove_comments=True, remove_pis=True, resolve_entities=False)
+    return ET.XMLPullParser(events=events)
+
+
+def tostring(element, encoding: str = 'utf-8') -> Union[bytes, str]:
+    """ Serialize an element, without an XML declaration and without its tail.
+
+    The content is the same with both backends, an empty element is written "<icon />", like the standard
+    library does.
+    """
+    if BACKEND == 'lxml':
+        content = ET.tostring(element, encoding=encoding, with_tail=False)
+        # ">" is always escaped in text and in attributes, "/>" is only the end of an empty element
+        if isinstance(content, str):
+            return content.replace('/>', ' />')
+        return content.replace(b'/>', b' />')
+
+    tail = element.tail
+    element.tail = None
+    try:
+        return ET.tostring(element, encoding=encoding)
+    finally:
+        element.tail = tail
+
+
+def indent(tree, space: str = "\t", level: int = 0) -> None:
+    """ Indent the tree in place, if the backend is able to. """
+    if BACKEND == 'lxml' or sys.version_info >= (3, 9):
+        ET.indent(tree, space=space, level=level)
+
+
+def copy_element(element):
+    """ A deep copy of the element, detached from its tree. """
+    return copy.deepcopy(element)
+
+
+def replace_element(previous, element) -> None:
+    """ Replace the content of the previous element by the new one, in place.
+
+    The previous element keeps its position and its tail in the tree. Children of the new element are moved.
+    """
+    tail = previous.tail
+    previous.clear()
+    previous.tag = element.tag
+    previous.text = element.text
+    previous.attrib.update(element.attrib)
+    previous.extend(list(element))
+    previous.tail = tail
@@ -62,6 +62,7 @@ setup(
         "Topic :: Scientific/Engineering :: GIS",
     ],
     install_requires=["requests"],
+    extras_require={"lxml": ["lxml"]},
     python_requires=">={vmaj}.{vmin}".format(
         vmaj=python_min_version[0], vmin=python_min_version[1]
     ),
@@ -0,0 +1,73 @@
+import os
+import shutil
+import unittest
+
+from pathlib import Path
+
+from benchmarks.local_server import LocalServer
+from qgis_plugin_repo.cache import HttpCache
+from qgis_plugin_repo.fetch import Fetcher
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("cache_tmp")
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_revalidation(self):
+        """ Test a second run is served from the disk, after a conditional request. """
+        with LocalServer() as server:
+            url = server.url("plugins-3.10.xml")
+            content = Fetcher(timeout=5, cache=HttpCache(self.directory)).get(url)
+            self.assertIsNotNone(HttpCache(self.directory).metadata(url))
+
+            # A new run, with a new fetcher
+            cache = HttpCache(self.directory)
+            self.assertIn('If-Modified-Since', cache.validators(url))
+            self.assertEqual(content, Fetcher(timeout=5, cache=cache).get(url))
+            self.assertEqual(content, b''.join(Fetcher(timeout=5, cache=cache).stream(url, 16)))
+
+            self.assertListEqual([200, 304, 304], server.statuses)
+
+    def test_stream_stored(self):
+        """ Test a streamed download is stored in the cache. """
+        with LocalServer() as server:
+            url = server.url("plugins-3.10.xml")
+            cache = HttpCache(self.directory)
+            content = b''.join(Fetcher(timeout=5, cache=cache).stream(url, 16))
+            self.assertEqual(content, cache.read(url))
+
+    def test_created_when_stored(self):
+        """ Test the directory is created only when a first entry is stored. """
+        cache = HttpCache(self.directory)
+        self.assertIsNone(cache.metadata('http://first'))
+        self.assertDictEqual({}, cache.validators('http://first'))
+        self.assertFalse(self.directory.exists())
+        cache.store('http://first', {'ETag': '"1"'}, b'0123456789')
+        self.assertEqual(b'0123456789', cache.read('http://first'))
+
+    def test_eviction(self):
+        """ Test the least recently used entries are removed. """
+        cache = HttpCache(self.directory, max_size=30)
+        headers = {'ETag': '"1"'}
+        cache.store('http://first', headers, b'0123456789')
+        cache.store('http://second', headers, b'0123456789')
+        # The first entry is used, the second one is then the least recently used
+        meta = next(p for p in self.directory.glob('*.json') if b'second' in p.read_bytes())
+        os.utime(meta, (0, 0))
+        cache.read('http://first')
+        cache.store('http://third', headers, b'0123456789')
+        cache.store('http://fourth', headers, b'0123456789')
+
+        self.assertIsNotNone(cache.metadata('http://first'))
+        self.assertIsNone(cache.metadata('http://second'))
+        self.assertIsNotNone(cache.metadata('http://fourth'))
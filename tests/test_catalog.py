@@ -0,0 +1,76 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from pathlib import Path
+
+from qgis_plugin_repo.catalog import Plugin, PluginIndex, PluginRecord
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestCatalog(unittest.TestCase):
+
+    def test_index(self):
+        """ Test the index built from a catalog. """
+        parser = ET.parse(Path("fixtures/plugins-3.10.xml")).getroot()
+        index = PluginIndex(parser)
+        self.assertEqual(3, len(index))
+
+        self.assertIn(Plugin(name='PgMetadata', experimental=True, version='0.4.0'), index)
+        self.assertNotIn(Plugin(name='PgMetadata', experimental=True, version='0.7.0'), index)
+        self.assertNotIn(Plugin(name='atlasprint', experimental=True, version='v3.2.2'), index)
+
+        element, position = index.get('PgMetadata', True)
+        self.assertEqual('0.4.0', element.attrib['version'])
+        self.assertEqual(1, position)
+        self.assertTupleEqual((None, None), index.get('unknown', False))
+
+    def test_index_update(self):
+        """ Test the index is kept up to date when appending or replacing. """
+        parser = ET.parse(Path("fixtures/plugins-3.10.xml")).getroot()
+        index = PluginIndex(parser)
+
+        new_parser = ET.parse(Path("fixtures/pgmetadata_experimental.xml")).getroot()
+        index.replace(new_parser[0])
+        self.assertIn(Plugin(name='PgMetadata', experimental=True, version='0.7.0'), index)
+        element, position = index.get('PgMetadata', True)
+        self.assertEqual(1, position)
+        self.assertIs(parser[1], element)
+        self.assertEqual('0.7.0', parser[1].attrib['version'])
+
+        new_parser = ET.parse(Path("fixtures/pgmetadata_stable.xml")).getroot()
+        index.append(new_parser[0])
+        self.assertEqual(4, len(index))
+        self.assertEqual(4, len(parser))
+        self.assertTupleEqual((parser[3], 3), index.get('wfsOutputExtension', True))
+        self.assertIs(parser[1], index.record('PgMetadata', True).element)
+
+    def test_record(self):
+        """ Test the record of a plugin, with default QGIS versions. """
+        parser = ET.parse(Path("fixtures/plugins-3.10.xml")).getroot()
+        record = PluginRecord.from_element(parser[0])
+        self.assertEqual(Plugin(name='PgMetadata', experimental=False, version='0.5.0'), record.plugin)
+        self.assertTupleEqual(('PgMetadata', False), record.key)
+        self.assertTupleEqual(('3.10', '3.99'), record.qgis_versions)
+        self.assertEqual('pg_metadata.0.5.0.zip', record.file_name)
+        self.assertTrue(record.download_url.endswith('/0.5.0/pg_metadata.0.5.0.zip'))
+        self.assertEqual('2021-02-19', record.update_date)
+        self.assertIs(parser[0], record.element)
+        # Fields are kept without the element
+        record = PluginRecord.from_element(parser[0]).detach()
+        self.assertIsNone(record.element)
+        self.assertEqual('pg_metadata.0.5.0.zip', record.file_name)
+        self.assertTrue(PluginRecord.from_element(parser[1]).experimental)
+
+        element = ET.fromstring('<pyqgis_plugin name="minimal" version="1.0"/>')
+        record = PluginRecord.from_element(element)
+        self.assertTupleEqual(('3.0', '3.99'), record.qgis_versions)
+        self.assertIsNone(record.download_url)
+        self.assertEqual(PluginRecord('minimal', '1.0'), record)
+
+        element = ET.fromstring(
+            '<pyqgis_plugin name="qgis4" version="1.0"><qgis_minimum_version>4.0</qgis_minimum_version>'
+            '</pyqgis_plugin>')
+        self.assertTupleEqual(('4.0', '4.99'), PluginRecord.from_element(element).qgis_versions)
@@ -0,0 +1,91 @@
+import shutil
+import unittest
+
+from pathlib import Path
+
+from benchmarks.local_server import LocalServer, QuietHandler
+from qgis_plugin_repo.checker import LinkCache, check_catalog
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+PLUGIN = (
+    '<pyqgis_plugin name="{name}" version="1.0.0">'
+    '<experimental>False</experimental><download_url>{url}</download_url></pyqgis_plugin>'
+)
+
+
+class HeadNotAllowedHandler(QuietHandler):
+
+    """ A server refusing HEAD requests. """
+
+    def do_HEAD(self):
+        self.send_error(405)
+
+
+class TestChecker(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("fixtures/checker_tmp")
+        self.directory.mkdir(exist_ok=True)
+        self.directory.joinpath("plugin.zip").write_bytes(b'PK' + b'\x00' * 98)
+        self.directory.joinpath("notes.txt").write_text("Not an archive")
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def catalog(self, server: LocalServer, files: list) -> Path:
+        """ Write a catalog with one plugin per file served by the server. """
+        plugins = ''.join(PLUGIN.format(name=f'plugin_{i}', url=server.url(f)) for i, f in enumerate(files))
+        path = self.directory / "plugins.xml"
+        path.write_text(f'<plugins>{plugins}</plugins>')
+        return path
+
+    def test_check(self):
+        """ Test dead links and unexpected content types are reported. """
+        with LocalServer(self.directory) as server:
+            catalog = self.catalog(server, ["plugin.zip", "missing.zip", "notes.txt", "plugin.zip"])
+            reports = check_catalog(catalog, workers=4)
+
+            self.assertEqual(4, len(reports))
+            self.assertIsNone(reports[0].problem)
+            self.assertEqual(100, reports[0].size)
+            self.assertEqual('application/zip', reports[0].content_type)
+            self.assertEqual('dead link, HTTP 404', reports[1].problem)
+            self.assertEqual('unexpected content type text/plain', reports[2].problem)
+            self.assertIsNone(reports[3].problem)
+            # A URL is checked only once
+            self.assertEqual(3, len(server.requested))
+
+    def test_head_not_allowed(self):
+        """ Test a GET of a range is sent if HEAD is not allowed. """
+        with LocalServer(self.directory, HeadNotAllowedHandler) as server:
+            reports = check_catalog(self.catalog(server, ["plugin.zip"]))
+            self.assertIsNone(reports[0].problem)
+            self.assertEqual(100, reports[0].size)
+            self.assertListEqual([405, 200], server.statuses)
+
+    def test_cache(self):
+        """ Test valid links are not checked again, and a changed size is reported. """
+        cache_path = self.directory / "links.json"
+        with LocalServer(self.directory) as server:
+            catalog = self.catalog(server, ["plugin.zip", "missing.zip"])
+            check_catalog(catalog, cache=LinkCache(cache_path))
+            self.assertEqual(2, len(server.requested))
+
+            reports = check_catalog(catalog, cache=LinkCache(cache_path))
+            # Only the dead link is checked again
+            self.assertEqual(3, len(server.requested))
+            self.assertIsNone(reports[0].problem)
+            self.assertEqual('dead link, HTTP 404', reports[1].problem)
+
+            self.directory.joinpath("plugin.zip").write_bytes(b'PK' + b'\x00' * 8)
+            reports = check_catalog(catalog, cache=LinkCache(cache_path, max_age=0))
+            self.assertEqual('size changed from 100 to 10 bytes', reports[0].problem)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import gzip
+import os
+import shutil
+import unittest
+
+from pathlib import Path
+
+from qgis_plugin_repo.compress import (
+    available_encodings,
+    compressed_path,
+    write_compressed,
+)
+from qgis_plugin_repo.merger import Merger
+from qgis_plugin_repo.shards import ShardStore
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestCompress(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("fixtures/compress_tmp")
+        self.directory.mkdir(exist_ok=True)
+        self.destination = self.directory / "plugins.xml"
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_write_compressed(self):
+        """ Test the compressed copy has the same content, and the same bytes for the same content. """
+        path = self.directory / "content.xml"
+        write_compressed(path, b'<plugins>\n</plugins>\n', ['gz'])
+        gz = compressed_path(path, 'gz')
+        self.assertEqual(self.directory / "content.xml.gz", gz)
+        self.assertEqual(path.read_bytes(), gzip.decompress(gz.read_bytes()))
+
+        content = gz.read_bytes()
+        write_compressed(path, b'<plugins>\n</plugins>\n', ['gz'])
+        self.assertEqual(content, gz.read_bytes())
+
+        if 'br' not in available_encodings():
+            with self.assertRaises(ValueError):
+                write_compressed(path, b'', ['br'])
+
+    def test_merge(self):
+        """ Test the compressed copy is written with the destination, only if it has changed. """
+        gz = compressed_path(self.destination, 'gz')
+        merger = Merger(
+            str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), compress=['gz'])
+        merger.merge()
+        self.assertEqual(self.destination.read_bytes(), gzip.decompress(gz.read_bytes()))
+
+        stat = gz.stat()
+        Merger(
+            str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), compress=['gz']).merge()
+        self.assertEqual(stat.st_mtime_ns, gz.stat().st_mtime_ns)
+
+        # A missing copy is written, even if the destination is up to date
+        gz.unlink()
+        content = self.destination.read_bytes()
+        Merger(
+            str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), compress=['gz']).merge()
+        self.assertEqual(content, self.destination.read_bytes())
+        self.assertEqual(content, gzip.decompress(gz.read_bytes()))
+
+        # An older copy as well, with the sidecar
+        gz.write_bytes(b'stale')
+        os.utime(gz, ns=(stat.st_atime_ns, self.destination.stat().st_mtime_ns - 10 ** 9))
+        Merger(
+            str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), compress=['gz'],
+            sidecar=True).merge()
+        self.assertEqual(content, gzip.decompress(gz.read_bytes()))
+
+    def test_build(self):
+        """ Test compressed copies of catalogs built from fragments. """
+        store = ShardStore(self.directory / "fragments")
+        store.split(Path("fixtures/plugins.xml"))
+        output = self.directory / "plugins-3.28.xml"
+        self.assertListEqual([output], store.build([output]))
+        # The compressed copy is missing
+        self.assertListEqual([output], store.build([output], compress=['gz']))
+        self.assertEqual(output.read_bytes(), gzip.decompress(compressed_path(output, 'gz').read_bytes()))
+        self.assertListEqual([], store.build([output], compress=['gz']))
+
+
+if __name__ == '__main__':
+    unittest.main()
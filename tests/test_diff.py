@@ -0,0 +1,89 @@
+import io
+import json
+import shutil
+import unittest
+
+from pathlib import Path
+
+from qgis_plugin_repo.diff import (
+    PluginChange,
+    diff_catalogs,
+    has_changes,
+    write_diff,
+)
+from qgis_plugin_repo.merger import Merger
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("fixtures/diff_tmp")
+        self.directory.mkdir(exist_ok=True)
+        self.old = self.directory / "plugins-3.10.xml"
+        self.new = self.directory / "plugins.xml"
+        shutil.copy(Path("fixtures/plugins-3.10.xml"), self.old)
+
+        # New version of PgMetadata experimental, new plugin wfsOutputExtension
+        shutil.copy(self.old, self.new)
+        Merger(
+            [str(Path("fixtures/pgmetadata_experimental.xml")), str(Path("fixtures/pgmetadata_stable.xml"))],
+            str(self.new)).merge()
+        content = self.new.read_text(encoding='utf8')
+        # Another file name for atlasprint, and the stable PgMetadata is removed
+        content = content.replace('<file_name>atlasprint.v3.2.2.zip', '<file_name>atlasprint.zip')
+        start = content.index('<pyqgis_plugin name="PgMetadata" version="0.5.0"')
+        end = content.index('</pyqgis_plugin>', start) + len('</pyqgis_plugin>')
+        self.new.write_text(content[:start] + content[end:], encoding='utf8')
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_diff(self):
+        """ Test added, removed, version changed and content changed plugins. """
+        diff = diff_catalogs(self.old, self.new)
+        self.assertTrue(has_changes(diff))
+        self.assertListEqual([PluginChange('wfsOutputExtension', True, None, '1.7.1-alpha')], diff.added)
+        self.assertListEqual([PluginChange('PgMetadata', False, '0.5.0', None)], diff.removed)
+        self.assertListEqual([PluginChange('PgMetadata', True, '0.4.0', '0.7.0')], diff.version_changed)
+        self.assertListEqual([PluginChange('atlasprint', False, 'v3.2.2', 'v3.2.2')], diff.content_changed)
+
+        # Same result with sidecar indexes
+        self.assertEqual(diff, diff_catalogs(self.old, self.new, sidecar=True))
+
+    def test_same(self):
+        """ Test the indentation is not a difference. """
+        copy = self.directory / "indented.xml"
+        copy.write_text(self.old.read_text(encoding='utf8').replace('\t', '    '), encoding='utf8')
+        self.assertFalse(has_changes(diff_catalogs(self.old, copy)))
+
+    def test_write(self):
+        """ Test the text and the JSON output. """
+        diff = diff_catalogs(self.old, self.new)
+        stream = io.StringIO()
+        write_diff(diff, stream=stream)
+        self.assertListEqual(
+            [
+                '+ wfsOutputExtension 1.7.1-alpha experimental',
+                '- PgMetadata 0.5.0 stable',
+                '~ PgMetadata 0.4.0 -> 0.7.0 experimental',
+                '~ atlasprint v3.2.2 stable, content changed',
+            ],
+            stream.getvalue().splitlines())
+
+        stream = io.StringIO()
+        write_diff(diff, 'json', stream)
+        data = json.loads(stream.getvalue())
+        self.assertListEqual(['added', 'removed', 'version_changed', 'content_changed'], list(data))
+        self.assertDictEqual(
+            {'name': 'PgMetadata', 'experimental': True, 'old_version': '0.4.0', 'new_version': '0.7.0'},
+            data['version_changed'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import requests
+
+from benchmarks.local_server import LocalServer
+from qgis_plugin_repo.fetch import Fetcher
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestFetch(unittest.TestCase):
+
+    def test_download_once(self):
+        """ Test the same URL is downloaded only once. """
+        fetcher = Fetcher(timeout=5)
+        with LocalServer() as server:
+            url = server.url("plugins-3.10.xml")
+            content = fetcher.get(url)
+            self.assertIn(b'PgMetadata', content)
+            self.assertEqual(content, fetcher.get(url))
+            self.assertEqual(content, b''.join(fetcher.stream(url, 16)))
+            self.assertListEqual(["/plugins-3.10.xml"], server.requested)
+
+    def test_download_many(self):
+        """ Test to download many URLs concurrently. """
+        fetcher = Fetcher(timeout=5, workers=4)
+        with LocalServer() as server:
+            urls = [server.url(f"plugins-3.{v}.xml") for v in (4, 10, 16, 22, 28)]
+            contents = fetcher.get_many(urls + urls)
+            self.assertListEqual(urls, list(contents.keys()))
+            self.assertEqual(5, len(server.requested))
+
+    def test_not_found(self):
+        """ Test an error is raised when the URL is not found. """
+        fetcher = Fetcher(timeout=5, retries=0)
+        with LocalServer() as server:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                fetcher.get(server.url("not_found.xml"))
@@ -0,0 +1,93 @@
+import shutil
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from qgis_plugin_repo.__main__ import main
+from qgis_plugin_repo.history import History
+from qgis_plugin_repo.merger import Merger, Plugin
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.destination = Path("fixtures/plugins_history_tmp.xml")
+        shutil.copy(Path("fixtures/plugins-3.10.xml"), self.destination)
+        self.history = History(self.destination)
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        for path in (self.destination, self.history.path):
+            path.unlink(missing_ok=True)
+        shutil.rmtree(self.history.index_path, ignore_errors=True)
+
+    def plugins(self):
+        """ Plugins in the destination. """
+        return Merger.plugins(Merger.read_input(str(self.destination))[1])
+
+    def test_history(self):
+        """ Test replaced elements are kept in the history. """
+        Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), history=True).merge()
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), self.plugins())
+
+        element = History(self.destination).get('PgMetadata', True, '0.4.0')
+        self.assertEqual('0.4.0', element.attrib['version'])
+        self.assertEqual('pg_metadata.0.4.0.zip', element.findtext('file_name'))
+        self.assertIsNone(History(self.destination).get('PgMetadata', False, '0.4.0'))
+        self.assertListEqual(['0.4.0'], [version for version, _ in self.history.versions('PgMetadata', True)])
+        # One index per plugin, the index of other plugins is not read
+        self.assertListEqual(['PgMetadata.experimental'], [p.name for p in self.history.index_path.iterdir()])
+        with mock.patch('builtins.open', wraps=open) as opened:
+            self.assertListEqual([], self.history.versions('atlasprint', False))
+        self.assertNotIn(
+            self.history.index_file('PgMetadata', True), [call.args[0] for call in opened.call_args_list])
+
+        # Nothing is added if nothing is replaced
+        size = self.history.path.stat().st_size
+        Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), history=True).merge()
+        self.assertEqual(size, self.history.path.stat().st_size)
+
+    def test_interrupted(self):
+        """ Test an incomplete line in the index is skipped. """
+        Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), history=True).merge()
+        with open(self.history.index_file('PgMetadata', True), 'a', encoding='utf8') as f:
+            f.write('{"name": "PgMet')
+
+        history = History(self.destination)
+        history.append(Merger.read_input(str(Path("fixtures/pgmetadata_stable.xml")))[1][:])
+        history = History(self.destination)
+        self.assertIsNotNone(history.get('PgMetadata', True, '0.4.0'))
+        self.assertIsNotNone(history.get('wfsOutputExtension', True, '1.7.1-alpha'))
+
+    def test_rollback(self):
+        """ Test a previous version is restored, and the current one goes to the history. """
+        Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(self.destination), history=True).merge()
+
+        argv = [
+            'qgis-plugin-repo', '--no-cache', 'rollback', '--experimental', str(self.destination),
+            'PgMetadata',
+        ]
+        with mock.patch('sys.argv', argv):
+            self.assertEqual(0, main())
+
+        argv.append('0.4.0')
+        with mock.patch('sys.argv', argv):
+            self.assertEqual(0, main())
+        plugins = self.plugins()
+        self.assertIn(Plugin('PgMetadata', True, '0.4.0'), plugins)
+        self.assertNotIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+        self.assertIsNotNone(History(self.destination).get('PgMetadata', True, '0.7.0'))
+
+        argv[-1] = '0.1.0'
+        with mock.patch('sys.argv', argv), self.assertRaises(SystemExit):
+            main()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import shutil
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from qgis_plugin_repo.__main__ import main
+from qgis_plugin_repo.lock import FileLock, lock_path
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.spool import (
+    REJECTED,
+    SPOOL_SUFFIX,
+    InvalidInputError,
+    Spool,
+)
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestLock(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.destination = Path("fixtures/plugins_lock_tmp.xml")
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+        self.spool = Path("fixtures/spool_tmp")
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        self.destination.unlink(missing_ok=True)
+        shutil.rmtree(self.spool, ignore_errors=True)
+
+    def plugins(self):
+        """ Plugins in the destination. """
+        return Merger.plugins(Merger.read_input(str(self.destination))[1])
+
+    def test_lock(self):
+        """ Test the lock is exclusive, and the lock file is removed. """
+        lock = FileLock(self.destination)
+        self.assertTrue(lock.acquire())
+        self.assertTrue(lock_path(self.destination).exists())
+        self.assertFalse(FileLock(self.destination).acquire(blocking=False))
+        lock.release()
+        self.assertFalse(lock_path(self.destination).exists())
+
+        with FileLock(self.destination):
+            self.assertFalse(FileLock(self.destination).acquire(blocking=False))
+        other = FileLock(self.destination)
+        self.assertTrue(other.acquire(blocking=False))
+        other.release()
+
+    def test_merge_waits(self):
+        """ Test a merge waits for the lock, and reads the destination again if it has changed. """
+        first = Merger([str(Path("fixtures/pgmetadata_experimental.xml"))], str(self.destination))
+        second = Merger([str(Path("fixtures/pgmetadata_stable.xml"))], str(self.destination))
+
+        lock = FileLock(self.destination)
+        lock.acquire()
+        thread = threading.Thread(target=first.merge)
+        thread.start()
+        time.sleep(0.2)
+        # Still waiting for the lock
+        self.assertTrue(thread.is_alive())
+        self.assertNotIn(Plugin('PgMetadata', True, '0.7.0'), self.plugins())
+        lock.release()
+        thread.join()
+
+        # Both updates are kept, the second merger has parsed the destination before the first write
+        second.merge()
+        plugins = self.plugins()
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+        self.assertIn(Plugin('wfsOutputExtension', True, '1.7.1-alpha'), plugins)
+        self.assertFalse(lock_path(self.destination).exists())
+
+    def test_spool(self):
+        """ Test the process getting the lock merges every queued input. """
+        spool = Spool(self.spool)
+        queued = spool.put(str(Path("fixtures/pgmetadata_stable.xml")))
+        self.assertListEqual([queued], spool.entries())
+
+        argv = [
+            'qgis-plugin-repo', '--no-cache', 'merge', str(Path("fixtures/pgmetadata_experimental.xml")),
+            str(self.destination), '--spool', str(self.spool),
+        ]
+        with mock.patch('sys.argv', argv):
+            self.assertEqual(0, main())
+
+        self.assertListEqual([], spool.entries())
+        plugins = self.plugins()
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+        self.assertIn(Plugin('wfsOutputExtension', True, '1.7.1-alpha'), plugins)
+
+    def test_spool_invalid(self):
+        """ Test a plugin without its version is not queued, and does not block the queue. """
+        invalid = self.spool.parent / 'spool_invalid_tmp.xml'
+        self.addCleanup(invalid.unlink, missing_ok=True)
+        invalid.write_text('<plugins><pyqgis_plugin name="broken"/></plugins>', encoding='utf8')
+        spool = Spool(self.spool)
+        with self.assertRaises(InvalidInputError):
+            spool.put(str(invalid))
+        self.assertListEqual([], spool.entries())
+
+        # Queued by hand, it is rejected when the queue is drained
+        shutil.copy(invalid, self.spool / f'0{SPOOL_SUFFIX}')
+        queued = spool.put(str(Path("fixtures/pgmetadata_stable.xml")))
+        argv = [
+            'qgis-plugin-repo', '--no-cache', 'merge', str(Path("fixtures/pgmetadata_experimental.xml")),
+            str(self.destination), '--spool', str(self.spool),
+        ]
+        with mock.patch('sys.argv', argv):
+            self.assertEqual(0, main())
+
+        self.assertListEqual([], spool.entries())
+        self.assertTrue(self.spool.joinpath(REJECTED, f'0{SPOOL_SUFFIX}').exists())
+        self.assertFalse(queued.exists())
+        self.assertIn(Plugin('wfsOutputExtension', True, '1.7.1-alpha'), self.plugins())
+
+
+if __name__ == '__main__':
+    unittest.main()
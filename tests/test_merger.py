@@ -3,9 +3,10 @@ import unittest
 
 from pathlib import Path
 
-from qgis_plugin_repo.dispatcher import Dispatcher
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.dispatcher import Dispatcher, VersionIndex, dispatch
 from qgis_plugin_repo.merger import Merger, Plugin
-from qgis_plugin_repo.tools import is_url
+from qgis_plugin_repo.tools import expand_inputs, is_url
 
 __copyright__ = 'Copyright 2021, 3Liz'
 __license__ = 'GPL version 3'
@@ -26,6 +27,7 @@ class TestMerger(unittest.TestCase):
     def tearDown(self) -> None:
         """ After each test. """
         Path("plugins.xml").unlink(missing_ok=True)
+        Path("fixtures/manifest_tmp.txt").unlink(missing_ok=True)
         Path("fixtures/plugins_tmp.xml").unlink(missing_ok=True)
         Path("fixtures/plugins_tmp-3.4.xml").unlink(missing_ok=True)
         Path("fixtures/plugins_tmp-3.10.xml").unlink(missing_ok=True)
@@ -127,6 +129,64 @@ class TestMerger(unittest.TestCase):
         for plugin in merger.plugins(merger.output_parser):
             self.assertIn(plugin, output_plugins)
 
+    def test_merge_many_inputs(self):
+        """ Test to merge many inputs in a single write. """
+        merger = Merger(
+            [
+                str(Path("fixtures/pgmetadata_experimental.xml")),
+                str(Path("fixtures/pgmetadata_stable.xml")),
+            ],
+            str(Path("fixtures/plugins_tmp-3.10.xml"))
+        )
+        self.assertEqual(2, len(merger.inputs))
+        self.assertEqual(2, merger.count())
+
+        reports = merger.merge()
+        self.assertEqual(2, len(reports))
+        self.assertListEqual([], reports[0].added)
+        self.assertListEqual(
+            [Plugin(name='PgMetadata', experimental=True, version='0.7.0')], reports[0].updated)
+        self.assertListEqual(
+            [Plugin(name='wfsOutputExtension', experimental=True, version='1.7.1-alpha')], reports[1].added)
+        self.assertListEqual([], reports[1].updated)
+
+        merger = Merger(str(Path("fixtures/plugins_tmp-3.10.xml")))
+        self.assertListEqual(
+            [
+                Plugin(name='PgMetadata', experimental=False, version='0.5.0'),
+                Plugin(name='PgMetadata', experimental=True, version='0.7.0'),
+                Plugin(name='atlasprint', experimental=False, version='v3.2.2'),
+                Plugin(name='wfsOutputExtension', experimental=True, version='1.7.1-alpha'),
+            ],
+            merger.plugins(merger.input_parser)
+        )
+
+    def test_expand_inputs(self):
+        """ Test to expand inputs with a glob pattern and a manifest. """
+        self.assertListEqual(
+            [
+                str(Path("fixtures/pgmetadata_experimental.xml")),
+                str(Path("fixtures/pgmetadata_stable.xml")),
+            ],
+            expand_inputs([str(Path("fixtures/pgmetadata_*.xml"))])
+        )
+
+        Path("fixtures/manifest_tmp.txt").write_text(
+            "# Plugins to merge\n"
+            "pgmetadata_stable.xml\n"
+            "\n"
+            "https://plugins.qgis.org/plugins/plugins.xml?qgis=3.10\n"
+        )
+        self.assertListEqual(
+            [
+                str(Path("fixtures/pgmetadata_experimental.xml")),
+                str(Path("fixtures/pgmetadata_stable.xml")),
+                "https://plugins.qgis.org/plugins/plugins.xml?qgis=3.10",
+            ],
+            expand_inputs(
+                [str(Path("fixtures/pgmetadata_experimental.xml"))], str(Path("fixtures/manifest_tmp.txt")))
+        )
+
     def test_read(self):
         """ Test to read only. """
         merger = Merger(str(Path("fixtures/plugins_tmp.xml")))
@@ -206,3 +266,109 @@ class TestMerger(unittest.TestCase):
             ],
             dispatcher.xml_files_for_plugin()
         )
+
+    def test_dispatch(self):
+        """ Test to dispatch inputs in many XML files concurrently. """
+        outputs = [
+            str(Path("fixtures/plugins_tmp-3.4.xml")),
+            str(Path("fixtures/plugins_tmp-3.10.xml")),
+            str(Path("fixtures/plugins_tmp-3.16.xml")),
+            str(Path("fixtures/plugins_tmp-3.22.xml")),
+            str(Path("fixtures/plugins_tmp-3.28.xml")),
+        ]
+        reports = dispatch(
+            [
+                str(Path("fixtures/pgmetadata_experimental.xml")),
+                str(Path("fixtures/pgmetadata_stable.xml")),
+            ],
+            outputs,
+            workers=2,
+        )
+        # The experimental version requires QGIS 3.10 and the other one QGIS 3.0
+        self.assertEqual(9, len(reports))
+        experimental = Path("fixtures/pgmetadata_experimental.xml")
+        self.assertSetEqual(
+            {Path(f) for f in outputs[1:]},
+            {report.destination_uri for report in reports if report.input_uri == experimental}
+        )
+
+        for output in outputs[1:]:
+            merger = Merger(output)
+            self.assertIn(
+                Plugin(name='PgMetadata', experimental=True, version='0.7.0'),
+                merger.plugins(merger.input_parser))
+
+        merger = Merger(outputs[0])
+        self.assertListEqual(
+            [
+                Plugin(name='PgMetadata', experimental=False, version='0.3.0'),
+                Plugin(name='wfsOutputExtension', experimental=True, version='1.7.1-alpha'),
+            ],
+            merger.plugins(merger.input_parser)
+        )
+
+    def test_version_index(self):
+        """ Test XML files are found according to the version in their name. """
+        index = VersionIndex([
+            "plugins-3.4.xml", "plugins-3.28.xml", "plugins-3.10.xml", "plugins-3.28.5.xml",
+            "plugins-4.0.xml", "plugins.xml",
+        ])
+        self.assertListEqual(
+            [Path("plugins-3.10.xml"), Path("plugins-3.28.xml"), Path("plugins-3.28.5.xml")],
+            index.lookup("3.10", "3.99"))
+        self.assertListEqual([Path("plugins-3.4.xml")], index.lookup("3.0", "3.8"))
+        self.assertListEqual([Path("plugins-3.28.xml")], index.lookup("3.28.6", "3.28.8"))
+        self.assertListEqual(
+            [Path("plugins-3.28.xml"), Path("plugins-3.28.5.xml")], index.lookup("3.28.2", "3.28.5"))
+        self.assertListEqual([Path("plugins-4.0.xml")], index.lookup("4.0", "4.99"))
+        self.assertListEqual([], index.lookup("3.30", "3.34"))
+
+    def test_dispatch_many_plugins(self):
+        """ Test each plugin of a single input is dispatched according to its own QGIS versions. """
+        many = Path("fixtures/many_tmp.xml")
+        root = Merger.read_input(str(Path("fixtures/pgmetadata_experimental.xml")))[1]
+        root.extend(Merger.read_input(str(Path("fixtures/pgmetadata_stable.xml")))[1])
+        many.write_bytes(xml_backend.tostring(root))
+        self.addCleanup(many.unlink)
+
+        outputs = [
+            str(Path("fixtures/plugins_tmp-3.4.xml")),
+            str(Path("fixtures/plugins_tmp-3.10.xml")),
+            str(Path("fixtures/plugins_tmp-3.28.xml")),
+        ]
+        dispatch([str(many)], outputs)
+
+        wfs = Plugin(name='wfsOutputExtension', experimental=True, version='1.7.1-alpha')
+        pgmetadata = Plugin(name='PgMetadata', experimental=True, version='0.7.0')
+        merger = Merger(outputs[0])
+        self.assertIn(wfs, merger.plugins(merger.input_parser))
+        self.assertNotIn(pgmetadata, merger.plugins(merger.input_parser))
+        for output in outputs[1:]:
+            merger = Merger(output)
+            self.assertIn(wfs, merger.plugins(merger.input_parser))
+            self.assertIn(pgmetadata, merger.plugins(merger.input_parser))
+
+    def test_merge_unchanged(self):
+        """ Test the destination is not written when nothing has changed. """
+        destination = Path("fixtures/plugins_tmp-3.10.xml")
+        Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(destination)).merge()
+        content = destination.read_bytes()
+        destination.chmod(0o640)
+        mtime = destination.stat().st_mtime_ns
+
+        reports = Merger(str(Path("fixtures/pgmetadata_experimental.xml")), str(destination)).merge()
+        self.assertListEqual([], reports[0].added)
+        self.assertListEqual([], reports[0].updated)
+        self.assertEqual(mtime, destination.stat().st_mtime_ns)
+        self.assertEqual(content, destination.read_bytes())
+
+        # Same version, but the content has been published again
+        Path("fixtures/plugins_tmp.xml").write_text(
+            Path("fixtures/pgmetadata_experimental.xml").read_text().replace(
+                "<update_date>", "<update_date>2099-"))
+        reports = Merger(str(Path("fixtures/plugins_tmp.xml")), str(destination)).merge()
+        self.assertListEqual(
+            [Plugin(name='PgMetadata', experimental=True, version='0.7.0')], reports[0].updated)
+        self.assertIn(b"2099-", destination.read_bytes())
+        self.assertEqual(0o640, destination.stat().st_mode & 0o777)
+        self.assertListEqual([], list(Path("fixtures").glob(".*.tmp")))
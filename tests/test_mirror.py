@@ -0,0 +1,148 @@
+import shutil
+import unittest
+
+from pathlib import Path
+
+import requests
+
+from benchmarks.local_server import LocalServer, QuietHandler
+from qgis_plugin_repo import fetch
+from qgis_plugin_repo.merger import Merger
+from qgis_plugin_repo.mirror import MANIFEST, PART_SUFFIX, Mirror
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+PLUGIN = (
+    '<pyqgis_plugin name="{name}" version="1.0.0"><experimental>False</experimental>'
+    '<file_name>{name}.zip</file_name><download_url>{url}</download_url></pyqgis_plugin>'
+)
+
+BASE_URL = 'https://mirror.example/qgis'
+
+
+class RangeHandler(QuietHandler):
+
+    """ Serve files, with a part of the file if a range is requested. """
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        requested = self.headers.get('Range')
+        if not requested or not path.is_file():
+            super().do_GET()
+            return
+
+        content = path.read_bytes()
+        start = int(requested.split('=')[1].split('-')[0])
+        if start >= len(content):
+            self.send_error(416)
+            return
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.upstream = Path("fixtures/upstream_tmp")
+        self.upstream.mkdir(exist_ok=True)
+        self.directory = Path("fixtures/mirror_tmp")
+        self.upstream.joinpath("first.zip").write_bytes(b'PK' + b'1' * 998)
+        self.upstream.joinpath("second.zip").write_bytes(b'PK' + b'2' * 498)
+        # A new fetcher, catalogs are downloaded only once per run
+        fetch.configure()
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.upstream, ignore_errors=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_upstream(self, server: LocalServer, version: str, names: list) -> None:
+        """ Write the upstream catalog of a QGIS version. """
+        plugins = ''.join(PLUGIN.format(name=name, url=server.url(f'{name}.zip')) for name in names)
+        self.upstream.joinpath(f'plugins-{version}.xml').write_text(f'<plugins>{plugins}</plugins>')
+
+    def mirror(self, server: LocalServer) -> Mirror:
+        """ The mirror of the local server. """
+        return Mirror(self.directory, BASE_URL, server.url('plugins-{version}.xml'), workers=4)
+
+    def test_mirror(self):
+        """ Test catalogs and archives are mirrored, archives are downloaded once. """
+        with LocalServer(self.upstream, RangeHandler) as server:
+            self.write_upstream(server, '3.28', ['first', 'second'])
+            self.write_upstream(server, '3.34', ['first'])
+            reports = self.mirror(server).sync(['3.28', '3.34'])
+
+            self.assertEqual(3, sum(len(report.added) for report in reports))
+            for name in ('first', 'second'):
+                archive = self.directory / 'archives' / name / '1.0.0' / f'{name}.zip'
+                self.assertEqual(self.upstream.joinpath(f'{name}.zip').read_bytes(), archive.read_bytes())
+                self.assertEqual(1, server.requested.count(f'/{name}.zip'))
+
+            records = Merger.records(Merger.read_input(str(self.directory / 'plugins-3.28.xml'))[1])
+            self.assertListEqual(
+                [
+                    f'{BASE_URL}/archives/first/1.0.0/first.zip',
+                    f'{BASE_URL}/archives/second/1.0.0/second.zip',
+                ],
+                [record.download_url for record in records])
+            self.assertEqual(1, len(Merger.read_input(str(self.directory / 'plugins-3.34.xml'))[1]))
+
+            # Nothing is downloaded nor written again
+            requested = len(server.requested)
+            fetch.configure()
+            reports = self.mirror(server).sync(['3.28', '3.34'])
+            self.assertListEqual([], [p for report in reports for p in report.added + report.updated])
+            self.assertEqual(requested + 2, len(server.requested))
+
+    def test_resume(self):
+        """ Test a partial download is resumed, and a missing archive is not in the mirror. """
+        with LocalServer(self.upstream, RangeHandler) as server:
+            self.write_upstream(server, '3.28', ['first', 'missing'])
+            part = self.directory / 'archives' / 'first' / '1.0.0' / f'first.zip{PART_SUFFIX}'
+            part.parent.mkdir(parents=True)
+            part.write_bytes(self.upstream.joinpath('first.zip').read_bytes()[:400])
+
+            mirror = self.mirror(server)
+            mirror.sync(['3.28'])
+            self.assertEqual(
+                self.upstream.joinpath('first.zip').read_bytes(), part.with_name('first.zip').read_bytes())
+            self.assertFalse(part.exists())
+            self.assertIn(206, server.statuses)
+
+            self.assertEqual(1, len(mirror.failed))
+            self.assertTrue(mirror.failed[0].url.endswith('/missing.zip'))
+            self.assertEqual(1, len(Merger.read_input(str(self.directory / 'plugins-3.28.xml'))[1]))
+            self.assertIn(server.url('first.zip'), (self.directory / MANIFEST).read_text())
+
+    def test_name_with_space(self):
+        """ Test an archive is stored with the name of the plugin, and its URL is quoted. """
+        self.upstream.joinpath("Lizmap server.zip").write_bytes(b'PK' + b'3' * 98)
+        with LocalServer(self.upstream, RangeHandler) as server, LocalServer(self.directory) as mirrored:
+            self.write_upstream(server, '3.28', ['Lizmap server', '..'])
+            mirror = Mirror(self.directory, mirrored.url(''), server.url('plugins-{version}.xml'))
+            mirror.sync(['3.28'])
+
+            archive = self.directory / 'archives' / 'Lizmap server' / '1.0.0' / 'Lizmap server.zip'
+            self.assertTrue(archive.exists())
+            # A name which is not a single file name is not mirrored
+            self.assertEqual(1, len(mirror.failed))
+            self.assertFalse(self.directory.joinpath('archives', '1.0.0').exists())
+
+            records = Merger.records(Merger.read_input(str(self.directory / 'plugins-3.28.xml'))[1])
+            self.assertListEqual(
+                [mirrored.url('archives/Lizmap%20server/1.0.0/Lizmap%20server.zip')],
+                [record.download_url for record in records])
+            response = requests.get(records[0].download_url, timeout=5)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(archive.read_bytes(), response.content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import json
+import unittest
+
+from pathlib import Path
+
+from benchmarks.local_server import LocalServer
+from qgis_plugin_repo.catalog import Plugin
+from qgis_plugin_repo.formats import write_records
+from qgis_plugin_repo.reader import iter_elements, iter_plugins, iter_records
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+EXPECTED = [
+    Plugin(name='PgMetadata', experimental=False, version='0.5.0'),
+    Plugin(name='PgMetadata', experimental=True, version='0.4.0'),
+    Plugin(name='atlasprint', experimental=False, version='v3.2.2'),
+]
+
+
+class TestReader(unittest.TestCase):
+
+    def test_read_file(self):
+        """ Test to read a file incrementally, with tiny chunks. """
+        self.assertListEqual(EXPECTED, list(iter_plugins(Path("fixtures/plugins-3.10.xml"), chunk_size=16)))
+
+    def test_elements_freed(self):
+        """ Test that previous plugins are not kept in memory. """
+        for element in iter_elements(Path("fixtures/plugins-3.10.xml"), chunk_size=16):
+            self.assertEqual('pyqgis_plugin', element.tag)
+            self.assertGreater(len(element), 0)
+        self.assertEqual(0, len(element))
+
+    def test_read_url(self):
+        """ Test to read a remote catalog while downloading it. """
+        with LocalServer() as server:
+            plugins = list(iter_plugins(server.url("plugins-3.10.xml")))
+        self.assertListEqual(EXPECTED, plugins)
+
+    def test_records(self):
+        """ Test fields and filters of records. """
+        records = list(iter_records(
+            Path("fixtures/plugins-3.10.xml"), ['name', 'experimental', 'file_name'], name='pg*',
+            experimental=True))
+        self.assertListEqual(
+            [{'name': 'PgMetadata', 'experimental': True, 'file_name': 'pg_metadata.0.4.0.zip'}], records)
+
+        # All plugins require QGIS 3.10
+        records = iter_records(Path("fixtures/plugins-3.10.xml"), ['name'], qgis_version='3.8')
+        self.assertListEqual([], list(records))
+        records = iter_records(Path("fixtures/plugins-3.10.xml"), ['name'], qgis_version='3.16.2')
+        self.assertEqual(3, len(list(records)))
+
+    def test_formats(self):
+        """ Test records are written as JSON, NDJSON and CSV. """
+        fields = ['name', 'version', 'experimental']
+        stream = io.StringIO()
+        records = iter_records(Path("fixtures/plugins-3.10.xml"))
+        self.assertEqual(3, write_records(records, fields, 'json', stream))
+        self.assertListEqual([dict(plugin._asdict()) for plugin in EXPECTED], [
+            {'name': r['name'], 'experimental': r['experimental'], 'version': r['version']}
+            for r in json.loads(stream.getvalue())])
+
+        stream = io.StringIO()
+        write_records(iter([]), fields, 'json', stream)
+        self.assertListEqual([], json.loads(stream.getvalue()))
+
+        stream = io.StringIO()
+        write_records(iter_records(Path("fixtures/plugins-3.10.xml")), fields, 'ndjson', stream)
+        self.assertEqual('PgMetadata', json.loads(stream.getvalue().splitlines()[0])['name'])
+
+        stream = io.StringIO()
+        write_records(iter_records(Path("fixtures/plugins-3.10.xml")), fields, 'csv', stream)
+        self.assertListEqual(
+            [
+                'name,version,experimental',
+                'PgMetadata,0.5.0,False',
+                'PgMetadata,0.4.0,True',
+                'atlasprint,v3.2.2,False',
+            ],
+            stream.getvalue().splitlines())
@@ -0,0 +1,131 @@
+import json
+import shutil
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from benchmarks.local_server import LocalServer
+from qgis_plugin_repo import fetch, merger
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.server import MergeServer, MergeService
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        fetch.configure(cache=None)
+        self.destination = Path("fixtures/plugins_server_tmp.xml")
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+        self.service = MergeService([str(self.destination)], debounce=0.2)
+        self.server = MergeServer(self.service, port=0, token='secret')
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.service.start()
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.destination.unlink(missing_ok=True)
+
+    def post(self, payload: dict, token: str = 'secret') -> requests.Response:
+        """ Send a payload to the server. """
+        headers = {'Authorization': f'Bearer {token}'}
+        return requests.post(self.server.url(), data=json.dumps(payload), headers=headers, timeout=5)
+
+    def wait_reports(self, count: int):
+        """ Wait for the merges done by the service. """
+        for _ in range(100):
+            if len(self.service.reports) >= count:
+                return
+            time.sleep(0.05)
+        self.fail("The payloads have not been merged")
+
+    def test_debounce(self):
+        """ Test payloads sent together are merged in a single write. """
+        with LocalServer() as upstream, mock.patch.object(
+                merger, 'write_compressed', wraps=merger.write_compressed) as write:
+            pgmetadata = {
+                'name': 'PgMetadata', 'version': '0.7.0', 'url': upstream.url('pgmetadata_experimental.xml')}
+            response = self.post(pgmetadata)
+            self.assertEqual(202, response.status_code)
+            self.assertListEqual([self.destination.name], response.json()['outputs'])
+            wfs = {
+                'name': 'wfsOutputExtension', 'version': '1.7.1',
+                'url': upstream.url('pgmetadata_stable.xml'),
+            }
+            # As sent by a GitHub event
+            response = self.post({'client_payload': wfs})
+            self.assertEqual(202, response.status_code)
+
+            self.wait_reports(2)
+            self.assertEqual(1, write.call_count)
+            self.assertEqual(0, requests.get(self.server.url(), timeout=5).json()['pending'])
+
+            plugins = Merger.plugins(Merger.read_input(str(self.destination))[1])
+            self.assertIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+            self.assertIn(Plugin('wfsOutputExtension', True, '1.7.1-alpha'), plugins)
+
+            # The catalog is kept in memory for the next payload
+            resident = self.service._mergers[self.destination]
+            self.post(pgmetadata)
+            self.wait_reports(3)
+            self.assertIs(resident, self.service._mergers[self.destination])
+            self.assertEqual(1, write.call_count)
+
+    def test_invalid_payload(self):
+        """ Test errors sent back for invalid payloads. """
+        with LocalServer() as upstream:
+            self.assertEqual(401, self.post({}, token='wrong').status_code)
+            self.assertEqual(400, self.post({'name': 'PgMetadata'}).status_code)
+            self.assertEqual(
+                400, self.post({'name': 'PgMetadata', 'version': '0.7.0', 'url': 'file.xml'}).status_code)
+            missing = {'name': 'PgMetadata', 'version': '0.7.0', 'url': upstream.url('missing.xml')}
+            self.assertEqual(502, self.post(missing).status_code)
+        self.assertEqual(0, self.service.pending())
+
+    def test_unexpected_error(self):
+        """ Test an unexpected error is sent back to the client. """
+        payload = {'name': 'PgMetadata', 'version': '0.7.0'}
+        with LocalServer() as upstream, mock.patch.object(
+                self.service, 'submit', side_effect=RuntimeError('broken')):
+            payload['url'] = upstream.url('pgmetadata_experimental.xml')
+            response = self.post(payload)
+        self.assertEqual(500, response.status_code)
+        self.assertIn('broken', response.json()['error'])
+
+    def test_merge_failed(self):
+        """ Test the callback is called with the error when inputs can not be merged. """
+        failures = []
+        self.service.on_failed = lambda *args: failures.append(args)
+        with LocalServer() as upstream, mock.patch.object(
+                self.service, 'merge', side_effect=OSError('disk full')):
+            payload = {
+                'name': 'PgMetadata', 'version': '0.7.0', 'url': upstream.url('pgmetadata_experimental.xml')}
+            self.assertEqual(202, self.post(payload).status_code)
+            for _ in range(100):
+                if failures:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual(1, len(failures))
+        output_uri, inputs, error = failures[0]
+        self.assertEqual(self.destination, output_uri)
+        self.assertEqual(payload['url'], inputs[0][0])
+        self.assertIsInstance(error, OSError)
+        self.assertEqual(0, self.service.pending())
+
+
+if __name__ == '__main__':
+    unittest.main()
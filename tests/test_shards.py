@@ -0,0 +1,70 @@
+import shutil
+import unittest
+
+from pathlib import Path
+
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.shards import ShardStore
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("fixtures/shards_tmp")
+        self.store = ShardStore(self.directory / "fragments")
+        self.outputs = [
+            self.directory / "plugins.xml",
+            self.directory / "plugins-3.4.xml",
+            self.directory / "plugins-3.28.xml",
+        ]
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def plugins(path: Path):
+        """ Plugins in a catalog. """
+        return Merger.plugins(Merger.read_input(str(path))[1])
+
+    def test_split_build(self):
+        """ Test catalogs are built from fragments of an existing catalog. """
+        self.assertEqual(6, self.store.split(Path("fixtures/plugins.xml")))
+        self.assertIn(self.directory / "fragments" / "Lizmap%20server@stable.xml", self.store.fragments())
+
+        self.assertListEqual(self.outputs, self.store.build(self.outputs, workers=2))
+        expected = self.plugins(Path("fixtures/plugins.xml"))
+        self.assertCountEqual(expected, self.plugins(self.outputs[0]))
+        self.assertCountEqual(expected, self.plugins(self.outputs[2]))
+        # Only plugins requiring QGIS 3.4 or lower
+        self.assertEqual(3, len(self.plugins(self.outputs[1])))
+
+        # Nothing has changed
+        self.assertListEqual([], self.store.build(self.outputs))
+
+    def test_merge(self):
+        """ Test a merge writes a single fragment, and only catalogs having it are built again. """
+        self.store.split(Path("fixtures/plugins.xml"))
+        self.store.build(self.outputs)
+
+        inputs = [Merger.read_input(str(Path("fixtures/pgmetadata_experimental.xml")))]
+        reports = self.store.merge(inputs)
+        self.assertListEqual([Plugin('PgMetadata', True, '0.7.0')], reports[0].added)
+        self.assertEqual(7, len(self.store.fragments()))
+
+        # PgMetadata requires QGIS 3.10
+        self.assertListEqual([self.outputs[0], self.outputs[2]], self.store.build(self.outputs))
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), self.plugins(self.outputs[2]))
+
+        reports = self.store.merge(inputs)
+        self.assertListEqual([], reports[0].added + reports[0].updated)
+        self.assertListEqual([], self.store.build(self.outputs))
+
+
+if __name__ == '__main__':
+    unittest.main()
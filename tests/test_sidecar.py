@@ -0,0 +1,128 @@
+import os
+import shutil
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.sidecar import Sidecar
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestSidecar(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.destination = Path("fixtures/plugins_sidecar_tmp.xml")
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        self.destination.unlink(missing_ok=True)
+        Sidecar.sidecar_path(self.destination).unlink(missing_ok=True)
+
+    def test_build_load(self):
+        """ Test the sidecar is built, saved and read again. """
+        self.assertIsNone(Sidecar.read(self.destination))
+        sidecar = Sidecar.load(self.destination)
+        self.assertTrue(Sidecar.sidecar_path(self.destination).exists())
+
+        expected = Merger.plugins(xml_backend.parse(self.destination).getroot())
+        self.assertListEqual(expected, sidecar.plugins())
+
+        content = self.destination.read_bytes()
+        record = sidecar.records[0]
+        self.assertTrue(content[record.start:record.end].startswith(b'<pyqgis_plugin'))
+        self.assertTrue(content[record.start:record.end].endswith(b'</pyqgis_plugin>'))
+
+        with mock.patch.object(Sidecar, 'build') as build:
+            sidecar = Sidecar.load(self.destination)
+            build.assert_not_called()
+        self.assertListEqual(expected, sidecar.plugins())
+
+    def test_fresh(self):
+        """ Test a touched file is still fresh, a modified file is stale. """
+        sidecar = Sidecar.load(self.destination)
+        stat = self.destination.stat()
+        os.utime(self.destination, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertTrue(Sidecar.read(self.destination).is_fresh())
+
+        content = self.destination.read_bytes().replace(b'0.5.0', b'0.5.1')
+        self.destination.write_bytes(content)
+        self.assertFalse(Sidecar.read(self.destination).is_fresh())
+
+        sidecar = Sidecar.load(self.destination)
+        self.assertIn(Plugin('PgMetadata', False, '0.5.1'), sidecar.plugins())
+
+    def test_merge_without_parsing(self):
+        """ Test the destination is not parsed if the sidecar has every plugin already. """
+        Merger(
+            [str(Path("fixtures/pgmetadata_experimental.xml"))], str(self.destination), sidecar=True).merge()
+        sidecar = Sidecar.read(self.destination)
+        self.assertTrue(sidecar.is_fresh())
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), sidecar.plugins())
+        self.assertEqual(
+            Sidecar.build(self.destination).records, sidecar.records)
+
+        mtime = self.destination.stat().st_mtime_ns
+        with mock.patch.object(xml_backend, 'parse', wraps=xml_backend.parse) as parse:
+            merger = Merger(
+                [str(Path("fixtures/pgmetadata_experimental.xml"))], str(self.destination), sidecar=True)
+            reports = merger.merge()
+            # Only the input is parsed
+            self.assertEqual(1, parse.call_count)
+        self.assertIsNone(merger.output_tree)
+        self.assertListEqual([], reports[0].added + reports[0].updated)
+        self.assertEqual(mtime, self.destination.stat().st_mtime_ns)
+
+    def test_merge_splice(self):
+        """ Test offsets of the sidecar are used to splice the destination. """
+        Sidecar.load(self.destination)
+        original = self.destination.read_bytes()
+        merger = Merger(
+            [str(Path("fixtures/pgmetadata_experimental.xml"))], str(self.destination), splice=True,
+            sidecar=True)
+        # Update an existing plugin as well, offsets of the next plugins are shifted
+        element = xml_backend.fromstring(original)[1]
+        element.attrib['version'] = '9.9.9'
+        merger.inputs.append(("update.xml", xml_backend.fromstring(
+            b'<plugins>' + xml_backend.tostring(element) + b'</plugins>')))
+        with mock.patch('qgis_plugin_repo.sidecar.scan_offsets') as scan_offsets:
+            merger.merge()
+            # The sidecar is updated from the offsets of the splice
+            scan_offsets.assert_not_called()
+        self.assertIsNotNone(merger.spliced)
+
+        content = self.destination.read_bytes()
+        end = Sidecar.read(self.destination).records[0].end
+        self.assertEqual(original[:end], content[:end])
+        sidecar = Sidecar.read(self.destination)
+        self.assertTrue(sidecar.is_fresh())
+        self.assertEqual(Sidecar.build(self.destination).records, sidecar.records)
+        self.assertEqual('9.9.9', sidecar.records[1].version)
+
+    def test_empty_catalog(self):
+        """ Test the sidecar of a catalog without any plugin, and a merge in it. """
+        self.destination.write_text('<plugins/>\n', encoding='utf8')
+        self.assertListEqual([], Sidecar.load(self.destination).plugins())
+
+        for splice in (True, False):
+            with self.subTest(splice=splice):
+                self.destination.write_text('<plugins/>\n', encoding='utf8')
+                Merger(
+                    [str(Path("fixtures/pgmetadata_experimental.xml"))], str(self.destination), splice=splice,
+                    sidecar=True).merge()
+                sidecar = Sidecar.read(self.destination)
+                self.assertTrue(sidecar.is_fresh())
+                self.assertListEqual([Plugin('PgMetadata', True, '0.7.0')], sidecar.plugins())
+                root = xml_backend.parse(self.destination).getroot()
+                self.assertListEqual(sidecar.plugins(), Merger.plugins(root))
+
+
+if __name__ == '__main__':
+    unittest.main()
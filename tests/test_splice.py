@@ -0,0 +1,115 @@
+import shutil
+import unittest
+
+from pathlib import Path
+
+from qgis_plugin_repo import xml_backend
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.splice import _find_offsets, _parse_offsets, scan_offsets
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestSplice(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        shutil.copy(Path("fixtures/plugins.xml"), Path("fixtures/plugins_tmp.xml"))
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        Path("fixtures/plugins_tmp.xml").unlink(missing_ok=True)
+        Path("splice_tmp.xml").unlink(missing_ok=True)
+
+    def test_offsets(self):
+        """ Test byte offsets of plugins. """
+        data = b'<plugins>\n  <a x=">"/><b>\n<c/></b>\n  <!-- comment --><d></d></plugins>'
+        ranges, root_start = scan_offsets(data)
+        self.assertEqual(b'<plugins>', data[:root_start])
+        self.assertListEqual(
+            [b'<a x=">"/>', b'<b>\n<c/></b>', b'<d></d>'],
+            [data[start:end] for start, end in ranges]
+        )
+
+    def test_offsets_without_parsing(self):
+        """ Test offsets found without parsing are the ones of expat, or the content is parsed. """
+        contents = [
+            b'<?xml version="1.0"?>\n<!-- <a> -->\n<plugins x="&gt;>">\n\t<a/>\n\t<a>t<c/></a >\n'
+            b'</plugins>\n',
+            b'<plugins></plugins>',
+            b'<plugins><a>x/></a><ab/></plugins>',
+            b'<plugins>\n<a x="/>"><d><![CDATA[</a> <a>]]></d><!-- </a> --><?pi </a>?></a>\n'
+            b'<b y=\'>\'/></plugins>',
+        ]
+        contents += [path.read_bytes() for path in sorted(Path("fixtures").glob("*.xml"))]
+        for data in contents:
+            self.assertEqual(_parse_offsets(data), _find_offsets(data), data)
+
+        # Nested elements having the same name, or a document type
+        for data in (b'<plugins><a><a/></a></plugins>', b'<!DOCTYPE plugins>\n<plugins><a/></plugins>'):
+            self.assertIsNone(_find_offsets(data))
+            self.assertEqual(_parse_offsets(data), scan_offsets(data))
+
+        # An empty root element, the offset is the one of "/>"
+        for data in (b'<plugins/>', b'<?xml version="1.0"?>\n<plugins />\n'):
+            ranges, root_start = scan_offsets(data)
+            self.assertListEqual([], ranges)
+            self.assertEqual(b'/>', data[root_start:root_start + 2])
+            self.assertEqual(_find_offsets(data), _parse_offsets(data))
+
+    def test_splice_merge(self):
+        """ Test untouched plugins are kept byte for byte. """
+        destination = Path("fixtures/plugins_tmp.xml")
+        original = destination.read_bytes()
+        merger = Merger(
+            [
+                str(Path("fixtures/pgmetadata_experimental.xml")),
+            ],
+            str(destination),
+            splice=True,
+        )
+        self.assertIsNotNone(merger.spliced)
+
+        # Update an existing plugin as well
+        element = xml_backend.fromstring(original)[1]
+        element.attrib['version'] = '3.4.0'
+        element.find('version').text = '3.4.0'
+        merger.inputs.append(("atlasprint.xml", xml_backend.fromstring(
+            b'<plugins>' + xml_backend.tostring(element) + b'</plugins>')))
+        merger.merge()
+
+        content = destination.read_bytes()
+        ranges, _ = scan_offsets(original)
+        new_ranges, _ = scan_offsets(content)
+        self.assertEqual(len(ranges) + 1, len(new_ranges))
+        # Before the updated plugin
+        self.assertEqual(original[:ranges[1][0]], content[:new_ranges[1][0]])
+        # Between the updated plugin and the new one
+        self.assertEqual(original[ranges[1][1]:ranges[-1][1]], content[new_ranges[1][1]:new_ranges[-2][1]])
+        self.assertEqual(original[ranges[-1][1]:], content[new_ranges[-1][1]:])
+        # Offsets are shifted after the write, the file is not scanned again
+        self.assertListEqual(new_ranges, merger.spliced.ranges)
+        self.assertEqual(len(content), merger.spliced.size)
+
+        reader = Merger(str(destination))
+        plugins = reader.plugins(reader.input_parser)
+        self.assertEqual(Plugin(name='atlasprint', experimental=False, version='3.4.0'), plugins[1])
+        self.assertEqual(Plugin(name='PgMetadata', experimental=True, version='0.7.0'), plugins[-1])
+
+        # A second merge with the same merger, from the shifted offsets
+        element.attrib['version'] = '3.5.0'
+        merger.merge([("atlasprint.xml", xml_backend.fromstring(
+            b'<plugins>' + xml_backend.tostring(element) + b'</plugins>'))])
+        self.assertListEqual(scan_offsets(destination.read_bytes())[0], merger.spliced.ranges)
+
+    def test_splice_empty_repo(self):
+        """ Test to splice in a new repository. """
+        merger = Merger(str(Path("fixtures/pgmetadata_experimental.xml")), "splice_tmp.xml", splice=True)
+        merger.merge()
+        merger = Merger("splice_tmp.xml")
+        self.assertListEqual(
+            [Plugin(name='PgMetadata', experimental=True, version='0.7.0')],
+            merger.plugins(merger.input_parser)
+        )
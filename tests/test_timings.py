@@ -0,0 +1,59 @@
+import json
+import shutil
+import unittest
+
+from pathlib import Path
+
+from qgis_plugin_repo import timings
+from qgis_plugin_repo.merger import Merger
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestTimings(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), Path("fixtures/plugins_timings_tmp.xml"))
+        timings.reset()
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        Path("fixtures/plugins_timings_tmp.xml").unlink(missing_ok=True)
+        Path("timings_tmp.json").unlink(missing_ok=True)
+        timings.reset()
+
+    def test_phases(self):
+        """ Test phases and counters are added. """
+        recorder = timings.Timings()
+        for _ in range(2):
+            with recorder.phase('parse'):
+                pass
+        recorder.count('fetched_bytes', 10)
+        recorder.update({'phases': {'parse': {'seconds': 1.0, 'count': 3}}, 'counters': {'fetched_bytes': 5}})
+
+        result = recorder.as_dict()
+        self.assertEqual(5, result['phases']['parse']['count'])
+        self.assertGreaterEqual(result['phases']['parse']['seconds'], 1.0)
+        self.assertEqual(15, result['counters']['fetched_bytes'])
+
+    def test_merge(self):
+        """ Test phases of a merge are recorded and written as JSON. """
+        Merger(
+            [str(Path("fixtures/pgmetadata_experimental.xml"))], "fixtures/plugins_timings_tmp.xml").merge()
+        timings.timings().write("timings_tmp.json")
+
+        result = json.loads(Path("timings_tmp.json").read_text(encoding='utf8'))
+        for phase in ('parse', 'index', 'diff', 'indent', 'serialize', 'write'):
+            self.assertIn(phase, result['phases'])
+        self.assertEqual(1, result['counters']['input_plugins'])
+        self.assertEqual(3, result['counters']['destination_plugins'])
+        self.assertEqual(1, result['counters']['updated'])
+        self.assertEqual(
+            Path("fixtures/plugins_timings_tmp.xml").stat().st_size, result['counters']['written_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
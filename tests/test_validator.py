@@ -0,0 +1,111 @@
+import contextlib
+import filecmp
+import io
+import shutil
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from qgis_plugin_repo.__main__ import main
+from qgis_plugin_repo.validator import Validator, validate_catalogs
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+INVALID = """<?xml version = '1.0' encoding = 'UTF-8'?>
+<plugins>
+    <pyqgis_plugin name="first" version="1.0.0">
+        <qgis_minimum_version>3.x</qgis_minimum_version>
+        <file_name>first.zip</file_name>
+    </pyqgis_plugin>
+    <pyqgis_plugin name="second">
+        <qgis_minimum_version>3.28</qgis_minimum_version>
+        <download_url>https://example.com/second.zip</download_url>
+        <file_name>second.zip</file_name>
+        <experimental>yes</experimental>
+    </pyqgis_plugin>
+    <pyqgis_plugin name="first" version="1.0 beta">
+        <qgis_minimum_version>3.28</qgis_minimum_version>
+        <download_url>https://example.com/first.zip</download_url>
+        <file_name>first.zip</file_name>
+    </pyqgis_plugin>
+</plugins>
+"""
+
+
+class TestValidator(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.invalid = Path("fixtures/plugins_invalid_tmp.xml")
+        self.invalid.write_text(INVALID, encoding='utf8')
+        self.destination = Path("fixtures/plugins_validate_tmp.xml")
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        self.invalid.unlink(missing_ok=True)
+        self.destination.unlink(missing_ok=True)
+
+    def test_valid(self):
+        """ Test fixtures are valid, validated concurrently. """
+        fixtures = sorted(str(path) for path in Path("fixtures").glob("plugins-*.xml"))
+        self.assertListEqual([], validate_catalogs(fixtures, workers=2))
+        self.assertListEqual([], Validator().validate(Path("fixtures/pgmetadata_experimental.xml")))
+
+    def test_invalid(self):
+        """ Test errors are reported with their line. """
+        errors = Validator().validate(self.invalid)
+        self.assertListEqual(
+            [
+                (3, 'first', 'missing element download_url'),
+                (3, 'first', 'invalid QGIS version 3.x in qgis_minimum_version'),
+                (7, 'second', 'missing attribute version'),
+                (7, 'second', 'invalid experimental flag yes'),
+                (13, 'first', 'invalid version 1.0 beta'),
+                (13, 'first', 'duplicated stable plugin, first defined on line 3'),
+            ],
+            [(error.line, error.name, error.problem) for error in errors])
+
+        # Not the same key, it is not a duplicate
+        content = INVALID.replace('yes', 'True').replace(
+            'version="1.0 beta">', 'version="1.1.0"><experimental>True</experimental>')
+        self.invalid.write_text(content, encoding='utf8')
+        self.assertListEqual(
+            ['missing element download_url', 'invalid QGIS version 3.x in qgis_minimum_version',
+             'missing attribute version'],
+            [error.problem for error in Validator().validate(self.invalid)])
+
+    def test_invalid_xml(self):
+        """ Test a truncated XML file is reported, with the plugins before. """
+        self.invalid.write_text(INVALID[:INVALID.index('<download_url>https://example.com/first')])
+        errors = Validator().validate(self.invalid)
+        self.assertEqual(5, len(errors))
+        self.assertEqual(15, errors[-1].line)
+        self.assertTrue(errors[-1].problem.startswith('invalid XML'))
+
+    def test_merge(self):
+        """ Test nothing is merged if an input is not valid. """
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+        argv = [
+            'qgis-plugin-repo', '--no-cache', 'merge', str(self.invalid), str(self.destination), '--validate']
+        with mock.patch('sys.argv', argv), self.assertRaises(SystemExit):
+            main()
+        self.assertTrue(filecmp.cmp(Path("fixtures/plugins-3.28.xml"), self.destination, shallow=False))
+
+        # Without validation, a plugin without its version is still not merged
+        argv.remove('--validate')
+        output = io.StringIO()
+        with mock.patch('sys.argv', argv), contextlib.redirect_stdout(output), self.assertRaises(SystemExit):
+            main()
+        self.assertIn(f"The plugin second in {self.invalid} has no attribute version.", output.getvalue())
+        self.assertTrue(filecmp.cmp(Path("fixtures/plugins-3.28.xml"), self.destination, shallow=False))
+
+        argv = ['qgis-plugin-repo', '--no-cache', 'validate', str(self.invalid), 'fixtures/plugins-3.28.xml']
+        with mock.patch('sys.argv', argv):
+            self.assertEqual(1, main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import shutil
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest import mock
+
+from qgis_plugin_repo.merger import Merger, Plugin
+from qgis_plugin_repo.server import MergeService
+from qgis_plugin_repo.watch import APPLIED, Watcher
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self) -> None:
+        """ Before each test. """
+        self.directory = Path("fixtures/watch_tmp")
+        self.directory.mkdir(exist_ok=True)
+        self.destination = Path("fixtures/plugins_watch_tmp.xml")
+        shutil.copy(Path("fixtures/plugins-3.28.xml"), self.destination)
+
+    def tearDown(self) -> None:
+        """ After each test. """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.destination.unlink(missing_ok=True)
+
+    def start(self, inotify: bool = True):
+        """ Start a watcher in a thread. """
+        service = MergeService([str(self.destination)], debounce=0.1)
+        watcher = Watcher(self.directory, service, poll_interval=0.05, inotify=inotify)
+        service.start()
+        thread = threading.Thread(target=watcher.run, daemon=True)
+        thread.start()
+        return service, watcher, thread
+
+    @staticmethod
+    def stop(service: MergeService, watcher: Watcher, thread: threading.Thread) -> None:
+        """ Stop the watcher and its service. """
+        watcher.stop()
+        thread.join()
+        service.close()
+
+    def drop(self, fixture: str) -> None:
+        """ Drop a file in the directory, as a complete file. """
+        tmp = self.directory / f'.{fixture}'
+        shutil.copy(Path("fixtures") / fixture, tmp)
+        tmp.rename(self.directory / fixture)
+
+    def wait_applied(self, watcher: Watcher, count: int) -> None:
+        """ Wait for files to be merged. """
+        for _ in range(100):
+            if len(watcher.applied) >= count:
+                return
+            time.sleep(0.05)
+        self.fail("The files have not been merged")
+
+    def watch(self, inotify: bool):
+        """ Test files dropped are merged once, even after a restart. """
+        service, watcher, thread = self.start(inotify)
+        self.drop("pgmetadata_experimental.xml")
+        self.drop("pgmetadata_stable.xml")
+        # Not a valid XML, it is skipped
+        self.directory.joinpath("partial.xml").write_text("<plugins><pyqgis")
+        self.wait_applied(watcher, 2)
+        self.stop(service, watcher, thread)
+
+        plugins = Merger.plugins(Merger.read_input(str(self.destination))[1])
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+        self.assertIn(Plugin('wfsOutputExtension', True, '1.7.1-alpha'), plugins)
+        self.assertEqual(2, len(json.loads(self.directory.joinpath(APPLIED).read_text())))
+
+        # After a restart, files already merged are not merged again
+        service = MergeService([str(self.destination)], debounce=0.1)
+        watcher = Watcher(self.directory, service, inotify=inotify)
+        self.assertListEqual([], watcher.scan())
+        service.close()
+        self.assertListEqual([], service.reports)
+
+    def test_merge_failed(self):
+        """ Test a file whose merge has failed is merged when it is dropped again. """
+        service, watcher, thread = self.start(inotify=False)
+        merge = service.merge
+        calls = []
+
+        def fail_once(output_uri, inputs):
+            calls.append(output_uri)
+            if len(calls) == 1:
+                raise OSError('disk full')
+            return merge(output_uri, inputs)
+
+        with mock.patch.object(service, 'merge', side_effect=fail_once):
+            self.drop("pgmetadata_experimental.xml")
+            for _ in range(100):
+                if calls and not watcher._pending:
+                    break
+                time.sleep(0.05)
+            self.assertDictEqual({}, watcher._pending)
+            self.assertSetEqual(set(), watcher.applied)
+
+            (self.directory / "pgmetadata_experimental.xml").unlink()
+            self.drop("pgmetadata_experimental.xml")
+            self.wait_applied(watcher, 1)
+        self.stop(service, watcher, thread)
+
+        self.assertEqual(2, len(calls))
+        plugins = Merger.plugins(Merger.read_input(str(self.destination))[1])
+        self.assertIn(Plugin('PgMetadata', True, '0.7.0'), plugins)
+
+    def test_inotify(self):
+        """ Test with inotify, or polling if it is not available. """
+        self.watch(True)
+
+    def test_polling(self):
+        """ Test with polling. """
+        self.watch(False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from qgis_plugin_repo import xml_backend
+
+__copyright__ = 'Copyright 2022, 3Liz'
+__license__ = 'GPL version 3'
+__email__ = 'info@3liz.org'
+
+
+class TestXmlBackend(unittest.TestCase):
+
+    def test_tostring(self):
+        """ Test the serialization is the same with both backends. """
+        root = xml_backend.fromstring(
+            b'<plugins><p a="x&gt;/&quot;"><icon/><t>a /&gt; b &amp; \xc3\xa9</t><e></e></p></plugins>')
+        expected = '<p a="x&gt;/&quot;"><icon /><t>a /&gt; b &amp; \xe9</t><e /></p>'
+        self.assertEqual(expected.encode('utf8'), xml_backend.tostring(root[0]))
+        self.assertEqual(expected, xml_backend.tostring(root[0], encoding='unicode'))
+
+    def test_replace_element(self):
+        """ Test to replace an element in place, with the current backend. """
+        root = xml_backend.fromstring(
+            b'<plugins>\n\t<!-- comment -->\n\t<a name="a"><b/></a>\n\t<c name="c"/>\n</plugins>')
+        self.assertListEqual(['a', 'c'], [element.tag for element in root])
+
+        previous = root[0]
+        new = xml_backend.fromstring(b'<a name="new" version="2"><d>text</d><e/></a>')
+        xml_backend.replace_element(previous, xml_backend.copy_element(new))
+
+        self.assertIs(previous, root[0])
+        self.assertEqual('\n\t', previous.tail)
+        self.assertDictEqual({'name': 'new', 'version': '2'}, dict(previous.attrib))
+        self.assertListEqual(['d', 'e'], [element.tag for element in previous])
+        self.assertTrue(xml_backend.tostring(previous).startswith(b'<a name="new" version="2"><d>text</d><e'))
+        self.assertTrue(xml_backend.tostring(previous).endswith(b'</a>'))
+        # The new element is not modified by the replacement of a copy
+        self.assertEqual(2, len(new))